@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+"""
+* Batch mode of equity_stats.py for many ledgers(accounts) on one pool of worker processes
+* the ledgers are a directory of transactions CSV files or a manifest listing them, one per line
+  optionally preceded by the account name and a comma(the file name is the account otherwise)
+* shared across the accounts
+    - the Jan 31, 2018 price index, built or mapped once before the workers are started
+    - one quote fetch per symbol held in any of the accounts, through one quote cache. With
+      --isin-map one per company, the NSE and BSE listings of a company share the quote
+* writes one report per account and a consolidated summary(summary.<ext>) with the portfolio
+  totals of each account and of all the accounts, in the output directory
+
+Usage:
+    python batch_stats.py ledgers/ --output-dir reports --jobs 8
+    python batch_stats.py manifest.txt --output-dir reports --format csv --offline
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+
+import csv23
+
+from transaction_utils import TransactionConstants, TransactionRecord, Decimal
+from stock_exchange_tools import Jan31State, MarketPricePrefetcher, PrefetchedQuotes, QuoteCache, use_exchange_url
+from equity_stats import Portfolio, load_portfolio
+from reports_summary import PortFolioSummary, REPORT_WRITERS, TextReportWriter, get_report_writer
+from isin_map import IsinMap, ListedQuotes, get_preference
+
+REPORT_EXTENSIONS = {'text': 'txt', 'csv': 'csv', 'jsonl': 'jsonl'}
+
+
+def get_accounts(ledgers):
+    """
+    list of (account, transactions file) of a directory or a manifest of ledgers
+    """
+    if os.path.isdir(ledgers):
+        file_names = sorted(name for name in os.listdir(ledgers) if name.lower().endswith('.csv'))
+        return [(os.path.splitext(name)[0], os.path.join(ledgers, name)) for name in file_names]
+    accounts = []
+    base_dir = os.path.dirname(os.path.abspath(ledgers))
+    with open(ledgers) as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+            if ',' in line:
+                account, file_name = [field.strip() for field in line.split(',', 1)]
+            else:
+                account, file_name = os.path.splitext(os.path.basename(line))[0], line
+            accounts.append((account, os.path.join(base_dir, file_name)))
+    names = [account for account, file_name in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError("duplicate account names in %s" % (ledgers,))
+    return accounts
+
+
+def get_held_symbols(file_name):
+    """
+    symbols with delivery shares left at the end of a ledger, found from the raw rows without
+    creating the transactions. As in Stock.has_holdings every buy but a square off one(e.g. a cash
+    mode buy) adds to the delivery lots and only the delivery sells take from them
+    """
+    rf_index = TransactionRecord._record_field_index
+    symbol_i, trade_i, shares_i, mode_i = [
+        rf_index[field] for field in
+        (TransactionConstants.SYMBOL_F, TransactionConstants.TRADE_F, TransactionConstants.SHARES_F, TransactionConstants.MODE_F)
+    ]
+    buy, sel, sqr, dlv = TransactionConstants.BUY, TransactionConstants.SEL, TransactionConstants.SQR, TransactionConstants.DEL
+    net_shares = {}
+    with csv23.open_reader(file_name) as transactions_file:
+        next(transactions_file)     # skip the header
+        for row in transactions_file:
+            symbol, trade, mode = row[symbol_i], row[trade_i], row[mode_i]
+            if symbol[0] == '#':
+                continue
+            if trade == buy and mode != sqr:
+                sign = 1
+            elif trade == sel and mode == dlv:
+                sign = -1
+            else:
+                continue
+            net_shares[symbol] = net_shares.get(symbol, 0) + sign * Decimal(row[shares_i])
+    return sorted(symbol for symbol, shares in net_shares.items() if shares > 0)
+
+
+def scan_account(file_name):
+    """
+    worker process: held symbols of a ledger, an unreadable ledger holds none here and its error
+    is reported when the account is processed
+    """
+    try:
+        return get_held_symbols(file_name)
+    except Exception:
+        return []
+
+
+def fetch_quotes(symbols, prefetcher):
+    """
+    quotes of the symbols of all the accounts, fetched once each. A symbol without a quote is
+    reported by the prefetcher, its holdings are left out of the accounts holding it
+    """
+    for symbol in symbols:
+        prefetcher.prefetch(symbol)
+    quotes = {}
+    try:
+        for symbol in symbols:
+            quotes[symbol] = prefetcher.get_quote(symbol)
+    finally:
+        prefetcher.close()
+    return quotes
+
+
+def process_account(task):
+    """
+    worker process: realize and value one account with the quotes fetched by the parent and write
+    its report. Returns the portfolio totals(None if there is no realized or holding table) or the error
+    """
+    account, file_name, report_file, report_format, quotes, stream = task
+    try:
+        pf = Portfolio(PrefetchedQuotes(quotes))
+        load_portfolio(pf, file_name, stream)
+        pf.process_stocks()
+        pfs = PortFolioSummary(pf)
+        writer = get_report_writer(report_format, report_file)
+        try:
+            pfs.print_summary(writer)
+        finally:
+            writer.close()
+    except Exception as e:
+        return account, None, None, '%s: %s' % (e.__class__.__name__, e)
+    r_totals = pfs.r_totals if pfs.r_status else None
+    h_totals = pfs.h_totals if pfs.h_status else None
+    return account, r_totals, h_totals, None
+
+
+class BatchSummary(PortFolioSummary):
+    """
+    consolidated summary of a batch - one row of the portfolio totals of each account and the
+    totals of all the accounts
+    """
+
+    def __init__(self, results):
+        super(BatchSummary, self).__init__(None)
+        self.results = results
+        self.r_details_title = "Batch Realized Summary"
+        self.h_details_title = "Batch Holding Summary"
+        self.r_details_header = self.h_details_header = [self.name_field] + list(self.sum_fields + self.percent_fields)
+
+    def write_totals(self, writer, kind, title, header, account_totals, totals):
+        if not account_totals:
+            return
+        table = writer.open_table(kind, title, header)
+        for account, acc_totals in account_totals:
+            table.append([account] + self.get_totals_row(header[1:], acc_totals))
+            totals.add(acc_totals)
+        self.add_final_row(header, table, totals)
+
+    def print_summary(self, writer=None):
+        if writer is None:
+            writer = TextReportWriter()
+        realized = [(account, r_totals) for account, r_totals, h_totals, error in self.results if r_totals is not None]
+        holding = [(account, h_totals) for account, r_totals, h_totals, error in self.results if h_totals is not None]
+        self.r_status, self.h_status = bool(realized), bool(holding)
+        self.write_totals(writer, 'batch_realized', self.r_details_title, self.r_details_header, realized, self.r_totals)
+        self.write_totals(writer, 'batch_holding', self.h_details_title, self.h_details_header, holding, self.h_totals)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Indian equity portfolio summarizer for many ledgers')
+    parser.add_argument('ledgers', help='directory of transactions CSV files or a manifest listing them')
+    parser.add_argument('--output-dir', default='reports', help='directory of the reports (default: %(default)s)')
+    parser.add_argument('--format', choices=sorted(REPORT_WRITERS), default='text',
+                        help='report as texttable tables(text) or as machine readable rows(csv, jsonl)')
+    parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--stream', action='store_true',
+                        help='realize each sell as it is read and keep only the realized totals per stock')
+    parser.add_argument('--offline', action='store_true',
+                        help='value holdings only from the quote cache, no network requests')
+    parser.add_argument('--cache-file', default=QuoteCache.DEFAULT_FILENAME,
+                        help='market price quote cache file (default: %(default)s)')
+    parser.add_argument('--cache-ttl', type=int, default=QuoteCache.DEFAULT_TTL,
+                        help='seconds for which a cached quote is used without refetching (default: %(default)s)')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='wait at most SECONDS for the quotes, a quote still missing or failed is valued at its '
+                             'last known price in the quote cache')
+    parser.add_argument('--isin-map', metavar='FILE',
+                        help='ISIN map of the NSE and BSE listings(isin_map.py), one quote is fetched per company')
+    parser.add_argument('--prefer-exchange', choices=IsinMap.EXCHANGES, default=IsinMap.EXCHANGES[0],
+                        help='exchange of the listing quoted for a company listed on both (default: %(default)s)')
+    parser.add_argument('--exchange-url',
+                        help='fetch quotes from this server instead of NSE/BSE, e.g. exchange_standin.py')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.exchange_url:
+        use_exchange_url(args.exchange_url)
+    accounts = get_accounts(args.ledgers)
+    if os.path.isdir(args.output_dir) == False:
+        os.makedirs(args.output_dir)
+    extension = REPORT_EXTENSIONS[args.format]
+    Jan31State.get_price_index().open()     # mapped before the workers fork, shared by them
+    pool = multiprocessing.Pool(args.jobs)
+    try:
+        held_symbols = pool.map(scan_account, [file_name for account, file_name in accounts])
+        prefetcher = MarketPricePrefetcher(
+            quote_cache=QuoteCache(args.cache_file, args.cache_ttl), offline=args.offline, deadline=args.deadline
+        )
+        if args.isin_map:
+            prefetcher = ListedQuotes(prefetcher, IsinMap.load(args.isin_map), get_preference(args.prefer_exchange))
+        quotes = fetch_quotes(sorted(set(symbol for symbols in held_symbols for symbol in symbols)), prefetcher)
+        tasks = [
+            (account, file_name, os.path.join(args.output_dir, '%s.%s' % (account, extension)), args.format,
+             {symbol: quotes[symbol] for symbol in symbols if symbol in quotes}, args.stream)
+            for (account, file_name), symbols in zip(accounts, held_symbols)
+        ]
+        results = pool.map(process_account, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    errors = [(account, error) for account, r_totals, h_totals, error in results if error is not None]
+    for account, error in errors:
+        sys.stderr.write("%s: %s\n" % (account, error))
+    writer = get_report_writer(args.format, os.path.join(args.output_dir, 'summary.%s' % (extension,)))
+    try:
+        BatchSummary(results).print_summary(writer)
+    finally:
+        writer.close()
+    if errors:
+        sys.exit(1)
+
+
+if '__main__' == __name__:
+    main()
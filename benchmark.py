@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""
+* Benchmarks of ingestion, realization and reporting over synthetic transactions files of growing
+  size(portfolio_generator.py), the phases are timed separately
+    parse       - reading the rows and TransactionRecord.create_obj_from_row
+    ingest      - parse and Portfolio.process_transaction(the stock queues)
+    realize     - Stock.realize_whole of all the stocks
+    holding     - Stock.holding_whole of all the stocks
+    calculate   - CapitalGain.calculate of all the realized and holding capital gains, or one batch
+                  of the NumPy engine(--engine numpy)
+    stock       - StockSummary.build_tables of all the stocks, with the NumPy engine this includes
+                  setting the Decimal attributes of each capital gain from the columns of the batch
+    portfolio   - PortFolioSummary.print_summary, renders the stock and portfolio tables(--format)
+* quotes are stubbed with the Jan 31, 2018 price, there are no network requests
+* the results are appended as JSON lines to the results file with the git commit, so that
+  --compare can show the timings of the commits side by side
+* each run also records the best time to import equity_stats in a fresh interpreter(import)
+* --import-time checks the startup cost - the best time to import equity_stats in a fresh
+  interpreter must be within --import-budget and none of LAZY_MODULES(the network stack,
+  texttable, dateutil, NumPy) may be imported with it. Exits with status 1 otherwise
+
+Usage:
+    python benchmark.py --sizes 1000,10000,100000
+    python benchmark.py --sizes 1000000 --format csv
+    python benchmark.py --sizes 100000 --engine numpy
+    python benchmark.py --compare
+    python benchmark.py --import-time --import-budget 0.15
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import csv23
+
+from transaction_utils import TransactionRecord
+from stock_exchange_tools import Jan31State, Quote
+from equity_stats import Portfolio
+from reports_summary import PortFolioSummary, REPORT_WRITERS, get_report_writer
+import portfolio_generator
+import columnar_gains
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class StubPrefetcher(object):
+    """
+    quotes at the Jan 31, 2018 price in place of MarketPricePrefetcher
+    """
+
+    def prefetch(self, stock_ticker):
+        pass
+
+    def get_quote(self, stock_ticker):
+        return Quote(Jan31State.get_price(stock_ticker), 0, False)
+
+    def close(self):
+        pass
+
+
+class Benchmark(object):
+    PHASES = ('parse', 'ingest', 'realize', 'holding', 'calculate', 'stock', 'portfolio')
+
+    def __init__(self, file_name, report_format='text', gain_engine=None):
+        self.file_name = file_name
+        self.report_format = report_format
+        self.gain_engine = gain_engine
+        self.timings = {}
+
+    def read_transactions(self):
+        with csv23.open_reader(self.file_name) as transactions_file:
+            next(transactions_file)     # skip the header
+            for transaction in map(TransactionRecord.create_obj_from_row, transactions_file):
+                yield transaction
+
+    def timed(self, phase, func, *args):
+        start = timer()
+        result = func(*args)
+        self.timings[phase] = timer() - start
+        return result
+
+    def parse(self):
+        count = 0
+        for transaction in self.read_transactions():
+            count += 1
+        return count
+
+    def ingest(self):
+        pf = Portfolio(StubPrefetcher())
+        for transaction in self.read_transactions():
+            pf.process_transaction(transaction)
+        return pf
+
+    def realize(self, stock_list):
+        for stock_obj in stock_list:
+            stock_obj.realize_whole()
+
+    def holding(self, stock_list, quote_fetcher):
+        for stock_obj in stock_list:
+            stock_obj.holding_whole(quote_fetcher)
+
+    def calculate(self, stock_list):
+        if self.gain_engine is not None:
+            self.gain_engine.calculate([
+                cg_obj for stock_obj in stock_list
+                for cg_obj_list in (stock_obj.realized_list, stock_obj.holding_list)
+                for cg_obj in cg_obj_list
+            ])
+            return
+        for stock_obj in stock_list:
+            for cg_obj_list in (stock_obj.realized_list, stock_obj.holding_list):
+                for cg_obj in cg_obj_list:
+                    cg_obj.calculate()
+
+    def stock(self, stock_list):
+        for stock_obj in stock_list:
+            stock_obj.stock_summary.build_tables()
+
+    def portfolio(self, pf):
+        writer = get_report_writer(self.report_format, os.devnull)
+        try:
+            PortFolioSummary(pf).print_summary(writer)
+        finally:
+            writer.close()
+
+    def run(self):
+        rows = self.timed('parse', self.parse)
+        pf = self.timed('ingest', self.ingest)
+        stock_list = list(pf.stock_hash.values())
+        self.timed('realize', self.realize, stock_list)
+        self.timed('holding', self.holding, stock_list, pf.prefetcher.get_quote)
+        self.timed('calculate', self.calculate, stock_list)
+        self.timed('stock', self.stock, stock_list)
+        self.timed('portfolio', self.portfolio, pf)
+        return rows
+
+
+def get_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT)
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'])
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.decode().strip() + ('+' if dirty else '')
+
+
+def get_ledger(size, symbols, data_dir, seed):
+    """
+    generated transactions file of about size rows, reused across runs with the same parameters
+    """
+    symbols = symbols or min(max(size // 200, 10), 2000)
+    file_name = os.path.join(data_dir, 'ledger_%d_%d_%d.csv' % (size, symbols, seed))
+    if os.path.exists(file_name) == False:
+        buys = portfolio_generator.rows_to_buys(size)
+        portfolio_generator.generate(file_name + '.tmp', symbols=symbols, buys_per_symbol=max(buys // symbols, 1), seed=seed)
+        os.rename(file_name + '.tmp', file_name)
+    return file_name
+
+
+def print_results(results):
+    header = ['commit', 'format', 'engine', 'size', 'rows'] + list(Benchmark.PHASES) + ['import']
+    print(' '.join('%10s' % (field,) for field in header))
+    for result in results:
+        row = [result['commit'], result['format'], result.get('engine', 'decimal'), result['size'], result['rows']]
+        row += ['%.3f' % result['timings'][phase] for phase in Benchmark.PHASES]
+        row.append('-' if result.get('import') is None else '%.3f' % result['import'])
+        print(' '.join('%10s' % (field,) for field in row))
+
+
+def compare_results(results_file):
+    """
+    latest result of each commit and size, ordered by size and then by time
+    """
+    latest = {}
+    with open(results_file) as fp:
+        for line in fp:
+            result = json.loads(line)
+            latest[(result['size'], result['format'], result.get('engine', 'decimal'), result['commit'])] = result
+    print_results(sorted(latest.values(), key=lambda result: (
+        result['size'], result['format'], result.get('engine', 'decimal'), result['time'])))
+
+
+LAZY_MODULES = ('requests', 'texttable', 'dateutil', 'numpy', 'multiprocessing.pool')
+IMPORT_SCRIPT = '''
+import sys, json, time
+start = time.time()
+import equity_stats
+print(json.dumps([time.time() - start, [name for name in %r if name in sys.modules]]))
+''' % (LAZY_MODULES,)
+
+
+IMPORT_BUDGET = 0.15   # seconds
+
+
+def measure_import_time(runs=5):
+    """
+    best import time of equity_stats over fresh interpreters and the lazy modules it pulled in
+    """
+    best, loaded = None, []
+    for run in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)))
+        seconds, loaded = json.loads(output.decode())
+        best = seconds if best is None else min(best, seconds)
+    return best, loaded
+
+
+def check_import_time(budget=IMPORT_BUDGET, runs=5):
+    best, loaded = measure_import_time(runs)
+    print("import equity_stats: %.3f seconds(budget %.3f), lazy modules imported: %s" % (best, budget, loaded or 'none'))
+    return best <= budget and not loaded
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='equity_stats benchmarks over synthetic transactions files')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma separated approximate row counts, up to 10000000 (default: %(default)s)')
+    parser.add_argument('--symbols', type=int, help='number of stocks (default: size/200 within 10 to 2000)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--format', choices=sorted(REPORT_WRITERS), default='text', help='report format to time')
+    parser.add_argument('--engine', choices=('decimal', 'numpy'), default='decimal', help='gain engine to time')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'equity_stats_benchmark'),
+                        help='directory of the generated transactions files (default: %(default)s)')
+    parser.add_argument('--results', default='benchmark_results.jsonl',
+                        help='results file the timings are appended to (default: %(default)s)')
+    parser.add_argument('--compare', action='store_true', help='show the stored results instead of running')
+    parser.add_argument('--import-time', action='store_true',
+                        help='check the import time of equity_stats against --import-budget instead of running')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='seconds allowed for importing equity_stats (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if args.engine == 'numpy' and columnar_gains.is_available() == False:
+        parser.error('--engine numpy needs NumPy to be installed')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        compare_results(args.results)
+        return
+    if args.import_time:
+        if check_import_time(args.import_budget) == False:
+            sys.exit(1)
+        return
+    gain_engine = columnar_gains.ColumnarGainEngine() if args.engine == 'numpy' else None
+    if os.path.isdir(args.data_dir) == False:
+        os.makedirs(args.data_dir)
+    commit = get_commit()
+    import_seconds, loaded = measure_import_time()
+    results = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        benchmark = Benchmark(get_ledger(size, args.symbols, args.data_dir, args.seed), args.format, gain_engine)
+        rows = benchmark.run()
+        result = {
+            'commit': commit, 'time': int(time.time()), 'python': platform.python_version(),
+            'format': args.format, 'engine': args.engine, 'size': size, 'rows': rows, 'timings': benchmark.timings,
+            'import': import_seconds,
+        }
+        with open(args.results, 'a') as fp:
+            fp.write(json.dumps(result, sort_keys=True) + '\n')
+        results.append(result)
+    print_results(results)
+
+
+if '__main__' == __name__:
+    main()
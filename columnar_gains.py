@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+"""
+* Columnar(NumPy) engine to calculate the capital gains of many matched lot pairs at once
+* gives the same results as CapitalGain.calculate, to the paisa, for the whole realized_list and
+  holding_list of a portfolio. The Decimal amounts are converted to scaled int64 fixed point arrays
+  (x 1000 for amounts and prices with 3 decimals, x 10000 where CapitalGain uses Precision.four)
+  and ROUND_HALF_UP is done with integer arithmetic, so there is no floating point anywhere
+* the results stay in columns(GainResults) after the batch, a capital gain object gets its Decimal
+  attributes only when it is used(CapitalGain.calculate, e.g. for its row of a details table)
+* NumPy is optional, is_available() tells whether the engine can be used. It is imported on the
+  first use of the engine, not with this module. Pairs that can not be represented exactly in
+  fixed point are calculated with CapitalGain.calculate
+"""
+
+from datetime import date
+from decimal import Decimal
+from operator import attrgetter
+from itertools import count, repeat
+
+numpy = None
+
+from stock_exchange_tools import Precision, Jan31State
+from transaction_utils import TransactionConstants
+
+
+SCALE_3     = 1000
+SCALE_4     = 10000
+INT64_SAFE  = 1 << 62
+FLOAT_SAFE  = 1 << 50
+EXACT_TOLERANCE = 1e-3
+NEGATIVE_ZERO_3 = Decimal('-0.000')
+
+
+def load_numpy():
+    """
+    import NumPy into the module namespace, returns False if it is not installed
+    """
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+    return True
+
+
+def is_available():
+    return load_numpy()
+
+
+def to_scaled_int(dec_x, scale_exp):
+    """
+    dec_x * 10**scale_exp as int, None if it is not an integer
+    """
+    scaled = dec_x.scaleb(scale_exp)
+    int_x = int(scaled)
+    if int_x != scaled:
+        return None
+    return int_x
+
+
+def to_scaled_array(t_list, field, scale):
+    """
+    Decimal field(already quantized to 3 decimals by TransactionRecord/Precision) of the transactions
+    as an int64 array scaled by scale. The conversion goes through float which is exact for these
+    magnitudes, also returns the mask of the values which are not integers after scaling
+    """
+    float_iter = map(float, map(attrgetter(field), t_list))
+    float_array = numpy.fromiter(float_iter, dtype=numpy.float64, count=len(t_list)) * scale
+    int_array = numpy.rint(float_array)
+    return int_array.astype(numpy.int64), numpy.abs(float_array - int_array) > EXACT_TOLERANCE
+
+
+def round_half_up(x, divisor):
+    """
+    x/divisor rounded half away from zero(ROUND_HALF_UP of Decimal), divisor is a positive power of ten
+    also returns the mask of the results that Decimal would give as negative zero
+    """
+    quotient = numpy.sign(x) * ((numpy.abs(x) + divisor // 2) // divisor)
+    return quotient, (quotient == 0) & (x < 0)
+
+
+def percent_half_up(num, den):
+    """
+    Precision.percent on scaled ints - (num * 100)/den with 3 decimals, both num and den scaled by 1000
+    the quotient is built one step at a time so that the intermediate products fit in int64
+    """
+    abs_num = numpy.abs(num) * 100
+    quot_1, rem_1 = numpy.divmod(abs_num, den)
+    quot_2, rem_2 = numpy.divmod(rem_1 * SCALE_3, den)
+    quotient = quot_1 * SCALE_3 + quot_2 + (2 * rem_2 >= den)
+    quotient = numpy.where(num < 0, -quotient, quotient)
+    return quotient, (quotient == 0) & (num < 0)
+
+
+class GainColumns(object):
+    """
+    columns of the buy and sell transactions of the capital gain objects which can be calculated in
+    fixed point. The rest are left in fallback_list
+    """
+    def __init__(self, cg_obj_list):
+        buy_list = list(map(attrgetter('buy_t'), cg_obj_list))
+        sel_list = list(map(attrgetter('sel_t'), cg_obj_list))
+        self.b_shares, self.b_price, self.b_charges, self.b_date, b_odd = self.get_columns(buy_list)
+        self.s_shares, self.s_price, self.s_charges, self.s_date, s_odd = self.get_columns(sel_list)
+        is_fallback = b_odd | s_odd | (self.b_shares <= 0) | (self.b_price <= 0)
+        if len(cg_obj_list) > 0 and self.is_out_of_range():
+            is_fallback[:] = True
+        self.cg_obj_list = cg_obj_list
+        self.fallback_list = []
+        if is_fallback.any():
+            self.fallback_list = [cg_obj for cg_obj, odd in zip(cg_obj_list, is_fallback.tolist()) if odd]
+            self.select(~is_fallback)
+
+    @staticmethod
+    def get_columns(t_list):
+        """
+        shares, price(x 1000), total charges(x 1000), date ordinal columns of the transactions and
+        the mask of the transactions that are not exact in fixed point
+        """
+        shares, shares_odd = to_scaled_array(t_list, TransactionConstants.SHARES_F, 1)
+        price, price_odd = to_scaled_array(t_list, TransactionConstants.PRICE_F, SCALE_3)
+        charges, charges_odd = 0, shares_odd | price_odd
+        for field in TransactionConstants.CHARGES_F_LIST:
+            charge, charge_odd = to_scaled_array(t_list, field, SCALE_3)
+            charges, charges_odd = charges + charge, charges_odd | charge_odd
+        dates = numpy.fromiter(map(date.toordinal, map(attrgetter('date'), t_list)), dtype=numpy.int64, count=len(t_list))
+        return shares, price, charges, dates, charges_odd
+
+    def select(self, mask):
+        self.cg_obj_list = [cg_obj for cg_obj, keep in zip(self.cg_obj_list, mask.tolist()) if keep]
+        for name in ('b_shares', 'b_price', 'b_charges', 'b_date', 's_shares', 's_price', 's_charges', 's_date'):
+            setattr(self, name, getattr(self, name)[mask])
+
+    def is_out_of_range(self):
+        """
+        the largest intermediate product is shares * price * 10000(tax values with a Jan 31 price)
+        and net gain * 100 * 1000 in percent_half_up. Values are converted through float, so they
+        also have to stay well within the 53 bits of a float
+        """
+        max_shares = max(int(numpy.abs(self.b_shares).max()), int(numpy.abs(self.s_shares).max()), 1)
+        max_price = max(int(numpy.abs(self.b_price).max()), int(numpy.abs(self.s_price).max()), 1)
+        max_charges = max(int(numpy.abs(self.b_charges).max()), int(numpy.abs(self.s_charges).max()), 1)
+        if max(max_shares, max_price, max_charges) >= FLOAT_SAFE:
+            return True
+        return max_shares * max_price * 10 * SCALE_3 * 100 >= INT64_SAFE
+
+
+class GainResults(TransactionConstants):
+    """
+    * results of a batch as columns(lists) of scaled ints, one row per capital gain object
+    * set_gains converts the row of an object to the Decimal attributes CapitalGain.calculate would
+      set. An int times UNIT_3(or UNIT_4) is exact and has the exponent Precision.three(or four)
+      would have given, and is much cheaper than Decimal(x).scaleb(-3)
+    """
+    UNIT_3 = Decimal('0.001')
+    UNIT_4 = Decimal('0.0001')
+    COLUMNS = (
+        'buy_value', 'sel_value', 'unit_pgain', 'gross_gain', 'buy_charges', 'sel_charges', 'net_charges',
+        'net_gain', 'gain_perc', 'tax_buy_value', 'tax_unit_pgain', 'tax_net_gain', 'is_long', 'is_taxable',
+        'is_grandfathered', 'choice'
+    )
+
+    def __init__(self, results):
+        for name in self.COLUMNS:
+            setattr(self, name, results[name].tolist())
+        self.perc_negative_zero = set(numpy.flatnonzero(results['perc_negative_zero']).tolist())
+        self.tax_negative_zero = set(numpy.flatnonzero(results['tax_negative_zero']).tolist())
+
+    def set_gains(self, cg_obj, index):
+        unit_3 = self.UNIT_3
+        cg_obj.buy_value = unit_3 * self.buy_value[index]
+        cg_obj.sel_value = unit_3 * self.sel_value[index]
+        cg_obj.unit_pgain = self.UNIT_4 * self.unit_pgain[index]
+        cg_obj.gross_gain = unit_3 * self.gross_gain[index]
+        cg_obj.buy_charges = unit_3 * self.buy_charges[index]
+        cg_obj.sel_charges = unit_3 * self.sel_charges[index]
+        cg_obj.net_charges = unit_3 * self.net_charges[index]
+        cg_obj.net_gain = unit_3 * self.net_gain[index]
+        cg_obj.gain_perc = NEGATIVE_ZERO_3 if index in self.perc_negative_zero else unit_3 * self.gain_perc[index]
+        cg_obj.tax_buy_value = unit_3 * self.tax_buy_value[index]
+        cg_obj.tax_unit_pgain = self.UNIT_4 * self.tax_unit_pgain[index]
+        cg_obj.tax_net_gain = NEGATIVE_ZERO_3 if index in self.tax_negative_zero else unit_3 * self.tax_net_gain[index]
+        decimal_zero = Precision.DECIMAL_ZERO
+        cg_obj.jan31_price = decimal_zero
+        if self.is_grandfathered[index]:
+            cg_obj.jan31_price = Jan31State.get_price(cg_obj.buy_t.symbol)
+        cg_obj.tax_buy_price = (cg_obj.buy_t.price, cg_obj.jan31_price, cg_obj.sel_t.price)[self.choice[index]]
+        cg_obj.short_gain = cg_obj.long_gain = cg_obj.tax_long_gain = decimal_zero
+        if self.is_long[index]:
+            cg_obj.gain_type = self.LONG_TERM
+            cg_obj.long_gain = cg_obj.net_gain
+            if self.is_taxable[index]:
+                cg_obj.tax_long_gain = cg_obj.tax_net_gain
+        else:
+            cg_obj.gain_type = self.SHORT_TERM
+            cg_obj.short_gain = cg_obj.net_gain
+        cg_obj.is_calculated = True
+
+
+class ColumnarGainEngine(TransactionConstants):
+    """
+    vectorized equivalent of CapitalGain.calculate for a list of capital gain objects
+    each object is only pointed to its row of the results(CapitalGain.gain_row), the Decimal
+    attributes are set from it on the first CapitalGain.calculate
+    """
+    APR01_ORDINAL = TransactionConstants.APR01_2018.toordinal()
+    JAN31_ORDINAL = TransactionConstants.JAN31_2018.toordinal()
+    CHOICE_BUY_PRICE, CHOICE_JAN31_PRICE, CHOICE_SEL_PRICE = range(3)
+
+    def calculate(self, cg_obj_list):
+        load_numpy()
+        gc = GainColumns(cg_obj_list)
+        for cg_obj in gc.fallback_list:
+            cg_obj.calculate()
+        if len(gc.cg_obj_list) == 0:
+            return
+        assert (gc.s_date >= gc.b_date).all()      # as CapitalGain.set_gain_type
+        results = self.actual_gains(gc)
+        results.update(self.tax_gains(gc, results))
+        gain_results = GainResults(results)
+        for cg_obj, gain_row in zip(gc.cg_obj_list, zip(repeat(gain_results), count())):
+            cg_obj.gain_row = gain_row
+
+    def actual_gains(self, gc):
+        buy_value = gc.b_shares * gc.b_price
+        sel_value = gc.s_shares * gc.s_price
+        unit_pgain = gc.s_price - gc.b_price
+        gross_gain = gc.s_shares * unit_pgain
+        net_charges = gc.b_charges + gc.s_charges
+        net_gain = gross_gain - net_charges
+        gain_perc, perc_negative_zero = percent_half_up(net_gain, buy_value)
+        is_long = (gc.s_date - gc.b_date) > self.TERM_DAYS_DIFF
+        return {
+            'buy_value': buy_value, 'sel_value': sel_value, 'unit_pgain': unit_pgain * 10,
+            'gross_gain': gross_gain, 'buy_charges': gc.b_charges, 'sel_charges': gc.s_charges,
+            'net_charges': net_charges, 'net_gain': net_gain, 'gain_perc': gain_perc,
+            'perc_negative_zero': perc_negative_zero, 'is_long': is_long,
+        }
+
+    def get_jan31_prices(self, gc, is_grandfathered):
+        """
+        Jan 31, 2018 prices(scaled by 10000) of the grandfathered pairs, looked up once per symbol
+        """
+        jan31_price = numpy.zeros(len(gc.cg_obj_list), dtype=numpy.int64)
+        jan31_decimals = {}
+        for index in numpy.flatnonzero(is_grandfathered).tolist():
+            symbol = gc.cg_obj_list[index].buy_t.symbol
+            if symbol not in jan31_decimals:
+                jan31_decimals[symbol] = Jan31State.get_price(symbol)
+            jan31_price[index] = to_scaled_int(jan31_decimals[symbol], 4)
+        return jan31_price
+
+    def tax_gains(self, gc, results):
+        is_long = results['is_long']
+        is_taxable = is_long & (gc.s_date >= self.APR01_ORDINAL)
+        is_grandfathered = is_taxable & (gc.b_date <= self.JAN31_ORDINAL)
+        jan31_price = self.get_jan31_prices(gc, is_grandfathered)
+        b_price, s_price = gc.b_price * 10, gc.s_price * 10
+        higher_jan31 = is_grandfathered & (jan31_price > b_price)
+        choice = numpy.full(len(gc.cg_obj_list), self.CHOICE_BUY_PRICE, dtype=numpy.int8)
+        choice[higher_jan31 & (s_price >= b_price)] = self.CHOICE_SEL_PRICE
+        choice[higher_jan31 & (s_price >= jan31_price)] = self.CHOICE_JAN31_PRICE
+        tax_buy_price = numpy.choose(choice, (b_price, jan31_price, s_price))
+        tax_buy_value, _ = round_half_up(gc.b_shares * tax_buy_price, 10)
+        tax_unit_pgain = s_price - tax_buy_price
+        tax_gross_gain, gross_negative_zero = round_half_up(gc.s_shares * tax_unit_pgain, 10)
+        tax_net_gain = tax_gross_gain - results['net_charges']
+        return {
+            'is_taxable': is_taxable, 'is_grandfathered': is_grandfathered, 'choice': choice,
+            'tax_buy_value': tax_buy_value, 'tax_unit_pgain': tax_unit_pgain, 'tax_net_gain': tax_net_gain,
+            'tax_negative_zero': gross_negative_zero & (results['net_charges'] == 0),
+        }
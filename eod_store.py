@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+
+"""
+* Local store of end of day(bhavcopy) last traded prices indexed by (symbol, date), an offline source
+  of the market prices and of the Jan 31, 2018 grandfathering prices
+* the daily files are named NSE_YYYYMMDD.csv, BSE_YYYYMMDD.csv and have the layout of the files
+  in lib/, read with the Jan31State columns - the price is the LAST(last traded price) column, not
+  CLOSE, as for the Jan 31, 2018 prices
+* ingest merges the files into the store, a day ingested again replaces the earlier prices
+* the store is one memory mapped file of columns(see EodPriceStore), a lookup is a binary search
+  over the symbols and then over the dates of the symbol, O(log n) without parsing anything
+* use_eod_store registers the store as the price provider of both the exchanges(latest price)
+  and as the source of the Jan 31, 2018 prices, so a portfolio is valued with no scraping at all
+
+Usage:
+    python eod_store.py ingest bhavcopy/ lib/NSE_20180131.csv lib/BSE_20180131.csv
+    python eod_store.py price NSE:VBL --date 2018-01-31
+    python equity_stats.py sample_portfolio.csv --eod-store lib/eod_prices.bin
+"""
+
+import os
+import re
+import io
+import csv
+import sys
+import mmap
+import struct
+import datetime
+import argparse
+import tempfile
+from array import array
+
+from stock_exchange_tools import Jan31State, PriceProvider, Precision, Decimal, register_price_provider
+
+try:
+    array('q')
+    PRICE_TYPECODE = 'q'
+except ValueError:
+    PRICE_TYPECODE = 'l'    # 64 bit on the platforms without 'q'
+
+
+class EodPriceFiles(object):
+    """
+    * end of day files of a directory, one per exchange and trading day
+    * get_prices reads the files of a day and keeps only the symbols asked for
+    """
+    FILENAME_RE = re.compile(r'^(NSE|BSE)_(\d{8})\.csv$')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.day_files = {}
+        for name in os.listdir(directory):
+            date = self.get_file_date(name)
+            if date is not None:
+                self.day_files.setdefault(date, []).append(os.path.join(directory, name))
+
+    @classmethod
+    def get_file_date(cls, filename):
+        match = cls.FILENAME_RE.match(os.path.basename(filename))
+        if match is None:
+            return None
+        return datetime.datetime.strptime(match.group(2), '%Y%m%d').date()
+
+    def trading_days(self, start=None, end=None):
+        return [
+            date for date in sorted(self.day_files)
+            if (start is None or date >= start) and (end is None or date <= end)
+        ]
+
+    def get_prices(self, date, symbols):
+        """
+        the rows are matched on the symbol before the first comma, only those rows are parsed
+        """
+        prices = {}
+        for filename in sorted(self.day_files.get(date, ())):
+            with io.open(filename, encoding='utf-8-sig') as fp:
+                next(fp)
+                for line in fp:
+                    if line.split(',', 1)[0] not in symbols:
+                        continue
+                    symbol, price = Jan31State.get_symbol_price(next(csv.reader([line])))
+                    prices[symbol] = Precision.three(Decimal(price))
+        return prices
+
+
+class EodPriceStore(object):
+    """
+    * file layout: header(magic, symbol count, key width, day count, price count), then the columns
+        - symbols   fixed width records of the symbol(space padded, sorted), the index of its first
+                    price and its price count(uint32 each)
+        - days      the trading days(date ordinals, int32, sorted)
+        - dates     date ordinal of each price(int32), sorted within each symbol
+        - prices    last traded price scaled by 10000(int64), in the order of the dates
+    * the file is written atomically(temporary file + rename) and mapped read only
+    * only the prices looked up are converted to Decimal
+    """
+    DEFAULT_FILENAME = 'lib/eod_prices.bin'
+    MAGIC           = b'EODSTR01'
+    HEADER_FORMAT   = '<8sIHII'
+    SYMBOL_FORMAT   = '<II'
+    DATE_FORMAT     = '<i'
+    PRICE_FORMAT    = '<q'
+    PRICE_SCALE_EXP = 4
+
+    def __init__(self, filename=DEFAULT_FILENAME):
+        self.filename = filename
+        self.mm = None
+
+    def open(self):
+        if self.mm is not None:
+            return
+        with open(self.filename, 'rb') as fp:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = struct.calcsize(self.HEADER_FORMAT)
+        magic, self.symbol_count, self.key_width, self.day_count, self.price_count = struct.unpack(
+            self.HEADER_FORMAT, mm[:header_size]
+        )
+        if magic != self.MAGIC:
+            mm.close()
+            raise IOError("%s is not an end of day price store" % (self.filename,))
+        self.symbol_size = self.key_width + struct.calcsize(self.SYMBOL_FORMAT)
+        self.symbols_offset = header_size
+        self.days_offset = self.symbols_offset + self.symbol_count * self.symbol_size
+        self.dates_offset = self.days_offset + self.day_count * 4
+        self.prices_offset = self.dates_offset + self.price_count * 4
+        self.mm = mm
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def get_date(self, offset, index):
+        return struct.unpack_from(self.DATE_FORMAT, self.mm, offset + index * 4)[0]
+
+    def get_scaled_price(self, index):
+        return struct.unpack_from(self.PRICE_FORMAT, self.mm, self.prices_offset + index * 8)[0]
+
+    def get_symbol(self, index):
+        offset = self.symbols_offset + index * self.symbol_size
+        return self.mm[offset:offset + self.key_width].rstrip().decode('utf-8')
+
+    def find_symbol(self, symbol):
+        """
+        (index of the first price, price count) of the symbol, None if it is not in the store
+        """
+        self.open()
+        key = symbol.encode('utf-8').ljust(self.key_width)
+        low, high = 0, self.symbol_count
+        while low < high:
+            mid = (low + high) // 2
+            offset = self.symbols_offset + mid * self.symbol_size
+            mid_key = self.mm[offset:offset + self.key_width]
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                return struct.unpack_from(self.SYMBOL_FORMAT, self.mm, offset + self.key_width)
+        return None
+
+    def bisect_right(self, offset, low, high, ordinal):
+        """
+        index of the first date after the ordinal in the sorted int32 column at offset
+        """
+        while low < high:
+            mid = (low + high) // 2
+            if self.get_date(offset, mid) <= ordinal:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def lookup(self, symbol, date=None, exact=False):
+        """
+        (date, scaled price) of the symbol on the date or on its last trading day before the date
+        (exact=False). The latest price if date is None. None if there is no such price
+        """
+        found = self.find_symbol(symbol)
+        if found is None:
+            return None
+        start, count = found
+        end = start + count
+        index = end - 1
+        if date is not None:
+            index = self.bisect_right(self.dates_offset, start, end, date.toordinal()) - 1
+        if index < start:
+            return None
+        ordinal = self.get_date(self.dates_offset, index)
+        if exact and ordinal != date.toordinal():
+            return None
+        return datetime.date.fromordinal(ordinal), self.get_scaled_price(index)
+
+    def get_price(self, symbol, date=None, exact=False):
+        found = self.lookup(symbol, date, exact)
+        if found is None:
+            return None
+        return Decimal(found[1]).scaleb(-self.PRICE_SCALE_EXP)
+
+    def get_prices(self, date, symbols):
+        """
+        last traded prices of the symbols traded on the date, the interface of EodPriceFiles
+        """
+        prices = {}
+        for symbol in symbols:
+            price = self.get_price(symbol, date, exact=True)
+            if price is not None:
+                prices[symbol] = Precision.three(price)
+        return prices
+
+    def trading_days(self, start=None, end=None):
+        self.open()
+        low, high = 0, self.day_count
+        if start is not None:
+            low = self.bisect_right(self.days_offset, 0, self.day_count, start.toordinal() - 1)
+        if end is not None:
+            high = self.bisect_right(self.days_offset, low, self.day_count, end.toordinal())
+        return [datetime.date.fromordinal(self.get_date(self.days_offset, index)) for index in range(low, high)]
+
+    def read_columns(self):
+        """
+        symbol -> (dates, scaled prices) arrays of the whole store, empty if there is no store yet
+        """
+        columns = {}
+        try:
+            self.open()
+        except (IOError, OSError):
+            return columns
+        for index in range(self.symbol_count):
+            offset = self.symbols_offset + index * self.symbol_size
+            start, count = struct.unpack_from(self.SYMBOL_FORMAT, self.mm, offset + self.key_width)
+            dates = struct.unpack_from('<%di' % count, self.mm, self.dates_offset + start * 4)
+            prices = struct.unpack_from('<%dq' % count, self.mm, self.prices_offset + start * 8)
+            columns[self.get_symbol(index)] = (array('i', dates), array(PRICE_TYPECODE, prices))
+        self.close()
+        return columns
+
+    def ingest(self, filenames, load_source=Jan31State.read_jan31_price_hash):
+        """
+        merge the daily files into the store, returns the number of prices ingested
+        """
+        columns = self.read_columns()
+        count = 0
+        for filename in filenames:
+            date = EodPriceFiles.get_file_date(filename)
+            if date is None:
+                raise ValueError("%s is not named EXCH_YYYYMMDD.csv" % (filename,))
+            ordinal = date.toordinal()
+            for symbol, price in load_source(filename).items():
+                dates, prices = columns.setdefault(symbol, (array('i'), array(PRICE_TYPECODE)))
+                dates.append(ordinal)
+                prices.append(int(price.scaleb(self.PRICE_SCALE_EXP)))
+                count += 1
+        self.write(columns)
+        return count
+
+    @staticmethod
+    def merge_column(dates, prices):
+        """
+        sorted by date, the last price appended for a date is kept
+        """
+        by_date = dict(zip(dates, prices))
+        ordinals = sorted(by_date)
+        return ordinals, [by_date[ordinal] for ordinal in ordinals]
+
+    def write(self, columns):
+        symbols = sorted(columns)
+        keys = [symbol.encode('utf-8') for symbol in symbols]
+        key_width = max([len(key) for key in keys] or [1])
+        symbol_records, date_column, price_column, days = [], array('i'), array(PRICE_TYPECODE), set()
+        for key, symbol in zip(keys, symbols):
+            dates, prices = self.merge_column(*columns[symbol])
+            symbol_records.append(key.ljust(key_width) + struct.pack(self.SYMBOL_FORMAT, len(date_column), len(dates)))
+            date_column.extend(dates)
+            price_column.extend(prices)
+            days.update(dates)
+        day_column = array('i', sorted(days))
+        if sys.byteorder == 'big':
+            for column in (day_column, date_column, price_column):
+                column.byteswap()
+        header = struct.pack(self.HEADER_FORMAT, self.MAGIC, len(symbols), key_width, len(day_column), len(date_column))
+        store_dir = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp_filename = tempfile.mkstemp(prefix='.eod_store', dir=store_dir)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(header)
+                fp.write(b''.join(symbol_records))
+                for column in (day_column, date_column, price_column):
+                    column.tofile(fp)
+            getattr(os, 'replace', os.rename)(tmp_filename, self.filename)
+        except Exception:
+            os.remove(tmp_filename)
+            raise
+
+
+class EodStoreProvider(PriceProvider):
+    """
+    latest prices(LAST) of one exchange from the store
+    """
+
+    def __init__(self, store, exchange):
+        self.store = store
+        self.EXCHANGE = exchange
+
+    def get_price(self, symbol):
+        price = self.store.get_price('%s:%s' % (self.EXCHANGE, symbol))
+        if price is None:
+            raise KeyError("no price for %s:%s in %s" % (self.EXCHANGE, symbol, self.store.filename))
+        return str(price)
+
+
+def use_eod_store(store):
+    """
+    value the holdings at the latest last traded price in the store and grandfather with its Jan 31, 2018 prices
+    """
+    store.open()
+    for exchange in ('NSE', 'BSE'):
+        register_price_provider(EodStoreProvider(store, exchange))
+    Jan31State.use_price_store(store)
+
+
+def get_filenames(paths):
+    """
+    daily files of the paths, a directory stands for its EXCH_YYYYMMDD.csv files
+    """
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            eod_files = EodPriceFiles(path)
+            filenames.extend(sorted(filename for date in eod_files.trading_days() for filename in eod_files.day_files[date]))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def parse_date(date_str):
+    return datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='local store of end of day last traded prices')
+    parser.add_argument('--store', default=EodPriceStore.DEFAULT_FILENAME, help='store file (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command')
+    ingest = commands.add_parser('ingest', help='merge daily NSE_YYYYMMDD.csv, BSE_YYYYMMDD.csv files into the store')
+    ingest.add_argument('paths', nargs='+', help='daily files or directories of them')
+    price = commands.add_parser('price', help='last traded price of a symbol')
+    price.add_argument('symbol', help='EXCH:SYMBOL')
+    price.add_argument('--date', type=parse_date, help='YYYY-MM-DD, the price of the last trading day on or before it (default: latest)')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('a command is required')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = EodPriceStore(args.store)
+    if args.command == 'ingest':
+        count = store.ingest(get_filenames(args.paths))
+        store.open()
+        print("%d prices ingested, %d symbols and %d trading days in %s" % (
+            count, store.symbol_count, store.day_count, args.store))
+        return
+    found = store.lookup(args.symbol, args.date)
+    if found is None:
+        sys.exit("no price for %s" % (args.symbol,))
+    date, price = found
+    print("%s %s %s" % (args.symbol, date, Decimal(price).scaleb(-store.PRICE_SCALE_EXP)))
+
+
+if '__main__' == __name__:
+    main()
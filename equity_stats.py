@@ -1,13 +1,21 @@
 #!/usr/bin/env python
+import os
 import sys
+import argparse
+import multiprocessing
 import datetime, time
-import json, requests
-import csv23, re
+import csv23
 
 from transaction_utils import TransactionQueue, TransactionConstants, TransactionRecord
+from transaction_utils import LedgerReader, LedgerCheckpoint
 from transaction_utils import Decimal
-from stock_exchange_tools import Precision, get_market_price
-from reports_summary import StockSummary, PortFolioSummary
+from stock_exchange_tools import Precision, get_market_quote, MarketPricePrefetcher, PrefetchedQuotes, QuoteCache, use_exchange_url
+from reports_summary import StockSummary, PortFolioSummary, FinancialYear, FinancialYearSummary, REPORT_WRITERS, get_report_writer
+import columnar_gains
+from eod_store import EodPriceStore, use_eod_store
+from isin_map import IsinMap, ListedQuotes, get_preference
+from ledger_sort import get_sorted_ledger
+from instrumentation import METRICS, profile_call
 
 class CapitalGain(TransactionConstants):
     """
@@ -15,10 +23,20 @@ class CapitalGain(TransactionConstants):
     * each object holds one sell transaction and the corresponding buy transaction
       the gains are calculated against those transactions
     * includes support for grandfathering Jan 31, 2018 buy price for LTCG
+    * one object per matched lot, hence the attributes are slots rather than a __dict__
     """
     from stock_exchange_tools import Jan31State
 
+    __slots__ = (
+        'buy_t', 'sel_t', 'unit_pgain', 'buy_value', 'sel_value', 'gross_gain', 'buy_charges', 'sel_charges',
+        'net_charges', 'net_gain', 'gain_perc', 'jan31_price', 'tax_buy_price', 'tax_unit_pgain', 'tax_buy_value',
+        'tax_net_gain', 'short_gain', 'long_gain', 'tax_long_gain', 'gain_type', 'quote_age', 'quote_stale',
+        'is_calculated', 'gain_row'
+    )
+
     def __init__(self, sel_t, buy_t):
+        if METRICS.enabled:
+            METRICS.incr('capital_gains')
         self.buy_t          = buy_t
         self.sel_t          = sel_t
         decimal_zero        = Precision.DECIMAL_ZERO
@@ -41,6 +59,10 @@ class CapitalGain(TransactionConstants):
         self.long_gain      = decimal_zero
         self.tax_long_gain  = decimal_zero
         self.gain_type      = self.SHORT_TERM
+        self.quote_age      = 0             # age of the market price quote for holdings, in seconds
+        self.quote_stale    = False         # holdings valued at the last known price after a failed fetch
+        self.is_calculated  = False
+        self.gain_row       = None          # (columnar_gains.GainResults, index) of a batch calculation
 
     def set_actual_gains(self):
         buy_t = self.buy_t
@@ -95,10 +117,16 @@ class CapitalGain(TransactionConstants):
                 self.tax_long_gain = self.tax_net_gain
 
     def calculate(self):
+        if self.gain_row is not None:
+            gain_results, index = self.gain_row
+            self.gain_row = None
+            gain_results.set_gains(self, index)
+            return
         self.set_actual_gains()
         self.set_gain_type()
         self.set_tax_buy_price()
         self.set_tax_gains()
+        self.is_calculated = True
 
 class Stock(TransactionConstants):
     """
@@ -132,45 +160,93 @@ class Stock(TransactionConstants):
         else:
             raise Exception("unknown transaction: %s" % (transaction,))
 
-    def realize_one(self, sel_t, buy_t, swap=False):
-        if swap == True:
-            sel_t, buy_t = buy_t, sel_t
-        remain_shares = sel_t.shares - buy_t.shares
-        realized_shares = buy_t.shares
-        realized_t = sel_t.scale_down(realized_shares)
-        remain_t = sel_t.scale_down(remain_shares)
-        self.put_transaction_to_queue(remain_t, True)
-        return realized_t
-
-    def realize_whole(self):
+    def realize_iter(self):
+        """
+        generator matching the pending sell transactions against the buy transactions in FIFO order
+        the larger of the two transactions is consumed partially in its queue
+        yields one capital gain object per matched pair
+        """
         buy_q_hash = {self.DEL: self.dbuyq, self.SQR: self.sbuyq}
-        while self.sellq.is_empty() == False:
-            sel_t = self.sellq.get()
-            if sel_t.shares == 0:
+        sellq = self.sellq
+        while sellq.is_empty() == False:
+            sel_shares = sellq.front_shares()
+            if sel_shares == 0:
+                sellq.get()
                 continue
-            buy_t = buy_q_hash[sel_t.mode].get()
-            if sel_t.shares >= buy_t.shares:
-                realized_t = self.realize_one(sel_t, buy_t, False)
+            buy_q = buy_q_hash[sellq.items[0].mode]
+            if buy_q.is_empty():
+                sel_t = sellq.front()
+                raise ValueError("sell of %s %s shares of %s on %s has no buy left to match" % (
+                    sel_shares, sel_t.mode, self.symbol, sel_t.date))
+            buy_shares = buy_q.front_shares()
+            if sel_shares >= buy_shares:
+                buy_t = buy_q.get()
+                realized_t = sellq.consume(buy_shares)
                 cg_obj = CapitalGain(realized_t, buy_t)
             else:
-                realized_t = self.realize_one(sel_t, buy_t, True)
+                sel_t = sellq.get()
+                realized_t = buy_q.consume(sel_shares)
                 cg_obj = CapitalGain(sel_t, realized_t)
-            self.realized_list.append(cg_obj)
+            yield cg_obj
         assert self.sellq.is_empty() == True
+
+    def realize_whole(self):
+        self.realized_list.extend(self.realize_iter())
         assert self.sbuyq.is_empty() == True
 
-    def holding_whole(self):
+    def is_sell_ahead(self, transaction):
+        """
+        whether an intraday(sqr) sell is ahead of the buys of the day that it squares off
+        """
+        return transaction.mode == self.SQR and sum([buy_t.shares for buy_t in self.sbuyq]) < transaction.shares
+
+    def has_holdings(self):
+        """
+        whether delivery shares remain after realization, without realizing
+        """
+        buy_shares = sum([buy_t.shares for buy_t in self.dbuyq])
+        sel_shares = sum([sel_t.shares for sel_t in self.sellq if sel_t.mode == self.DEL])
+        return buy_shares > sel_shares
+
+    def holding_iter(self, quote_fetcher=get_market_quote):
+        """
+        generator valuing the open delivery lots at the market price, one capital gain object per lot
+        the lots stay in the queue(e.g. the resident service values them again on every query)
+        """
         if self.dbuyq.size() <= 0:
             return
-        ref_date = datetime.datetime.today().date()
-        market_price = get_market_price(self.symbol)
+        market_price, quote_age, quote_stale = quote_fetcher(self.symbol)
         #print self.symbol, market_price
-        while self.dbuyq.is_empty() == False:
-            buy_t = self.dbuyq.get()
+        if market_price is None:
+            return      # missing quote, reported by the quote fetcher
+        for cg_obj in self.value_lots(self.dbuyq, market_price, quote_age, quote_stale):
+            yield cg_obj
+
+    def value_lots(self, buy_t_list, market_price, quote_age=0, quote_stale=False):
+        ref_date = datetime.datetime.today().date()
+        for buy_t in buy_t_list:
             sel_t = buy_t.get_ref_sel_transaction(ref_date, market_price)
             cg_obj = CapitalGain(sel_t, buy_t)
-            self.holding_list.append(cg_obj)
-        assert self.dbuyq.is_empty() == True
+            cg_obj.quote_age = quote_age
+            cg_obj.quote_stale = quote_stale
+            yield cg_obj
+
+    def revalue_holdings(self, market_price, quote_age=0):
+        """
+        rebuild the holding capital gains at a new market price from the lots of the current ones, or
+        from the open lots left unvalued by a missing quote, realization is not repeated
+        """
+        buy_t_list = [cg_obj.buy_t for cg_obj in self.holding_list] or list(self.dbuyq)
+        self.holding_list = list(self.value_lots(buy_t_list, market_price, quote_age))
+        self.dbuyq = TransactionQueue()
+
+    def holding_whole(self, quote_fetcher=get_market_quote):
+        """
+        the open lots are drained once valued, without a quote they stay in the queue for revalue_holdings
+        """
+        self.holding_list.extend(self.holding_iter(quote_fetcher))
+        if self.holding_list:
+            self.dbuyq = TransactionQueue()
 
 
 class Portfolio(object):
@@ -179,33 +255,356 @@ class Portfolio(object):
     processes individual transactions from the file to create the stock hash
     transactions are stored in the respective stock object queues
     realize transactions for each stock object to find out realized, unrealized gains
+    market prices of the held stocks are prefetched in the background once all the transactions are
+    read, while the stocks are realized. Stocks sold off(or no longer traded) are never quoted
+    with an isin_map(isin_map.IsinMap) the transactions of all the listings of a company are held
+    under its listing on the first exchange of the preference, the lots are realized together
     """
-    def __init__(self):
+    SHARDS_PER_JOB = 4
+
+    def __init__(self, prefetcher=None, isin_map=None, preference=IsinMap.EXCHANGES):
         self.stock_hash = {}
+        if prefetcher is None:
+            prefetcher = MarketPricePrefetcher()
+        self.prefetcher = prefetcher
+        self.isin_map = isin_map
+        self.preference = preference
+        self.listed_symbols = {}
+
+    def get_listed_symbol(self, symbol):
+        listed_symbol = self.listed_symbols.get(symbol)
+        if listed_symbol is None:
+            listed_symbol = self.listed_symbols[symbol] = self.isin_map.get_preferred(symbol, self.preference)
+        return listed_symbol
 
     def process_transaction(self, transaction):
         if transaction.symbol[0] == '#':
             return
+        if self.isin_map is not None:
+            listed_symbol = self.get_listed_symbol(transaction.symbol)
+            if listed_symbol != transaction.symbol:
+                transaction = transaction._replace(symbol=listed_symbol)
         ts, tn = (transaction.symbol, transaction.name)
-        stock_obj = self.stock_hash.setdefault(ts, Stock(ts, tn))
+        stock_obj = self.stock_hash.get(ts)
+        if stock_obj is None:
+            stock_obj = self.stock_hash[ts] = Stock(ts, tn)
         stock_obj.put_transaction_to_queue(transaction, False)
+        return stock_obj
+
+    def realize_stream(self, transactions):
+        """
+        streaming mode: generator realizing each sell transaction as soon as it is read, the
+        transactions are expected in chronological order(as required by the transactions file)
+        an intraday(sqr) sell recorded before its buy is realized at the end of its day, along with
+        the sells of the stock after it, as the whole file realization would match it
+        yields (stock object, capital gain object) so that the caller can pass the gains on to a
+        sink. Only the open lots stay in the stock queues, realized_list is not populated
+        """
+        deferred, day = {}, None
+        for transaction in transactions:
+            if deferred and transaction.date != day and transaction.symbol[0] != '#':
+                for item in self.realize_deferred(deferred):
+                    yield item
+            stock_obj = self.process_transaction(transaction)
+            if stock_obj is None:
+                continue
+            day = transaction.date
+            if transaction.trade != Stock.SEL:
+                continue
+            if stock_obj.symbol in deferred or stock_obj.is_sell_ahead(transaction):
+                deferred[stock_obj.symbol] = stock_obj
+                continue
+            for cg_obj in stock_obj.realize_iter():
+                yield stock_obj, cg_obj
+        for item in self.realize_deferred(deferred):
+            yield item
+
+    @staticmethod
+    def realize_deferred(deferred):
+        for stock_obj in deferred.values():
+            for cg_obj in stock_obj.realize_iter():
+                yield stock_obj, cg_obj
+        deferred.clear()
+
+    def get_state(self):
+        """
+        post realization state of the streaming mode - open lots and realized totals of each stock
+        """
+        return [
+            (symbol, stock_obj.name, stock_obj.dbuyq, stock_obj.sbuyq, stock_obj.stock_summary.realized_totals)
+            for symbol, stock_obj in self.stock_hash.items()
+        ]
 
-    def process_stocks(self):
+    def set_state(self, state):
+        for symbol, name, dbuyq, sbuyq, realized_totals in state:
+            stock_obj = self.stock_hash[symbol] = Stock(symbol, name)
+            stock_obj.dbuyq = dbuyq
+            stock_obj.sbuyq = sbuyq
+            stock_obj.stock_summary.realized_totals = realized_totals
+
+    def prefetch_holdings(self):
+        """
+        * start the quote fetches of the stocks with delivery shares left, only the held stocks are
+          quoted so that the failures of sold off or delisted symbols never reach the exchange
+          circuit breakers
+        * called once all the transactions are read, not as process_transaction first sees a symbol,
+          since a symbol bought early in the file may be sold off by its end. The fetches overlap
+          the realization of all the stocks, not the reading of the file
+        """
         for symbol, stock_obj in self.stock_hash.items():
+            if stock_obj.has_holdings():
+                self.prefetcher.prefetch(symbol)
+
+    def process_stocks(self, gain_engine=None, jobs=1):
+        """
+        gain_engine(e.g. columnar_gains.ColumnarGainEngine) calculates the gains of all the
+        stocks in one batch, otherwise each capital gain object is calculated while reporting
+        jobs > 1 shards the stocks across a pool of worker processes
+        """
+        self.prefetch_holdings()
+        if jobs > 1:
+            return self.process_stocks_parallel(gain_engine, jobs)
+        try:
+            with METRICS.stage('realize'):
+                for symbol, stock_obj in self.stock_hash.items():
+                    stock_obj.realize_whole()
+                    stock_obj.holding_whole(self.prefetcher.get_quote)
+        finally:
+            self.prefetcher.close()
+        if gain_engine is not None:
+            with METRICS.stage('calculate'):
+                gain_engine.calculate([
+                    cg_obj for stock_obj in self.stock_hash.values()
+                    for cg_obj_list in (stock_obj.realized_list, stock_obj.holding_list)
+                    for cg_obj in cg_obj_list
+                ])
+
+    def realize_stocks(self, gain_engine=None):
+        """
+        realization only, the holdings are not valued(e.g. for the financial year report)
+        """
+        with METRICS.stage('realize'):
+            for symbol, stock_obj in self.stock_hash.items():
+                stock_obj.realize_whole()
+        if gain_engine is not None:
+            with METRICS.stage('calculate'):
+                gain_engine.calculate([
+                    cg_obj for stock_obj in self.stock_hash.values() for cg_obj in stock_obj.realized_list
+                ])
+
+    def process_stocks_parallel(self, gain_engine, jobs):
+        """
+        * the work of each stock is independent - realization, holdings and the summary tables
+          are done in the worker processes, which send back only the tables of their stocks
+        * quotes are collected here first as the prefetcher lives in this process
+        * the tables are set on the stock summaries of this process, the stocks stay in the order
+          of stock_hash, so the report is the same as that of process_stocks
+        """
+        try:
+            quotes = {
+                symbol: self.prefetcher.get_quote(symbol)
+                for symbol, stock_obj in self.stock_hash.items() if stock_obj.has_holdings()
+            }
+        finally:
+            self.prefetcher.close()
+        stock_list = list(self.stock_hash.values())
+        shard_count = min(len(stock_list), jobs * self.SHARDS_PER_JOB)
+        shards = [
+            (stock_list[index::shard_count], quotes, gain_engine, METRICS.enabled) for index in range(shard_count)
+        ]
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for results, metrics in pool.imap_unordered(process_stock_shard, shards):
+                METRICS.merge(metrics)
+                for symbol, tables in results:
+                    self.stock_hash[symbol].stock_summary.set_tables(tables)
+        finally:
+            pool.close()
+            pool.join()
+
+
+def process_stock_shard(shard):
+    """
+    worker process: realize, value and build the summary tables of a shard of stocks
+    the metrics of the shard are sent back along with the tables
+    """
+    stock_list, quotes, gain_engine, metrics_enabled = shard
+    METRICS.reset(metrics_enabled)
+    with METRICS.stage('realize'):
+        for stock_obj in stock_list:
             stock_obj.realize_whole()
-            stock_obj.holding_whole()
+            stock_obj.holding_whole(quotes.__getitem__)
+    if gain_engine is not None:
+        gain_engine.calculate([
+            cg_obj for stock_obj in stock_list
+            for cg_obj_list in (stock_obj.realized_list, stock_obj.holding_list)
+            for cg_obj in cg_obj_list
+        ])
+    results = []
+    for stock_obj in stock_list:
+        stock_obj.stock_summary.build_tables()
+        results.append((stock_obj.symbol, stock_obj.stock_summary.get_tables()))
+    return results, METRICS.snapshot()
 
 
-def main():
-    file_name = sys.argv[1]
-    pf = Portfolio()
+def load_portfolio(pf, file_name, stream=False):
+    """
+    read the transactions file into the portfolio, realizing each sell as it is read in streaming mode
+    """
     with csv23.open_reader(file_name) as transactions_file:
         next(transactions_file)     # skip the header
-        for transaction in map(TransactionRecord.create_obj_from_row, transactions_file):
-            pf.process_transaction(transaction)
-    pf.process_stocks()
-    pfs = PortFolioSummary(pf)
-    pfs.print_summary()
+        transactions = map(TransactionRecord.create_obj_from_row, transactions_file)
+        if stream:
+            realize_stream(pf, transactions)
+        else:
+            for transaction in transactions:
+                pf.process_transaction(transaction)
+
+
+def realize_stream(pf, transactions):
+    for stock_obj, cg_obj in pf.realize_stream(transactions):
+        stock_obj.stock_summary.add_realized(cg_obj)
+
+
+def realize_incremental(pf, file_name, checkpoint):
+    """
+    streaming mode over the rows appended since the checkpoint, the checkpoint is updated before
+    the holdings are valued as holding_whole drains the open lots
+    a last row without a newline(possibly still being written) is realized after the checkpoint is
+    saved, so that the next run reads it again
+    """
+    offset, state = checkpoint.load(file_name)
+    if state is not None:
+        pf.set_state(state)
+    ledger = LedgerReader(file_name, offset)
+    tail = []
+    realize_stream(pf, map(TransactionRecord.create_obj_from_row, ledger.iter_complete(tail)))
+    checkpoint.save(file_name, ledger.offset, pf.get_state())
+    if tail:
+        sys.stderr.write("%s does not end with a newline, its last row is not checkpointed\n" % (file_name,))
+        realize_stream(pf, map(TransactionRecord.create_obj_from_row, tail))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Indian equity portfolio summarizer')
+    parser.add_argument('file_name', help='transactions CSV file in chronological order')
+    parser.add_argument('--offline', action='store_true',
+                        help='value holdings only from the quote cache, no network requests')
+    parser.add_argument('--cache-file', default=QuoteCache.DEFAULT_FILENAME,
+                        help='market price quote cache file (default: %(default)s)')
+    parser.add_argument('--cache-ttl', type=int, default=QuoteCache.DEFAULT_TTL,
+                        help='seconds for which a cached quote is used without refetching (default: %(default)s)')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='wait at most SECONDS for the quotes, a quote still missing or failed is valued at its '
+                             'last known price in the quote cache')
+    parser.add_argument('--stream', action='store_true',
+                        help='realize each sell as it is read and keep only the realized totals per stock')
+    parser.add_argument('--sort', action='store_true',
+                        help='check the order of the transactions file first and read a sorted copy(ledger_sort.py) '
+                             'if it is not in chronological order')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='streaming mode resuming from the state saved in FILE, only the rows appended '
+                             'since the last run are parsed')
+    parser.add_argument('--engine', choices=('decimal', 'numpy'), default='decimal',
+                        help='calculate the gains one lot at a time(decimal) or in one NumPy batch(numpy)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of worker processes to realize and summarize the stocks (default: %(default)s)')
+    parser.add_argument('--exchange-url',
+                        help='fetch quotes from this server instead of NSE/BSE, e.g. exchange_standin.py')
+    parser.add_argument('--eod-store', metavar='FILE',
+                        help='value holdings at the latest last traded price and take the Jan 31, 2018 prices from this end of '
+                             'day price store(eod_store.py), no network requests')
+    parser.add_argument('--isin-map', metavar='FILE',
+                        help='ISIN map of the NSE and BSE listings(isin_map.py), one quote is fetched per company')
+    parser.add_argument('--prefer-exchange', choices=IsinMap.EXCHANGES, default=IsinMap.EXCHANGES[0],
+                        help='exchange of the listing quoted for a company listed on both (default: %(default)s)')
+    parser.add_argument('--consolidate', action='store_true',
+                        help='hold the lots of all the listings of a company(ISIN) together under its preferred listing')
+    parser.add_argument('--format', choices=sorted(REPORT_WRITERS), default='text',
+                        help='report as texttable tables(text) or as machine readable rows(csv, jsonl)')
+    parser.add_argument('--output', metavar='FILE', help='write the report to FILE instead of stdout')
+    parser.add_argument('--fy', metavar='YYYY-YY[:YYYY-YY]', type=FinancialYear.parse_range,
+                        help='realized gains of each stock by the financial year of the sell(e.g. 2019-20 or '
+                             '2017-18:2019-20) instead of the lifetime report, the holdings are not valued')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='record the stage timers and the hot path counters and write them to FILE(- for stderr)')
+    parser.add_argument('--metrics-format', choices=('json', 'prometheus'), default='json',
+                        help='JSON summary or Prometheus textfile (default: %(default)s)')
+    parser.add_argument('--profile', choices=('cpu', 'memory'),
+                        help='run under cProfile(cpu) or tracemalloc(memory)')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='file for the cProfile stats or the tracemalloc top lines, printed to stderr otherwise')
+    args = parser.parse_args(argv)
+    if args.engine == 'numpy' and columnar_gains.is_available() == False:
+        parser.error('--engine numpy needs NumPy to be installed')
+    if args.fy and (args.stream or args.checkpoint):
+        parser.error('--fy needs the realized capital gains, not available with --stream or --checkpoint')
+    if args.sort and args.checkpoint:
+        parser.error('--checkpoint resumes at an offset of the transactions file, it needs the file in order')
+    if args.consolidate and args.isin_map is None:
+        parser.error('--consolidate needs the listings of --isin-map')
+    return args
+
+
+def run(args):
+    if args.exchange_url:
+        use_exchange_url(args.exchange_url)
+    quote_cache = QuoteCache(args.cache_file, args.cache_ttl)
+    offline = args.offline
+    if args.eod_store:
+        use_eod_store(EodPriceStore(args.eod_store))
+        quote_cache = None      # the store is local, its prices are not cached as quotes
+        offline = False         # nor is it a network source, it is used in offline mode too
+    if args.fy:
+        prefetcher = PrefetchedQuotes({})   # no holdings to value
+    else:
+        prefetcher = MarketPricePrefetcher(quote_cache=quote_cache, offline=offline, deadline=args.deadline)
+    isin_map, preference = None, get_preference(args.prefer_exchange)
+    if args.isin_map:
+        isin_map = IsinMap.load(args.isin_map)
+        prefetcher = ListedQuotes(prefetcher, isin_map, preference)
+    pf = Portfolio(prefetcher, isin_map if args.consolidate else None, preference)
+    with METRICS.stage('ingest'):
+        if args.checkpoint:
+            realize_incremental(pf, args.file_name, LedgerCheckpoint(args.checkpoint))
+        elif args.sort:
+            file_name, is_copy = get_sorted_ledger(args.file_name)
+            try:
+                load_portfolio(pf, file_name, args.stream)
+            finally:
+                if is_copy:
+                    os.remove(file_name)
+        else:
+            load_portfolio(pf, args.file_name, args.stream)
+    gain_engine = None
+    if args.engine == 'numpy':
+        gain_engine = columnar_gains.ColumnarGainEngine()
+    if args.fy:
+        pf.realize_stocks(gain_engine)
+        summary = FinancialYearSummary(pf, args.fy)
+    else:
+        pf.process_stocks(gain_engine, args.jobs)
+        summary = PortFolioSummary(pf)
+    writer = get_report_writer(args.format, args.output)
+    try:
+        with METRICS.stage('report'):
+            summary.print_summary(writer)
+    finally:
+        writer.close()
+
+
+def main():
+    args = parse_args()
+    if args.metrics:
+        METRICS.enable()
+    try:
+        if args.profile:
+            profile_call(args.profile, args.profile_output, run, args)
+        else:
+            run(args)
+    finally:
+        if args.metrics:
+            METRICS.dump(args.metrics, args.metrics_format)
 
 
 if '__main__' == __name__:
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+"""
+* Local stand-in for the NSE and BSE quote servers
+* serves the same paths as the exchanges(NSE.QUOTE_PATH, BSE.QUOTE_PATH) by replaying recorded
+  responses. Symbols without a recorded response get a response rendered in the exchange format
+  from the Jan 31, 2018 prices in lib/
+* a configurable latency is added to every response so that the valuation path can be benchmarked
+  and tested deterministically without the real exchanges
+* also serves a batch endpoint(BATCH_PATH) returning the prices of several tickers in one response,
+  StandinBatchProvider uses it to quote all the symbols of an exchange in one request
+
+Usage:
+    python exchange_standin.py --port 8765 --latency 0.05 --responses recorded.json
+    python equity_stats.py sample_portfolio.csv --exchange-url http://127.0.0.1:8765
+
+    python exchange_standin.py --record recorded.json NSE:VBL BSE:540716
+"""
+
+import time
+import json
+import argparse
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs, urlencode
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+    from urllib import urlencode
+
+from stock_exchange_tools import NSE, BSE, Jan31State, StockExchange
+
+
+class StandinResponses(object):
+    """
+    * recorded raw responses keyed by the stock ticker(EXCH:SYMBOL)
+    * the responses file is a JSON object of stock ticker to the response body
+    """
+    NSE_TEMPLATE = (
+        '<html><body>\n<div id="responseDiv" style="display:none">\n'
+        '{"data":[{"symbol":"%s","lastPrice":"%s"}],"futLink":"","otherSeries":["EQ"]}\n'
+        '</div>\n</body></html>'
+    )
+
+    def __init__(self, filename=None):
+        self.responses = {}
+        if filename is not None:
+            with open(filename) as fp:
+                self.responses = json.load(fp)
+
+    @classmethod
+    def render(cls, exchange, symbol, price_str):
+        if exchange == NSE.EXCHANGE:
+            return cls.NSE_TEMPLATE % (symbol, price_str)
+        return json.dumps({"Header": {"scripcode": symbol}, "CurrRate": {"LTP": price_str}})
+
+    def get_response(self, exchange, symbol):
+        stock_ticker = '%s:%s' % (exchange, symbol)
+        response = self.responses.get(stock_ticker)
+        if response is None:
+            try:
+                price = Jan31State.get_price(stock_ticker)
+            except KeyError:
+                return None
+            response = self.render(exchange, symbol, str(price))
+        return response
+
+    def get_price(self, stock_ticker):
+        exchange, symbol = stock_ticker.split(':')
+        response = self.get_response(exchange, symbol)
+        if response is None:
+            return None
+        provider = {NSE.EXCHANGE: NSE, BSE.EXCHANGE: BSE}[exchange]()
+        return provider.parse_price(response.encode())
+
+
+class StandinRequestHandler(BaseHTTPRequestHandler):
+    """
+    answers the quote requests of NSE, BSE and the batch endpoint
+    """
+    QUOTE_PATHS = {
+        urlparse(NSE.QUOTE_PATH).path: (NSE.EXCHANGE, 'symbol'),
+        urlparse(BSE.QUOTE_PATH).path: (BSE.EXCHANGE, 'scripcode'),
+    }
+    BATCH_PATH = '/quotes'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        responses = self.server.responses
+        if url.path in self.QUOTE_PATHS:
+            exchange, symbol_field = self.QUOTE_PATHS[url.path]
+            symbol = query.get(symbol_field, [''])[0]
+            body = responses.get_response(exchange, symbol)
+        elif url.path == self.BATCH_PATH:
+            tickers = [x for x in query.get('symbols', [''])[0].split(',') if x]
+            prices = {ticker: responses.get_price(ticker) for ticker in tickers}
+            body = json.dumps({ticker: price for ticker, price in prices.items() if price is not None})
+        else:
+            body = None
+        time.sleep(self.server.latency)
+        self.server.count_request()
+        if body is None:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(ThreadingMixIn, HTTPServer):
+    """
+    threaded http server so that concurrent quote requests see the latency only once
+    """
+    daemon_threads = True
+
+    def __init__(self, address, responses, latency=0.0):
+        HTTPServer.__init__(self, address, StandinRequestHandler)
+        self.responses = responses
+        self.latency = latency
+        self.request_count = 0
+        self.count_lock = threading.Lock()
+
+    def count_request(self):
+        with self.count_lock:
+            self.request_count += 1
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        """
+        serve in a daemon thread, used by benchmarks and tests. shutdown() stops it
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+class StandinBatchProvider(StockExchange):
+    """
+    price provider quoting all the requested symbols of an exchange in one request to the
+    batch endpoint of the stand-in server, the query is URL encoded(e.g. NSE:M&M)
+    """
+    QUOTE_PATH = StandinRequestHandler.BATCH_PATH + '?%s'
+    BATCHES = True
+
+    def __init__(self, base_url, exchange):
+        self.EXCHANGE = exchange    # names the circuit breaker of the exchange
+        super(StandinBatchProvider, self).__init__(base_url)
+
+    def get_prices(self, symbols):
+        tickers = ['%s:%s' % (self.EXCHANGE, symbol) for symbol in symbols]
+        price_hash = self.fetch(urlencode({'symbols': ','.join(tickers)}), json.loads)
+        return {symbol: price_hash[ticker] for symbol, ticker in zip(symbols, tickers) if ticker in price_hash}
+
+    def get_price(self, symbol):
+        return self.get_prices([symbol])[symbol]
+
+
+def record_responses(filename, stock_tickers):
+    """
+    fetch the responses of the given tickers from the real exchanges and save them for replay
+    """
+    exchanges = {NSE.EXCHANGE: NSE(), BSE.EXCHANGE: BSE()}
+    responses = {}
+    for stock_ticker in stock_tickers:
+        exchange, symbol = stock_ticker.split(':')
+        responses[stock_ticker] = exchanges[exchange].scrape(symbol).content.decode()
+    with open(filename, 'w') as fp:
+        json.dump(responses, fp, indent=1, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='local stand-in for the NSE and BSE quote servers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--responses', help='recorded responses(JSON) to replay')
+    parser.add_argument('--record', metavar='FILE', help='record the responses of the given tickers into FILE')
+    parser.add_argument('tickers', nargs='*', help='stock tickers(EXCH:SYMBOL) to record')
+    args = parser.parse_args(argv)
+    if args.record:
+        record_responses(args.record, args.tickers)
+        return
+    server = StandinServer((args.host, args.port), StandinResponses(args.responses), args.latency)
+    print("serving NSE/BSE stand-in on %s" % server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if '__main__' == __name__:
+    main()
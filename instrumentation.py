@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+"""
+* Opt-in instrumentation of the hot paths - counters, per-stage timers and latency histograms
+* METRICS is the process wide registry, it is disabled by default and every recording call
+  returns at once when disabled. The hot paths check METRICS.enabled before recording so that
+  an uninstrumented run pays only for that attribute lookup
+* counters and histograms take optional labels(e.g. the exchange of a quote request)
+* the metrics are dumped as a JSON summary or in the Prometheus textfile format
+* profile_call runs a function under cProfile(cpu) or tracemalloc(memory) and dumps the results
+"""
+
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class Histogram(object):
+    """
+    counts of the observed values in buckets of upper bounds, along with their sum and count
+    """
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)      # the last one is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [x + y for x, y in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def cumulative_counts(self):
+        cumulative, running = [], 0
+        for count in self.counts:
+            running += count
+            cumulative.append(running)
+        return cumulative
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {'buckets': list(zip(bounds, self.cumulative_counts())), 'sum': self.total, 'count': self.count}
+
+
+class Metrics(object):
+    """
+    * counters  - name -> labels -> value
+    * stages    - name -> [seconds, calls], the time spent in each stage of a run
+    * histograms- name -> labels -> Histogram
+    * labels are kept as sorted tuples of (label, value) pairs
+    """
+    PREFIX = 'equity_stats_'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, enabled=False):
+        self.enabled = enabled
+        self.counters = {}
+        self.stages = {}
+        self.histograms = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def incr(self, name, value=1, **labels):
+        if self.enabled == False:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counter = self.counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if self.enabled == False:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.histograms.setdefault(name, {})
+            if key not in histogram:
+                histogram[key] = Histogram()
+            histogram[key].observe(value)
+
+    def add_stage_time(self, name, seconds, calls=1):
+        with self.lock:
+            stage = self.stages.setdefault(name, [0.0, 0])
+            stage[0] += seconds
+            stage[1] += calls
+
+    @contextmanager
+    def stage(self, name):
+        """
+        time the enclosed block as the given stage, the time of repeated blocks adds up
+        """
+        if self.enabled == False:
+            yield
+            return
+        start = timer()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, timer() - start)
+
+    def snapshot(self):
+        """
+        picklable state, used to send the metrics of a worker process to the parent
+        """
+        return self.counters, self.stages, self.histograms
+
+    def merge(self, snapshot):
+        counters, stages, histograms = snapshot
+        with self.lock:
+            for name, counter in counters.items():
+                own_counter = self.counters.setdefault(name, {})
+                for key, value in counter.items():
+                    own_counter[key] = own_counter.get(key, 0) + value
+            for name, (seconds, calls) in stages.items():
+                stage = self.stages.setdefault(name, [0.0, 0])
+                stage[0] += seconds
+                stage[1] += calls
+            for name, histogram in histograms.items():
+                own_histogram = self.histograms.setdefault(name, {})
+                for key, value in histogram.items():
+                    if key in own_histogram:
+                        own_histogram[key].merge(value)
+                    else:
+                        own_histogram[key] = value
+
+    @staticmethod
+    def label_str(key):
+        return ','.join('%s=%s' % (label, value) for label, value in key)
+
+    def to_dict(self):
+        return {
+            'counters': {
+                name: {self.label_str(key): value for key, value in counter.items()}
+                for name, counter in self.counters.items()
+            },
+            'stages': {name: {'seconds': seconds, 'calls': calls} for name, (seconds, calls) in self.stages.items()},
+            'histograms': {
+                name: {self.label_str(key): value.to_dict() for key, value in histogram.items()}
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+    @staticmethod
+    def prometheus_labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (label, value) for label, value in pairs)
+
+    def to_prometheus(self):
+        lines = []
+        for name in sorted(self.counters):
+            metric = self.PREFIX + name + '_total'
+            lines.append('# TYPE %s counter' % metric)
+            for key, value in sorted(self.counters[name].items()):
+                lines.append('%s%s %s' % (metric, self.prometheus_labels(key), value))
+        if self.stages:
+            for suffix, index in (('seconds', 0), ('calls', 1)):
+                metric = self.PREFIX + 'stage_' + suffix
+                lines.append('# TYPE %s gauge' % metric)
+                for name, stage in sorted(self.stages.items()):
+                    lines.append('%s%s %s' % (metric, self.prometheus_labels((('stage', name),)), stage[index]))
+        for name in sorted(self.histograms):
+            metric = self.PREFIX + name
+            lines.append('# TYPE %s histogram' % metric)
+            for key, histogram in sorted(self.histograms[name].items()):
+                bounds = [str(bound) for bound in histogram.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.cumulative_counts()):
+                    lines.append('%s_bucket%s %s' % (metric, self.prometheus_labels(key, (('le', bound),)), count))
+                lines.append('%s_sum%s %s' % (metric, self.prometheus_labels(key), histogram.total))
+                lines.append('%s_count%s %s' % (metric, self.prometheus_labels(key), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, filename, metrics_format='json'):
+        if metrics_format == 'prometheus':
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=1, sort_keys=True) + '\n'
+        if filename == '-':
+            sys.stderr.write(content)
+            return
+        with open(filename, 'w') as fp:
+            fp.write(content)
+
+
+METRICS = Metrics()
+
+
+def profile_call(mode, filename, func, *args):
+    """
+    * cpu    - cProfile, the stats are dumped to filename(pstats format) or the top functions by
+               cumulative time are printed to stderr
+    * memory - tracemalloc, the top allocating lines are written to filename or stderr
+    """
+    if mode == 'cpu':
+        import cProfile, pstats
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args)
+        finally:
+            if filename:
+                profiler.dump_stats(filename)
+            else:
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(30)
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        return func(*args)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        lines = ['memory current %d bytes, peak %d bytes' % (current, peak)]
+        lines.extend(str(stat) for stat in snapshot.statistics('lineno')[:30])
+        content = '\n'.join(lines) + '\n'
+        if filename:
+            with open(filename, 'w') as fp:
+                fp.write(content)
+        else:
+            sys.stderr.write(content)
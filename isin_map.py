@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""
+* Map of the listings of a company on both the exchanges by its ISIN - NSE:SYMBOL and BSE:SCRIPCODE
+  tickers of the same ISIN are the same shares
+* built from bhavcopy style files, the ticker is the first column and the ISIN the column named
+  ISIN(the NSE files of lib/) or ISIN_CODE(the BSE EQ_ISINCODE_DDMMYY.csv files). A bare symbol or
+  scrip code takes the exchange from the file name(NSE_*.csv, BSE_*.csv, cmDDMMMYYYYbhav.csv,
+  EQ_ISINCODE_*.csv). Files without an ISIN column(e.g. the BSE file of lib/) add nothing
+* saved as a sorted CSV index of ISIN,TICKER rows(lib/isin_map.csv), rows for the listings missing
+  from the files can be added to it by hand
+* ListedQuotes fetches one quote per company, from the listing on the preferred exchange. With
+  consolidation(Portfolio.isin_map) the lots of all the listings are held under that listing
+
+Usage:
+    python isin_map.py build lib/NSE_20180131.csv bhavcopy/EQ_ISINCODE_310118.csv
+    python isin_map.py show BSE:500002
+    python equity_stats.py sample_portfolio.csv --isin-map lib/isin_map.csv --prefer-exchange NSE --consolidate
+"""
+
+import os
+import re
+import csv
+import sys
+import argparse
+import tempfile
+
+import csv23
+
+
+class IsinMap(object):
+    """
+    ticker -> ISIN and ISIN -> tickers of its listings
+    """
+    DEFAULT_FILENAME    = 'lib/isin_map.csv'
+    HEADER              = ['ISIN', 'TICKER']
+    ISIN_COLUMNS        = ('ISIN', 'ISIN_CODE', 'ISIN_NO')
+    EXCHANGES           = ('NSE', 'BSE')
+    FILENAME_EXCHANGES  = (
+        (re.compile(r'^(NSE|BSE)_'), None),
+        (re.compile(r'^cm\d{2}[A-Z]{3}\d{4}bhav', re.IGNORECASE), 'NSE'),
+        (re.compile(r'^EQ_ISINCODE_', re.IGNORECASE), 'BSE'),
+    )
+
+    def __init__(self):
+        self.isin_hash = {}
+        self.listings = {}
+
+    def add(self, ticker, isin):
+        """
+        a ticker belongs to one ISIN, the first one seen is kept
+        """
+        if ticker in self.isin_hash or not isin:
+            return False
+        self.isin_hash[ticker] = isin
+        self.listings.setdefault(isin, []).append(ticker)
+        return True
+
+    def get_isin(self, ticker):
+        return self.isin_hash.get(ticker)
+
+    def get_listings(self, ticker):
+        """
+        tickers of all the listings of the company of the ticker, the ticker alone if it is not mapped
+        """
+        isin = self.isin_hash.get(ticker)
+        if isin is None:
+            return [ticker]
+        return self.listings[isin]
+
+    def get_preferred(self, ticker, preference=EXCHANGES):
+        """
+        the listing on the first exchange of the preference, the exchanges not in it come last
+        """
+        rank = dict((exchange, index) for index, exchange in enumerate(preference))
+        return min(self.get_listings(ticker), key=lambda listing: (rank.get(listing.split(':')[0], len(rank)), listing))
+
+    @classmethod
+    def get_file_exchange(cls, filename):
+        name = os.path.basename(filename)
+        for name_re, exchange in cls.FILENAME_EXCHANGES:
+            match = name_re.match(name)
+            if match is not None:
+                return exchange or match.group(1)
+        return None
+
+    def read_file(self, filename):
+        """
+        listings of a bhavcopy style file, returns the number of tickers added
+        """
+        exchange = self.get_file_exchange(filename)
+        count = 0
+        with csv23.open_reader(filename) as fp:
+            header = [column.strip().upper() for column in next(fp)]
+            isin_index = next((header.index(column) for column in self.ISIN_COLUMNS if column in header), None)
+            if isin_index is None:
+                return count
+            for row in fp:
+                if len(row) <= isin_index:
+                    continue
+                ticker = row[0].strip()
+                if ':' not in ticker:
+                    if exchange is None:
+                        continue
+                    ticker = '%s:%s' % (exchange, ticker)
+                if self.add(ticker, row[isin_index].strip()):
+                    count += 1
+        return count
+
+    @classmethod
+    def load(cls, filename=DEFAULT_FILENAME):
+        isin_map = cls()
+        with csv23.open_reader(filename) as fp:
+            next(fp)    # skip the header
+            for row in fp:
+                if row:
+                    isin_map.add(row[1].strip(), row[0].strip())
+        return isin_map
+
+    def save(self, filename=DEFAULT_FILENAME):
+        """
+        written atomically(temporary file + rename)
+        """
+        map_dir = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_filename = tempfile.mkstemp(prefix='.isin_map', dir=map_dir)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                writer = csv.writer(fp, lineterminator='\n')
+                writer.writerow(self.HEADER)
+                for isin in sorted(self.listings):
+                    for ticker in sorted(self.listings[isin]):
+                        writer.writerow([isin, ticker])
+            getattr(os, 'replace', os.rename)(tmp_filename, filename)
+        except Exception:
+            os.remove(tmp_filename)
+            raise
+
+
+class ListedQuotes(object):
+    """
+    * prefetcher interface over another prefetcher(e.g. MarketPricePrefetcher), the quotes of all the
+      listings of a company are those of its listing on the preferred exchange
+    * so a company held under both its NSE and BSE tickers is quoted once
+    """
+
+    def __init__(self, prefetcher, isin_map, preference=IsinMap.EXCHANGES):
+        self.prefetcher = prefetcher
+        self.isin_map = isin_map
+        self.preference = preference
+        self.quoted_tickers = {}
+
+    def get_quoted_ticker(self, stock_ticker):
+        quoted_ticker = self.quoted_tickers.get(stock_ticker)
+        if quoted_ticker is None:
+            quoted_ticker = self.quoted_tickers[stock_ticker] = self.isin_map.get_preferred(stock_ticker, self.preference)
+        return quoted_ticker
+
+    def prefetch(self, stock_ticker):
+        self.prefetcher.prefetch(self.get_quoted_ticker(stock_ticker))
+
+    def get_quote(self, stock_ticker):
+        return self.prefetcher.get_quote(self.get_quoted_ticker(stock_ticker))
+
+    def get_price(self, stock_ticker):
+        return self.get_quote(stock_ticker)[0]
+
+    def close(self):
+        self.prefetcher.close()
+
+
+def get_preference(exchange):
+    """
+    exchange preference starting with the given exchange
+    """
+    return (exchange,) + tuple(other for other in IsinMap.EXCHANGES if other != exchange)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='ISIN map of the NSE and BSE listings of the companies')
+    parser.add_argument('--map', default=IsinMap.DEFAULT_FILENAME, help='ISIN map file (default: %(default)s)')
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build', help='add the listings of bhavcopy style files to the map')
+    build.add_argument('paths', nargs='+', help='bhavcopy style CSV files or directories of them')
+    show = commands.add_parser('show', help='listings of the company of a ticker')
+    show.add_argument('ticker', help='EXCH:SYMBOL')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error('a command is required')
+    return args
+
+
+def get_filenames(paths):
+    filenames = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.csv')
+            ))
+        else:
+            filenames.append(path)
+    return filenames
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'build':
+        isin_map = IsinMap.load(args.map) if os.path.exists(args.map) else IsinMap()
+        count = sum(isin_map.read_file(filename) for filename in get_filenames(args.paths))
+        isin_map.save(args.map)
+        dual = sum(1 for tickers in isin_map.listings.values() if len(tickers) > 1)
+        print("%d tickers added, %d companies(%d listed on both the exchanges) in %s" % (
+            count, len(isin_map.listings), dual, args.map))
+        return
+    isin_map = IsinMap.load(args.map)
+    isin = isin_map.get_isin(args.ticker)
+    if isin is None:
+        sys.exit("%s is not in %s" % (args.ticker, args.map))
+    print("%s %s" % (isin, ' '.join(isin_map.get_listings(args.ticker))))
+
+
+if '__main__' == __name__:
+    main()
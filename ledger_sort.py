@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""
+* Sorts a transactions file into the chronological order the realization relies on
+* a streaming scan finds whether any row is out of order, an ordered file is left as it is
+* the order is by date, the rows of a day keep the order they have in the file(stable). A file
+  already in chronological order is never flagged, whatever the order of the buys and the sells
+  within a day
+* external merge sort - runs of at most run_rows rows are sorted in memory and spilled to
+  temporary files, which are merged merge_width at a time until one pass over the remaining ones
+  is left. Memory and open files are bounded whatever the size of the file, a file of a single run
+  is sorted without spilling
+* comment rows(symbol starting with #) stay after the row they follow
+* the sorted file is written atomically(temporary file + rename), so sorting a file in place
+  never leaves it partially written
+
+Usage:
+    python ledger_sort.py transactions.csv --check
+    python ledger_sort.py transactions.csv --output sorted.csv --run-rows 500000
+    python equity_stats.py transactions.csv --sort
+"""
+
+import io
+import os
+import csv
+import sys
+import heapq
+import shutil
+import argparse
+import tempfile
+from itertools import count
+
+import csv23
+
+from transaction_utils import TransactionConstants, TransactionRecord, TransactionDate
+
+
+class LedgerSorter(TransactionConstants):
+    """
+    stable external merge sort of a transactions file by date
+    """
+    ENCODING        = 'utf-8'
+    RUN_ROWS        = 200000
+    MERGE_WIDTH     = 64
+
+    def __init__(self, filename, run_rows=RUN_ROWS, tmp_dir=None, merge_width=MERGE_WIDTH):
+        self.filename = filename
+        self.run_rows = run_rows
+        self.merge_width = max(merge_width, 2)
+        self.tmp_dir = tmp_dir
+        rf_index = TransactionRecord._record_field_index
+        self.symbol_i, self.date_i = rf_index[self.SYMBOL_F], rf_index[self.DATE_F]
+        self.header = None
+        self.spill_count = 0
+
+    def read_keyed_rows(self):
+        """
+        generator of (sort key, row), the key is the date ordinal, a comment row takes the key of
+        the row before it
+        """
+        key = 0
+        with csv23.open_reader(self.filename) as fp:
+            self.header = next(fp, None)
+            for row in fp:
+                if row and row[self.symbol_i][:1] != '#':
+                    key = TransactionDate.parse(row[self.date_i]).toordinal()
+                yield key, row
+
+    def find_disorder(self):
+        """
+        number of the first row(1 based, after the header) out of order, None if the file is in order
+        """
+        last_key = None
+        for number, (key, row) in enumerate(self.read_keyed_rows(), 1):
+            if last_key is not None and key < last_key:
+                return number
+            last_key = key
+        return None
+
+    def is_sorted(self):
+        return self.find_disorder() is None
+
+    def spill(self, run):
+        fd, filename = tempfile.mkstemp(prefix='.ledger_run', suffix='.csv', dir=self.tmp_dir)
+        with io.open(fd, 'w', encoding=self.ENCODING, newline='') as fp:
+            writer = csv.writer(fp, lineterminator='\n')
+            for key, seq, row in run:
+                writer.writerow([key, seq] + row)
+        self.spill_count += 1
+        return filename
+
+    @classmethod
+    def read_run(cls, filename):
+        with io.open(filename, 'r', encoding=cls.ENCODING, newline='') as fp:
+            for row in csv.reader(fp):
+                yield int(row[0]), int(row[1]), row[2:]
+
+    def get_runs(self):
+        """
+        sorted runs of the file - the last one in memory, the others in spill files
+        """
+        run_files, run, seq = [], [], count()
+        for key, row in self.read_keyed_rows():
+            run.append((key, next(seq), row))
+            if len(run) >= self.run_rows:
+                run.sort(key=lambda item: item[:2])
+                run_files.append(self.spill(run))
+                run = []
+        run.sort(key=lambda item: item[:2])
+        return run_files, run
+
+    def sort(self, output=None):
+        """
+        write the sorted rows to output(the file itself by default), returns the number of rows
+        """
+        output = output or self.filename
+        run_files, run = self.get_runs()
+        try:
+            self.merge_runs(run_files)
+            runs = [self.read_run(filename) for filename in run_files] + [iter(run)]
+            rows = heapq.merge(*runs)       # (key, seq) is unique, the rows are never compared
+            return self.write(output, (row for key, seq, row in rows))
+        finally:
+            for filename in run_files:
+                os.remove(filename)
+
+    def merge_runs(self, run_files):
+        """
+        * merges the spill files merge_width at a time into new spill files, in place, until
+          fewer than merge_width are left for the final merge(with the run in memory)
+        * the order of the files does not matter, (key, seq) orders the rows of any of them
+        """
+        while len(run_files) >= self.merge_width:
+            group = run_files[:self.merge_width]
+            run_files.append(self.spill(heapq.merge(*[self.read_run(filename) for filename in group])))
+            del run_files[:self.merge_width]
+            for filename in group:
+                os.remove(filename)
+
+    def write(self, output, rows):
+        output_dir = os.path.dirname(os.path.abspath(output))
+        fd, tmp_filename = tempfile.mkstemp(prefix='.ledger_sort', dir=output_dir)
+        row_count = 0
+        try:
+            with io.open(fd, 'w', encoding=self.ENCODING, newline='') as fp:
+                writer = csv.writer(fp, lineterminator='\n')
+                writer.writerow(self.header)
+                for row in rows:
+                    writer.writerow(row)
+                    row_count += 1
+            getattr(os, 'replace', os.rename)(tmp_filename, output)
+        except Exception:
+            os.remove(tmp_filename)
+            raise
+        return row_count
+
+
+def get_sorted_ledger(filename, run_rows=LedgerSorter.RUN_ROWS):
+    """
+    the file itself if it is in order, else a sorted temporary copy(to be removed by the caller)
+    returns (file name, whether it is a temporary copy)
+    """
+    sorter = LedgerSorter(filename, run_rows)
+    number = sorter.find_disorder()
+    if number is None:
+        return filename, False
+    fd, sorted_filename = tempfile.mkstemp(prefix='.ledger_sorted', suffix='.csv')
+    os.close(fd)
+    try:
+        row_count = sorter.sort(sorted_filename)
+    except Exception:
+        os.remove(sorted_filename)
+        raise
+    sys.stderr.write("%s: row %d is out of order, %d rows sorted(%d spill files)\n" % (
+        filename, number, row_count, sorter.spill_count))
+    return sorted_filename, True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='sort a transactions file into chronological order')
+    parser.add_argument('file_name', help='transactions CSV file')
+    parser.add_argument('--check', action='store_true', help='only report whether the file is in order(exit 1 if not)')
+    parser.add_argument('--output', metavar='FILE', help='write the sorted rows to FILE instead of the file itself')
+    parser.add_argument('--run-rows', type=int, default=LedgerSorter.RUN_ROWS,
+                        help='rows sorted in memory before spilling to a temporary file (default: %(default)s)')
+    parser.add_argument('--merge-width', type=int, default=LedgerSorter.MERGE_WIDTH,
+                        help='spill files merged at a time, i.e. open at once (default: %(default)s)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sorter = LedgerSorter(args.file_name, args.run_rows, merge_width=args.merge_width)
+    number = sorter.find_disorder()
+    if number is None:
+        print("%s is in order" % (args.file_name,))
+        if args.output:
+            shutil.copyfile(args.file_name, args.output)
+        return
+    print("%s: row %d is out of order" % (args.file_name, number))
+    if args.check:
+        sys.exit(1)
+    row_count = sorter.sort(args.output)
+    print("%d rows sorted into %s(%d spill files)" % (row_count, args.output or args.file_name, sorter.spill_count))
+
+
+if '__main__' == __name__:
+    main()
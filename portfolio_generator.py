@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+"""
+* Synthetic transactions file generator in the schema of sample_portfolio.csv, for benchmarks
+* the symbols are the stocks with a Jan 31, 2018 price in lib/ so that the grandfathering lookups
+  succeed, each symbol starts at its Jan 31, 2018 price and takes a random walk
+* the rows are written in chronological order as they are generated, memory stays bounded by the
+  number of symbols irrespective of the number of rows
+* a sell never exceeds the delivery shares held, so the generated file always realizes cleanly
+
+Usage:
+    python portfolio_generator.py --symbols 100 --buys-per-symbol 50 --output /tmp/ledger.csv
+    python portfolio_generator.py --rows 1000000 --pre-2018-ratio 0.5 --output /tmp/ledger_1m.csv
+"""
+
+import sys
+import random
+import argparse
+import datetime
+import csv
+
+from transaction_utils import TransactionConstants
+from stock_exchange_tools import Jan31State
+
+
+class PortfolioGenerator(TransactionConstants):
+    """
+    * every delivery buy is followed, with the given probabilities, by a partial sell of a held
+      stock, an intraday(sqr) buy and sell pair and a dividend of a held stock
+    * pre_2018_ratio of the delivery buys are dated before Jan 31, 2018 and the rest after it,
+      the dates advance evenly over the buys so that the rows stay chronological
+    """
+    HEADER      = ['Symbol', 'Name', 'Type', 'Date', 'Shares', 'Price', 'Amount', 'Brokerage', 'STT', 'Charges', 'Receivable', 'Mode']
+    DATE_FORMAT = '%b %d, %Y'
+    START_DATE  = datetime.date(2012, 1, 2)
+    END_DATE    = datetime.date(2021, 12, 31)
+    MAX_SHARES  = 100
+
+    def __init__(self, symbols=50, buys_per_symbol=20, partial_sell_ratio=0.4, sqr_ratio=0.05,
+                 dividend_ratio=0.02, pre_2018_ratio=0.5, seed=1):
+        self.random = random.Random(seed)
+        price_hash = {}
+        for filename in (Jan31State.JAN31_NSE_FILENAME, Jan31State.JAN31_BSE_FILENAME):
+            price_hash.update(Jan31State.read_jan31_price_hash(filename))
+        tickers = sorted(ticker for ticker, price in price_hash.items() if price > 0)
+        if symbols > len(tickers):
+            raise ValueError("at most %d symbols have a Jan 31, 2018 price" % (len(tickers),))
+        tickers = self.random.sample(tickers, symbols)
+        self.prices = {ticker: float(price_hash[ticker]) for ticker in tickers}
+        self.holdings = {ticker: 0 for ticker in tickers}
+        self.held = []              # tickers with delivery shares, for the sells and dividends
+        self.tickers = tickers
+        self.buy_count = symbols * buys_per_symbol
+        self.partial_sell_ratio = partial_sell_ratio
+        self.sqr_ratio = sqr_ratio
+        self.dividend_ratio = dividend_ratio
+        self.pre_2018_ratio = pre_2018_ratio
+
+    def get_date(self, index):
+        pre_count = int(self.buy_count * self.pre_2018_ratio)
+        if index < pre_count:
+            start, end, count = self.START_DATE, self.JAN31_2018 - datetime.timedelta(days=1), pre_count
+            offset = index
+        else:
+            start, end, count = self.JAN31_2018 + datetime.timedelta(days=1), self.END_DATE, self.buy_count - pre_count
+            offset = index - pre_count
+        return start + datetime.timedelta(days=(end - start).days * offset // max(count, 1))
+
+    def next_price(self, ticker):
+        price = max(self.prices[ticker] * self.random.uniform(0.98, 1.025), 1.0)
+        self.prices[ticker] = price
+        return round(price, 2)
+
+    def trade_row(self, ticker, trade, date_str, shares, price, mode):
+        amount = round(shares * price, 2)
+        brokerage = round(amount * 0.0003, 2)
+        stt = round(amount * 0.001)
+        charges = round(amount * 0.0001 + 0.5, 2)
+        if trade == self.BUY:
+            amount = -amount
+        receivable = round(amount - brokerage - stt - charges, 2)
+        return [
+            ticker, 'Name of %s' % ticker, trade, date_str, shares, '%.2f' % price, '%.2f' % amount,
+            '%.2f' % brokerage, stt, '%.2f' % charges, '%.2f' % receivable, mode
+        ]
+
+    def dividend_row(self, ticker, date_str):
+        amount = '%.2f' % (self.holdings[ticker] * self.random.uniform(0.5, 5))
+        return [ticker, 'Name of %s' % ticker, self.DIV, date_str, 0, 1, amount, 0, 0, 0, amount, self.CAS]
+
+    def rows(self):
+        tickers = self.tickers
+        rand = self.random.random
+        for index in range(self.buy_count):
+            date_str = self.get_date(index).strftime(self.DATE_FORMAT)
+            ticker = tickers[index % len(tickers)]
+            shares = self.random.randint(1, self.MAX_SHARES)
+            if self.holdings[ticker] == 0:
+                self.held.append(ticker)
+            self.holdings[ticker] += shares
+            yield self.trade_row(ticker, self.BUY, date_str, shares, self.next_price(ticker), self.DEL)
+            if rand() < self.partial_sell_ratio:
+                ticker = self.random.choice(self.held)
+                held_shares = self.holdings[ticker]
+                shares = self.random.randint(1, max(held_shares - 1, 1))
+                self.holdings[ticker] = held_shares - shares
+                if self.holdings[ticker] == 0:
+                    self.held.remove(ticker)
+                yield self.trade_row(ticker, self.SEL, date_str, shares, self.next_price(ticker), self.DEL)
+            if rand() < self.sqr_ratio:
+                ticker = self.random.choice(tickers)
+                shares = self.random.randint(1, self.MAX_SHARES)
+                yield self.trade_row(ticker, self.BUY, date_str, shares, self.next_price(ticker), self.SQR)
+                yield self.trade_row(ticker, self.SEL, date_str, shares, self.next_price(ticker), self.SQR)
+            if self.held and rand() < self.dividend_ratio:
+                yield self.dividend_row(self.random.choice(self.held), date_str)
+
+    def write(self, fp):
+        writer = csv.writer(fp, lineterminator='\n')
+        writer.writerow(self.HEADER)
+        count = 0
+        for row in self.rows():
+            writer.writerow(row)
+            count += 1
+        return count
+
+
+def rows_to_buys(rows, partial_sell_ratio=0.4, sqr_ratio=0.05, dividend_ratio=0.02):
+    """
+    number of delivery buys expected to generate about the given number of rows
+    """
+    return max(int(rows / (1 + partial_sell_ratio + 2 * sqr_ratio + dividend_ratio)), 1)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='synthetic transactions file generator')
+    parser.add_argument('--symbols', type=int, default=50, help='number of stocks (default: %(default)s)')
+    parser.add_argument('--buys-per-symbol', type=int, default=20,
+                        help='delivery buys of each stock (default: %(default)s)')
+    parser.add_argument('--rows', type=int,
+                        help='approximate number of rows, sets --buys-per-symbol from --symbols')
+    parser.add_argument('--partial-sell-ratio', type=float, default=0.4,
+                        help='probability of a partial sell after each delivery buy (default: %(default)s)')
+    parser.add_argument('--sqr-ratio', type=float, default=0.05,
+                        help='probability of an intraday buy and sell pair after each delivery buy (default: %(default)s)')
+    parser.add_argument('--dividend-ratio', type=float, default=0.02,
+                        help='probability of a dividend after each delivery buy (default: %(default)s)')
+    parser.add_argument('--pre-2018-ratio', type=float, default=0.5,
+                        help='share of the delivery buys dated before Jan 31, 2018 (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', metavar='FILE', help='write to FILE instead of stdout')
+    args = parser.parse_args(argv)
+    if args.rows is not None:
+        buys = rows_to_buys(args.rows, args.partial_sell_ratio, args.sqr_ratio, args.dividend_ratio)
+        args.buys_per_symbol = max(buys // args.symbols, 1)
+    return args
+
+
+def generate(filename, **kwargs):
+    with open(filename, 'w') as fp:
+        return PortfolioGenerator(**kwargs).write(fp)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    generator = PortfolioGenerator(
+        args.symbols, args.buys_per_symbol, args.partial_sell_ratio, args.sqr_ratio,
+        args.dividend_ratio, args.pre_2018_ratio, args.seed
+    )
+    if args.output is None:
+        generator.write(sys.stdout)
+    else:
+        with open(args.output, 'w') as fp:
+            generator.write(fp)
+
+
+if '__main__' == __name__:
+    main()
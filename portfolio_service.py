@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+
+"""
+* Resident portfolio service - the ledger is loaded and realized once, the queries are answered
+  from memory over a small HTTP API(TCP or Unix socket)
+* every sell is realized as soon as it is added(as in the streaming mode), the realized capital
+  gains and the realized totals of each stock are kept. The open lots stay in the stock queues
+  and are valued at the market price on each holding query
+* quotes go through the quote cache, so a holding query fetches only the quotes older than its ttl.
+  --deadline bounds the wait of each query for its quotes
+* the requests are served one at a time under a lock
+
+API(the tables are written in the report format given by ?format=jsonl|csv|text, jsonl by default)
+    GET  /portfolio                 portfolio realized and holding summaries
+    GET  /realized[?symbol=EXCH:X]  portfolio realized summary or the realized tables of a stock
+    GET  /holding[?symbol=EXCH:X]   portfolio holding summary or the holding tables of a stock
+    POST /transactions              CSV rows(no header) in the body, added in memory only
+    POST /refresh                   add the rows appended to the ledger file since it was read
+
+Usage:
+    python portfolio_service.py sample_portfolio.csv --port 8766
+    python portfolio_service.py sample_portfolio.csv --socket /tmp/portfolio.sock
+    curl 'http://127.0.0.1:8766/holding?symbol=NSE:VBL&format=text'
+"""
+
+import io
+import os
+import csv
+import json
+import time
+import argparse
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    from urlparse import urlparse, parse_qs
+
+from transaction_utils import TransactionRecord, LedgerReader
+from stock_exchange_tools import MarketPricePrefetcher, PrefetchedQuotes, QuoteCache, use_exchange_url
+from equity_stats import Portfolio, Stock
+from reports_summary import StockSummary, PortFolioSummary, REPORT_WRITERS, get_report_writer
+
+
+class StockView(object):
+    """
+    the stock as seen by one query - the realized capital gains or only their totals and the
+    holdings valued for the query, with a StockSummary of its own
+    """
+
+    def __init__(self, stock_obj, realized_list=(), realized_totals=None, holding_list=()):
+        self.symbol = stock_obj.symbol
+        self.name = stock_obj.name
+        self.realized_list = realized_list
+        self.holding_list = holding_list
+        self.stock_summary = StockSummary(self)
+        self.stock_summary.realized_totals = realized_totals
+
+
+class PortfolioView(object):
+    def __init__(self, stock_views):
+        self.stock_hash = dict((stock_view.symbol, stock_view) for stock_view in stock_views)
+
+
+class PortfolioService(object):
+    """
+    the resident portfolio, realized incrementally as the transactions are added
+    """
+
+    def __init__(self, file_name, quote_cache=None, offline=False, deadline=None):
+        self.file_name = file_name
+        self.quote_cache = quote_cache
+        self.offline = offline
+        self.deadline = deadline
+        self.pf = Portfolio(PrefetchedQuotes({}))     # the quotes are fetched per query
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_rows(rows):
+        """
+        transactions of all the rows, validated before any of them is added. ValueError names the
+        first bad row(1 based)
+        """
+        transactions = []
+        for number, row in enumerate(rows, 1):
+            try:
+                transaction = TransactionRecord.create_obj_from_row(row)
+            except Exception as e:
+                raise ValueError("row %d: %s: %s" % (number, e.__class__.__name__, e))
+            if transaction.trade not in Stock.TRADE_TYPES or transaction.mode not in Stock.MODES:
+                raise ValueError("row %d: unknown trade or mode: %s" % (number, row))
+            transactions.append(transaction)
+        return transactions
+
+    def check_sell(self, transaction):
+        """
+        a sell of more shares than held would be left half realized in the stock queues
+        """
+        stock_obj = self.pf.stock_hash.get(transaction.symbol)
+        buy_q = None
+        if stock_obj is not None:
+            buy_q = {Stock.DEL: stock_obj.dbuyq, Stock.SQR: stock_obj.sbuyq}.get(transaction.mode)
+        held = 0
+        for buy_t in buy_q or ():
+            held += buy_t.shares
+            if held >= transaction.shares:
+                return
+        if transaction.shares > held:
+            raise ValueError("sell of %s %s shares of %s, %s held" % (transaction.shares, transaction.mode, transaction.symbol, held))
+
+    def add_transaction(self, transaction):
+        if transaction.trade == Stock.SEL:
+            self.check_sell(transaction)
+        stock_obj = self.pf.process_transaction(transaction)
+        if stock_obj is None or transaction.trade != Stock.SEL:
+            return
+        for cg_obj in stock_obj.realize_iter():
+            stock_obj.stock_summary.add_realized(cg_obj)
+            stock_obj.realized_list.append(cg_obj)
+
+    def add_transactions(self, rows):
+        """
+        the rows are all parsed first, a bad row adds none of them. A transaction that can not be
+        realized(e.g. a sell of more shares than held) stops the batch, the error gives the rows added
+        """
+        count = 0
+        for transaction in self.parse_rows(rows):
+            try:
+                self.add_transaction(transaction)
+            except Exception as e:
+                raise ValueError("row %d: %s: %s(the %d rows before it were added)" % (
+                    count + 1, e.__class__.__name__, e, count))
+            count += 1
+        return count
+
+    def refresh(self):
+        """
+        add the rows appended to the ledger file since the last read. The rows are all parsed
+        first, the offset then advances with each row added so that the rows added before a
+        failure are never read again
+        """
+        if self.offset is None:
+            raise ValueError("%s did not end with a newline when last read, restart the service" % (self.file_name,))
+        ledger = LedgerReader(self.file_name, self.offset)
+        rows, offsets = [], []
+        for row, offset in ledger.iter_offsets():
+            rows.append(row)
+            offsets.append(offset)
+        count = 0
+        for transaction, offset in zip(self.parse_rows(rows), offsets):
+            self.add_transaction(transaction)
+            self.offset = offset
+            count += 1
+        if count == 0:
+            self.offset = ledger.offset
+        return count
+
+    def get_holding_lists(self, stock_list):
+        """
+        holdings of the stocks valued at the market price, the quotes are fetched together
+        """
+        prefetcher = MarketPricePrefetcher(quote_cache=self.quote_cache, offline=self.offline, deadline=self.deadline)
+        try:
+            for stock_obj in stock_list:
+                if stock_obj.dbuyq.is_empty() == False:
+                    prefetcher.prefetch(stock_obj.symbol)
+            return [list(stock_obj.holding_iter(prefetcher.get_quote)) for stock_obj in stock_list]
+        finally:
+            prefetcher.close()
+
+    def get_stock(self, symbol):
+        stock_obj = self.pf.stock_hash.get(symbol)
+        if stock_obj is None:
+            raise KeyError(symbol)
+        return stock_obj
+
+    def write_stock(self, writer, symbol, realized, holding):
+        stock_obj = self.get_stock(symbol)
+        holding_list = self.get_holding_lists([stock_obj])[0] if holding else ()
+        realized_list = stock_obj.realized_list if realized else ()
+        StockView(stock_obj, realized_list, None, holding_list).stock_summary.print_summary(writer)
+
+    def write_portfolio(self, writer, realized, holding):
+        """
+        the realized summaries come from the realized totals, only the holdings are valued
+        """
+        stock_list = list(self.pf.stock_hash.values())
+        holding_lists = self.get_holding_lists(stock_list) if holding else [()] * len(stock_list)
+        stock_views = [
+            StockView(stock_obj, (), stock_obj.stock_summary.realized_totals if realized else None, holding_list)
+            for stock_obj, holding_list in zip(stock_list, holding_lists)
+        ]
+        PortFolioSummary(PortfolioView(stock_views)).print_summary(writer, stock_tables=False)
+
+
+class PortfolioRequestHandler(BaseHTTPRequestHandler):
+    QUERIES = {
+        '/portfolio': (True, True),
+        '/realized': (True, False),
+        '/holding': (False, True),
+    }
+    CONTENT_TYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv', 'text': 'text/plain'}
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path not in self.QUERIES:
+            self.send_error(404)
+            return
+        realized, holding = self.QUERIES[url.path]
+        report_format = query.get('format', ['jsonl'])[0]
+        if report_format not in REPORT_WRITERS:
+            self.send_error(400, 'unknown format %s' % (report_format,))
+            return
+        symbol = query.get('symbol', [None])[0]
+        service = self.server.service
+        fp = io.StringIO()
+        writer = get_report_writer(report_format, fp=fp)
+        try:
+            with service.lock:
+                if symbol is None:
+                    service.write_portfolio(writer, realized, holding)
+                else:
+                    service.write_stock(writer, symbol, realized, holding)
+        except KeyError:
+            self.send_error(404, 'unknown symbol %s' % (symbol,))
+            return
+        except Exception as e:
+            self.send_error(500, '%s: %s' % (e.__class__.__name__, e))
+            return
+        self.send_body(fp.getvalue(), self.CONTENT_TYPES[report_format])
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        try:
+            if url.path == '/transactions':
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf-8')
+                rows = [row for row in csv.reader(io.StringIO(body)) if row]
+                with service.lock:
+                    count = service.add_transactions(rows)
+            elif url.path == '/refresh':
+                with service.lock:
+                    count = service.refresh()
+            else:
+                self.send_error(404)
+                return
+        except Exception as e:
+            self.send_error(400, '%s: %s' % (e.__class__.__name__, e))
+            return
+        self.send_body(json.dumps({'added': count}) + '\n', 'application/json')
+
+    def send_body(self, body, content_type):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', '%s; charset=utf-8' % (content_type,))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return str(self.client_address)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PortfolioServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, PortfolioRequestHandler)
+        self.service = service
+
+
+class UnixPortfolioServer(ThreadingMixIn, UnixStreamServer):
+    """
+    the same API over a Unix socket, e.g. curl --unix-socket
+    """
+    daemon_threads = True
+
+    def __init__(self, path, service):
+        if os.path.exists(path):
+            os.remove(path)
+        UnixStreamServer.__init__(self, path, PortfolioRequestHandler)
+        self.service = service
+
+    def get_request(self):
+        request, client_address = UnixStreamServer.get_request(self)
+        return request, (client_address or 'unix', 0)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='resident portfolio service')
+    parser.add_argument('file_name', help='transactions CSV file in chronological order')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--socket', metavar='PATH', help='serve on a Unix socket instead of TCP')
+    parser.add_argument('--offline', action='store_true',
+                        help='value holdings only from the quote cache, no network requests')
+    parser.add_argument('--cache-file', default=QuoteCache.DEFAULT_FILENAME,
+                        help='market price quote cache file (default: %(default)s)')
+    parser.add_argument('--cache-ttl', type=int, default=QuoteCache.DEFAULT_TTL,
+                        help='seconds for which a cached quote is used without refetching (default: %(default)s)')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='wait at most SECONDS for the quotes, a quote still missing or failed is valued at its '
+                             'last known price in the quote cache')
+    parser.add_argument('--exchange-url',
+                        help='fetch quotes from this server instead of NSE/BSE, e.g. exchange_standin.py')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.exchange_url:
+        use_exchange_url(args.exchange_url)
+    service = PortfolioService(args.file_name, QuoteCache(args.cache_file, args.cache_ttl), args.offline, args.deadline)
+    start = time.time()
+    count = service.refresh()
+    if args.socket:
+        server = UnixPortfolioServer(args.socket, service)
+        address = args.socket
+    else:
+        server = PortfolioServer((args.host, args.port), service)
+        address = 'http://%s:%d' % server.server_address[:2]
+    print("loaded %d transactions in %.3f seconds, serving on %s" % (count, time.time() - start, address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if '__main__' == __name__:
+    main()
@@ -1,21 +1,192 @@
 #!/usr/bin/env python
+import io
+import sys
+import csv
+import bisect
 import datetime, time
-import json, requests
-import texttable
+import json
 from transaction_utils import Precision, Decimal
+from instrumentation import METRICS
 
-def get_table(table_header, header_row, data):
+COSMETIC_VALUE = '*--*'
+STALE_MARK = '*'
+
+def get_table(table_header, header_row, data, fp=None, max_width=230):
     if not data:
         return
+    if fp is None:
+        fp = sys.stdout
+    import texttable     # loaded only when a text report is drawn
     data = [header_row] + data
-    table = texttable.Texttable(230)
+    table = texttable.Texttable(max_width)
     table.header(header_row)
     table.add_rows(data)
     align_row = ['l', 'l'] + ['r'] * (len(header_row) - 2)
     table.set_cols_align(align_row)
     tbl_hdr_len = len(table_header) + 1
-    print("\n%s\n%s\n" % (table_header, '='*tbl_hdr_len))
-    print(table.draw())
+    fp.write("\n%s\n%s\n\n" % (table_header, '='*tbl_hdr_len))
+    fp.write(table.draw() + "\n")
+
+
+class TextReportTable(object):
+    """
+    * rows of a table buffered to be drawn by texttable when the table is closed
+    * the optional columns are drawn only when some row has a value in them, so the tables of live
+      quotes are as before
+        q_age   - age of a cached quote, in seconds
+        stale   - * for the holdings valued at the last known price
+    * a table with an optional column is not limited in width, its numbers are never wrapped
+    """
+    OPTIONAL_FIELDS = ('q_age', 'stale')
+
+    def __init__(self, fp, title, header):
+        self.fp = fp
+        self.title = title
+        self.header = header
+        self.rows = []
+
+    def append(self, row):
+        self.rows.append(row)
+
+    @staticmethod
+    def has_value(value):
+        return bool(value) and value != COSMETIC_VALUE
+
+    def get_columns(self):
+        """
+        indexes of the columns to draw
+        """
+        return [
+            index for index, field in enumerate(self.header)
+            if field not in self.OPTIONAL_FIELDS or any(self.has_value(row[index]) for row in self.rows)
+        ]
+
+    def close(self):
+        with METRICS.stage('render'):
+            columns = self.get_columns()
+            header = [self.header[index] for index in columns]
+            rows = [[row[index] for index in columns] for row in self.rows]
+            max_width = 0 if set(header) & set(self.OPTIONAL_FIELDS) else 230
+            get_table(self.title, header, rows, self.fp, max_width)
+
+
+class StreamReportTable(object):
+    """
+    rows of a table written by the report writer as soon as they are appended
+    """
+
+    def __init__(self, writer, kind, stock, header):
+        self.writer = writer
+        self.kind = kind
+        self.stock = stock
+        self.header = header
+
+    def append(self, row):
+        self.writer.write_row(self.kind, self.stock, self.header, row)
+
+    def close(self):
+        pass
+
+
+class ReportWriter(object):
+    """
+    * writes the report tables to a buffered file(stdout by default) or to the given file object,
+      open_table returns a table to which the rows are appended as they are produced
+    * table kinds - realized_details, realized_summary, holding_details, holding_summary of each
+      stock, portfolio_realized, portfolio_holding of the portfolio and fy_realized of the
+      financial year report
+    * TextReportWriter is the human readable texttable output. CsvReportWriter and
+      JsonLinesReportWriter are machine readable, each row is written as soon as it is appended
+      with the table kind and the stock name. Decimals are written exactly as strings, dates in
+      ISO format and the cosmetic values(*--*) are left empty
+    """
+    FORMAT          = None
+    BUFFER_SIZE     = 1 << 16
+    NEWLINE         = None          # newline of the report file, as in io.open
+    REPORT_FIELDS   = (
+        'name', 'b_date', 's_date', 'shares', 'b_value', 's_value', 'b_price', 's_price', 'u_pgain', 'g_gain',
+        'b_charges', 'b_cost', 'u_cgain', 's_charges', 'n_charges', 'n_gain', 'percent', 'j_price', 'x_price',
+        'stg', 'ltg', 'xltg', 'q_age', 'stale', 'fy'
+    )
+    REPORT_COLUMNS  = ('table', 'stock') + REPORT_FIELDS
+
+    def __init__(self, filename=None, fp=None):
+        self.filename = filename
+        if fp is not None:
+            self.fp = fp
+        elif filename is None:
+            self.fp = sys.stdout
+        else:
+            self.fp = io.open(filename, 'w', self.BUFFER_SIZE, newline=self.NEWLINE)
+
+    @staticmethod
+    def format_value(value):
+        if isinstance(value, str):
+            return None if value == COSMETIC_VALUE else value
+        if isinstance(value, int):
+            return value
+        return str(value)
+
+    def open_table(self, kind, title, header, stock=None):
+        return StreamReportTable(self, kind, stock, header)
+
+    def write_row(self, kind, stock, header, row):
+        raise NotImplementedError
+
+    def close(self):
+        if self.filename is None:
+            self.fp.flush()
+        else:
+            self.fp.close()
+
+
+class TextReportWriter(ReportWriter):
+    FORMAT = 'text'
+
+    def open_table(self, kind, title, header, stock=None):
+        return TextReportTable(self.fp, title, header)
+
+
+class CsvReportWriter(ReportWriter):
+    """
+    one CSV of all the tables with the columns REPORT_COLUMNS, the fields not in a table are empty
+    the file is opened without newline translation, the csv module writes the line endings
+    """
+    FORMAT = 'csv'
+    NEWLINE = ''
+
+    def __init__(self, filename=None, fp=None):
+        super(CsvReportWriter, self).__init__(filename, fp)
+        self.csv_writer = csv.DictWriter(self.fp, self.REPORT_COLUMNS, restval='', lineterminator='\n')
+        self.csv_writer.writeheader()
+
+    def write_row(self, kind, stock, header, row):
+        record = dict(zip(header, map(self.format_value, row)))
+        record['table'] = kind
+        record['stock'] = stock
+        self.csv_writer.writerow(record)
+
+
+class JsonLinesReportWriter(ReportWriter):
+    """
+    one JSON object per row with the table kind, the stock name and the fields of the table
+    """
+    FORMAT = 'jsonl'
+
+    def write_row(self, kind, stock, header, row):
+        record = {'table': kind, 'stock': stock}
+        record.update(zip(header, map(self.format_value, row)))
+        self.fp.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+REPORT_WRITERS = {
+    writer_class.FORMAT: writer_class
+    for writer_class in (TextReportWriter, CsvReportWriter, JsonLinesReportWriter)
+}
+
+
+def get_report_writer(report_format='text', filename=None, fp=None):
+    return REPORT_WRITERS[report_format](filename, fp)
 
 
 
@@ -136,11 +307,72 @@ class DetailsTableRow(object):
     def percent(self):
         return self.cg_obj.gain_perc
 
+    @property
+    def q_age(self):
+        return self.cg_obj.quote_age
+
+    @property
+    def stale(self):
+        return STALE_MARK if self.cg_obj.quote_stale else ''
+
+class GainTotals(object):
+    """
+    * totals of a list of capital gain objects accumulated in one pass, SummaryTableRow derives all
+      its columns from these. Also used as running totals in the streaming mode where the realized
+      capital gain objects are not kept
+    * has the attributes of CapitalGain used for the totals, so totals can be added to totals
+      (e.g. the stock totals to the portfolio totals)
+    """
+    quote_stale = False     # set on the first stale holding, absent from the totals of old checkpoints
+    SUM_ATTRS = (
+        'buy_value', 'sel_value', 'gross_gain', 'buy_charges', 'sel_charges', 'net_charges',
+        'tax_buy_value', 'short_gain', 'long_gain', 'tax_long_gain'
+    )
+
+    def __init__(self, cg_obj_list=()):
+        for attr in self.SUM_ATTRS:
+            setattr(self, attr, 0)
+        self.shares = 0
+        self.jan31_price = None
+        self.quote_age = 0
+        for cg_obj in cg_obj_list:
+            self.add(cg_obj)
+
+    @property
+    def sel_t(self):
+        return self
+
+    def add(self, cg_obj):
+        for attr in self.SUM_ATTRS:
+            setattr(self, attr, getattr(self, attr) + getattr(cg_obj, attr))
+        self.shares += cg_obj.sel_t.shares
+        self.quote_age = max(self.quote_age, cg_obj.quote_age)
+        if cg_obj.quote_stale:
+            self.quote_stale = True
+        if self.jan31_price is None:
+            self.jan31_price = cg_obj.jan31_price
+
+    def subtract(self, totals):
+        """
+        take out totals added earlier(e.g. the old holding totals of a revalued stock), only the
+        sums and the shares. quote_age, quote_stale and jan31_price are left as they are
+        """
+        for attr in self.SUM_ATTRS:
+            setattr(self, attr, getattr(self, attr) - getattr(totals, attr))
+        self.shares -= totals.shares
+
+
 class SummaryTableRow(object):
+    """
+    one summary row of a list of capital gain objects, every column is derived from the totals
+    accumulated once in GainTotals
+    """
 
-    def __init__(self, cg_obj_list):
-        self.cg_obj_list = cg_obj_list
-        self.cosmetic_value = '*--*'
+    def __init__(self, cg_obj_list=(), totals=None):
+        if totals is None:
+            totals = GainTotals(cg_obj_list)
+        self.totals = totals
+        self.cosmetic_value = COSMETIC_VALUE
 
     @property
     def name(self):
@@ -156,7 +388,7 @@ class SummaryTableRow(object):
 
     @property
     def b_value(self):
-        return sum([cg_obj.buy_value for cg_obj in self.cg_obj_list])
+        return self.totals.buy_value
 
     @property
     def h_value(self):
@@ -164,7 +396,7 @@ class SummaryTableRow(object):
 
     @property
     def s_value(self):
-        return sum([cg_obj.sel_value for cg_obj in self.cg_obj_list])
+        return self.totals.sel_value
 
     @property
     def m_value(self):
@@ -172,16 +404,16 @@ class SummaryTableRow(object):
 
     @property
     def g_gain(self):
-        return sum([cg_obj.gross_gain for cg_obj in self.cg_obj_list])
+        return self.totals.gross_gain
 
     @property
     def shares(self):
-        return sum([cg_obj.sel_t.shares for cg_obj in self.cg_obj_list])
+        return self.totals.shares
 
     @property
     def j_price(self):
-        if len(self.cg_obj_list) > 0:
-            return self.cg_obj_list[0].jan31_price
+        if self.totals.jan31_price is not None:
+            return self.totals.jan31_price
         return Precision.DECIMAL_ZERO
 
     @property
@@ -196,8 +428,7 @@ class SummaryTableRow(object):
 
     @property
     def x_price(self):
-        tax_buy_value = sum([cg_obj.tax_buy_value for cg_obj in self.cg_obj_list])
-        return Precision.three(tax_buy_value/self.shares)
+        return Precision.three(self.totals.tax_buy_value/self.shares)
 
     @property
     def s_price(self):
@@ -209,7 +440,7 @@ class SummaryTableRow(object):
 
     @property
     def b_charges(self):
-        return sum([cg_obj.buy_charges for cg_obj in self.cg_obj_list])
+        return self.totals.buy_charges
 
     @property
     def h_charges(self):
@@ -233,11 +464,11 @@ class SummaryTableRow(object):
 
     @property
     def s_charges(self):
-        return sum([cg_obj.sel_charges for cg_obj in self.cg_obj_list])
+        return self.totals.sel_charges
 
     @property
     def n_charges(self):
-        return sum([cg_obj.net_charges for cg_obj in self.cg_obj_list])
+        return self.totals.net_charges
 
     @property
     def n_gain(self):
@@ -245,20 +476,28 @@ class SummaryTableRow(object):
 
     @property
     def stg(self):
-        return sum([cg_obj.short_gain for cg_obj in self.cg_obj_list])
+        return self.totals.short_gain
 
     @property
     def ltg(self):
-        return sum([cg_obj.long_gain for cg_obj in self.cg_obj_list])
+        return self.totals.long_gain
 
     @property
     def xltg(self):
-        return sum([cg_obj.tax_long_gain for cg_obj in self.cg_obj_list])
+        return self.totals.tax_long_gain
 
     @property
     def percent(self):
         return Precision.percent(self.n_gain, self.b_value)
 
+    @property
+    def q_age(self):
+        return self.totals.quote_age
+
+    @property
+    def stale(self):
+        return STALE_MARK if self.totals.quote_stale else ''
+
 
 class StockSummary(object):
 
@@ -266,7 +505,10 @@ class StockSummary(object):
         self.stock_obj = stock_obj
         self.name = self.stock_obj.name
         # realized stuff
+        self.is_built = False           # tables already built(e.g. by a worker process)
         self.realized_status = False
+        self.realized_totals = None     # streaming mode
+        self.realized_summary_row = None
         self.realized_details_table = []
         self.realized_details_title = '%s (Realized Details)' % self.name
         self.realized_details_header = [
@@ -281,33 +523,35 @@ class StockSummary(object):
         ]
         # holding stuff
         self.holding_status = False
+        self.holding_summary_row = None
         self.holding_details_table = []
         self.holding_details_title = '%s (Holding Details)' % self.name
         self.holding_details_header = [
             'b_date', 'shares', 'b_value', 's_value', 'b_price', 's_price', 'u_pgain', 'g_gain', 'b_charges', 'b_cost',
-            'u_cgain', 's_charges', 'n_charges', 'n_gain', 'percent', 'j_price', 'x_price', 'stg', 'ltg', 'xltg'
+            'u_cgain', 's_charges', 'n_charges', 'n_gain', 'percent', 'j_price', 'x_price', 'stg', 'ltg', 'xltg', 'q_age', 'stale'
         ]
         self.holding_summary_table = []
         self.holding_summary_title = '%s (One Line Holding Summary)' % self.name
         self.holding_summary_header = [
             'shares', 'b_value', 's_value', 'b_price', 's_price', 'u_pgain', 'g_gain', 'b_charges', 'b_cost',
-            'u_cgain', 's_charges', 'n_charges', 'n_gain', 'percent', 'j_price', 'stg', 'ltg', 'xltg'
+            'u_cgain', 's_charges', 'n_charges', 'n_gain', 'percent', 'j_price', 'stg', 'ltg', 'xltg', 'q_age', 'stale'
         ]
 
     def create_details_table(self, cg_obj_list, table_tuple):
         t_table, t_header = table_tuple
         flag = False
         for cg_obj in cg_obj_list:
-            cg_obj.calculate()
+            if cg_obj.is_calculated == False:
+                cg_obj.calculate()
             dt_obj = DetailsTableRow(cg_obj)
             data_row = [getattr(dt_obj, field) for field in t_header]
             t_table.append(data_row)
             flag = True
         return flag
 
-    def create_summary_table(self, cg_obj_list, table_tuple):
+    def create_summary_table(self, totals, table_tuple):
         t_table, t_header = table_tuple
-        st_obj = SummaryTableRow(cg_obj_list)
+        st_obj = SummaryTableRow(totals=totals)
         data_row = [getattr(st_obj, field) for field in t_header]
         t_table.append(data_row)
         return st_obj
@@ -319,14 +563,29 @@ class StockSummary(object):
         data_row = [getattr(st_obj, field) for field in t_header]
         t_table.append(data_row)
 
+    def add_realized(self, cg_obj):
+        """
+        streaming mode: fold a realized capital gain into the running totals, the object is not kept
+        only the one line realized summary is available in this mode, not the realized details
+        """
+        cg_obj.calculate()
+        if self.realized_totals is None:
+            self.realized_totals = GainTotals()
+        self.realized_totals.add(cg_obj)
+
     def realized_output(self):
+        rst_tuple = (self.realized_summary_table, self.realized_summary_header)
+        if self.realized_totals is not None:
+            self.realized_summary_row = self.create_summary_table(self.realized_totals, rst_tuple)
+            self.realized_status = True
+            return
         rdt_tuple = (self.realized_details_table, self.realized_details_header)
         self.realized_status = self.create_details_table(self.stock_obj.realized_list, rdt_tuple)
         if self.realized_status == False:
             return
-        rst_tuple = (self.realized_summary_table, self.realized_summary_header)
-        st_obj = self.create_summary_table(self.stock_obj.realized_list, rst_tuple)
+        st_obj = self.create_summary_table(GainTotals(self.stock_obj.realized_list), rst_tuple)
         self.add_final_row(st_obj, rdt_tuple, self.realized_status)
+        self.realized_summary_row = st_obj
 
     def holding_output(self):
         hdt_tuple = (self.holding_details_table, self.holding_details_header)
@@ -334,69 +593,298 @@ class StockSummary(object):
         if self.holding_status == False:
             return
         hst_tuple = (self.holding_summary_table, self.holding_summary_header)
-        st_obj = self.create_summary_table(self.stock_obj.holding_list, hst_tuple)
+        st_obj = self.create_summary_table(GainTotals(self.stock_obj.holding_list), hst_tuple)
         self.add_final_row(st_obj, hdt_tuple, self.holding_status)
+        self.holding_summary_row = st_obj
 
-    def print_summary(self):
-        self.realized_output()
+    def refresh_holding(self):
+        """
+        rebuild the holding tables after the holdings of the stock are revalued
+        """
+        self.holding_status = False
+        self.holding_summary_row = None
+        self.holding_details_table = []
+        self.holding_summary_table = []
         self.holding_output()
+
+    def build_tables(self):
+        with METRICS.stage('summary'):
+            self.realized_output()
+            self.holding_output()
+        self.is_built = True
+
+    def get_tables(self):
+        """
+        compact result of the stock - only the built tables, sent back by the worker processes
+        """
+        return (
+            self.realized_status, self.realized_details_table, self.realized_summary_table, self.realized_summary_row,
+            self.holding_status, self.holding_details_table, self.holding_summary_table, self.holding_summary_row
+        )
+
+    def set_tables(self, tables):
+        (self.realized_status, self.realized_details_table, self.realized_summary_table, self.realized_summary_row,
+         self.holding_status, self.holding_details_table, self.holding_summary_table, self.holding_summary_row) = tables
+        self.is_built = True
+
+    def write_table(self, writer, kind, title, header, table):
+        report_table = writer.open_table(kind, title, header, self.name)
+        for data_row in table:
+            report_table.append(data_row)
+        report_table.close()
+
+    def print_summary(self, writer=None):
+        if writer is None:
+            writer = TextReportWriter()
+        if self.is_built == False:
+            self.build_tables()
         if self.realized_status:
-            get_table(self.realized_details_title, self.realized_details_header, self.realized_details_table)
-            get_table(self.realized_summary_title, self.realized_summary_header, self.realized_summary_table)
+            self.write_table(writer, 'realized_details', self.realized_details_title, self.realized_details_header, self.realized_details_table)
+            self.write_table(writer, 'realized_summary', self.realized_summary_title, self.realized_summary_header, self.realized_summary_table)
         if self.holding_status:
-            get_table(self.holding_details_title, self.holding_details_header, self.holding_details_table)
-            get_table(self.holding_summary_title, self.holding_summary_header, self.holding_summary_table)
+            self.write_table(writer, 'holding_details', self.holding_details_title, self.holding_details_header, self.holding_details_table)
+            self.write_table(writer, 'holding_summary', self.holding_summary_title, self.holding_summary_header, self.holding_summary_table)
 
 
 class PortFolioSummary(object):
+    """
+    * one summary row of each stock and the portfolio totals, the rows are appended to the tables
+      of the report writer as each stock is summarized
+    * the portfolio totals are accumulated once from the stock totals(build_totals), revalue
+      keeps the holding totals up to date when the market prices move
+    """
     def __init__(self, pf_obj):
         self.pf_obj = pf_obj
         self.sum_fields = ('b_value', 's_value', 'b_charges', 's_charges', 'n_charges', 'g_gain', 'n_gain', 'stg', 'ltg', 'xltg')
         self.percent_fields = ('percent', )
-        self.cosmetic_value = '*--*'
+        self.cosmetic_value = COSMETIC_VALUE
         self.name_field = 'name'
 
-        self.r_details_table = []
+        self.r_details_table = None
         self.r_details_title = "PortFolio Realized Summmary"
         self.r_details_header = []
-        self.r_details_finalrow = []
+        self.r_totals = GainTotals()
         self.r_status = False
 
-        self.h_details_table = []
+        self.h_details_table = None
         self.h_details_title = "PortFolio Holding Summmary"
         self.h_details_header = []
-        self.h_details_finalrow = []
+        self.h_totals = GainTotals()
         self.h_status = False
-
-    def add_final_row(self, header, table):
-        data_row = [self.cosmetic_value] * len(header)
-        for sum_field in self.sum_fields:
-            sum_index = header.index(sum_field)
-            assert sum_index >= 0
-            data_row[sum_index] = sum([row[sum_index] for row in table])
-        percent_index = header.index('percent')
-        if percent_index != -1:
-            buy_value_index = header.index('b_value')
-            net_gain_index = header.index('n_gain')
-            data_row[percent_index] = Precision.percent(data_row[net_gain_index], data_row[buy_value_index])
-        table.append(data_row)
-
-    def print_summary(self):
+        self.is_built = False
+
+    def get_totals_row(self, header, totals):
+        """
+        totals of the sum fields and the percent derived from them, the rest are cosmetic
+        """
+        st_obj = SummaryTableRow(totals=totals)
+        final_fields = self.sum_fields + self.percent_fields
+        return [getattr(st_obj, field) if field in final_fields else self.cosmetic_value for field in header]
+
+    def add_final_row(self, header, table, totals):
+        """
+        the portfolio totals are accumulated from the stock totals, the table is not summed again
+        """
+        table.append(self.get_totals_row(header, totals))
+        table.close()
+
+    def build_totals(self):
+        self.r_totals, self.h_totals = GainTotals(), GainTotals()
+        for symbol, stock_obj in self.pf_obj.stock_hash.items():
+            ss = stock_obj.stock_summary
+            if ss.is_built == False:
+                ss.build_tables()
+            if ss.realized_status:
+                self.r_totals.add(ss.realized_summary_row.totals)
+                self.r_status = True
+            if ss.holding_status:
+                self.h_totals.add(ss.holding_summary_row.totals)
+                self.h_status = True
+        self.is_built = True
+
+    def revalue(self, prices, quote_age=0):
+        """
+        * revalue the holdings at new market prices(stock ticker to price), only the stocks in prices
+          are touched - their holding capital gains and tables are rebuilt and the portfolio holding
+          totals are updated by the difference. The work is proportional to the open lots of those stocks
+        * the open lots of a stock left unvalued by a missing quote get their holding rows here
+        * needs the open lots realized in this process(not the case after process_stocks with jobs > 1)
+        """
+        if self.is_built == False:
+            self.build_totals()
+        for stock_ticker, price in prices.items():
+            stock_obj = self.pf_obj.stock_hash.get(stock_ticker)
+            if stock_obj is None:
+                continue
+            ss = stock_obj.stock_summary
+            if ss.holding_status == False and stock_obj.has_holdings() == False:
+                continue
+            if not stock_obj.holding_list and (stock_obj.dbuyq.is_empty() or stock_obj.sellq.is_empty() == False):
+                raise ValueError("holdings of %s are not in this process to revalue" % (stock_ticker,))
+            if ss.holding_status:
+                self.h_totals.subtract(ss.holding_summary_row.totals)
+            stock_obj.revalue_holdings(Precision.three(Decimal(str(price))), quote_age)
+            ss.refresh_holding()
+            self.h_totals.add(ss.holding_summary_row.totals)
+            self.h_status = True
+
+    def print_summary(self, writer=None, stock_tables=True):
+        """
+        stock_tables=False writes only the portfolio tables, the stock tables are built but not written
+        """
+        if writer is None:
+            writer = TextReportWriter()
+        if self.is_built == False:
+            self.build_totals()
+        self.r_details_table = self.h_details_table = None
         for symbol, stock_obj in self.pf_obj.stock_hash.items():
             ss = stock_obj.stock_summary
-            ss.print_summary()
+            if stock_tables:
+                ss.print_summary(writer)
             name = stock_obj.name.split()[0]
             if ss.realized_status:
-                self.r_details_header = [self.name_field] + ss.realized_summary_header
+                if self.r_details_table is None:
+                    self.r_details_header = [self.name_field] + ss.realized_summary_header
+                    self.r_details_table = writer.open_table('portfolio_realized', self.r_details_title, self.r_details_header)
                 self.r_details_table.append([name] + ss.realized_summary_table[-1])
-                self.r_status = True
             if ss.holding_status:
-                self.h_details_header = [self.name_field] + ss.holding_summary_header
+                if self.h_details_table is None:
+                    self.h_details_header = [self.name_field] + ss.holding_summary_header
+                    self.h_details_table = writer.open_table('portfolio_holding', self.h_details_title, self.h_details_header)
                 self.h_details_table.append([name] + ss.holding_summary_table[-1])
-                self.h_status = True
         if self.r_status:
-            self.add_final_row(self.r_details_header, self.r_details_table)
-            get_table(self.r_details_title, self.r_details_header, self.r_details_table)
+            self.add_final_row(self.r_details_header, self.r_details_table, self.r_totals)
         if self.h_status:
-            self.add_final_row(self.h_details_header, self.h_details_table)
-            get_table(self.h_details_title, self.h_details_header, self.h_details_table)
+            self.add_final_row(self.h_details_header, self.h_details_table, self.h_totals)
+
+
+class FinancialYear(object):
+    """
+    Indian financial year(April to March) named by its years, e.g. 2019-20
+    """
+
+    def __init__(self, start_year):
+        self.start_year = start_year
+        self.start = datetime.date(start_year, 4, 1)
+        self.end = datetime.date(start_year + 1, 3, 31)
+        self.name = '%d-%02d' % (start_year, (start_year + 1) % 100)
+
+    @classmethod
+    def parse(cls, name):
+        """
+        2019-20 or 2019
+        """
+        years = name.strip().split('-')
+        start_year = int(years[0])
+        if len(years) > 2 or (len(years) == 2 and int(years[1]) != (start_year + 1) % 100):
+            raise ValueError("invalid financial year %s, expected e.g. 2019-20" % (name,))
+        return cls(start_year)
+
+    @classmethod
+    def parse_range(cls, spec):
+        """
+        list of the financial years of 2019-20 or of a range 2017-18:2019-20
+        """
+        first, _, last = spec.partition(':')
+        first = cls.parse(first)
+        last = cls.parse(last) if last else first
+        if last.start_year < first.start_year:
+            raise ValueError("invalid financial year range %s" % (spec,))
+        return [cls(start_year) for start_year in range(first.start_year, last.start_year + 1)]
+
+
+class SellDateIndex(object):
+    """
+    * realized capital gains of the stocks ordered by the sell date, built once. A date range is
+      found by bisection instead of scanning the realized lists
+    * the totals of each stock are accumulated once per financial year and kept, the totals of
+      a range of years are added up from them
+    """
+
+    def __init__(self, stock_list):
+        entries = sorted(
+            ((cg_obj.sel_t.date, stock_obj, cg_obj) for stock_obj in stock_list for cg_obj in stock_obj.realized_list),
+            key=lambda entry: entry[0]
+        )
+        self.stock_list = stock_list
+        self.dates = [date for date, stock_obj, cg_obj in entries]
+        self.entries = [(stock_obj, cg_obj) for date, stock_obj, cg_obj in entries]
+        self.year_totals = {}
+
+    def get_range(self, start, end):
+        """
+        (stock, capital gain) of the sells from start to end, both inclusive
+        """
+        return self.entries[bisect.bisect_left(self.dates, start):bisect.bisect_right(self.dates, end)]
+
+    def get_year_totals(self, fy):
+        """
+        symbol -> GainTotals of the sells in the financial year
+        """
+        totals = self.year_totals.get(fy.start_year)
+        if totals is None:
+            totals = self.year_totals[fy.start_year] = {}
+            for stock_obj, cg_obj in self.get_range(fy.start, fy.end):
+                if cg_obj.is_calculated == False:
+                    cg_obj.calculate()
+                if stock_obj.symbol not in totals:
+                    totals[stock_obj.symbol] = GainTotals()
+                totals[stock_obj.symbol].add(cg_obj)
+        return totals
+
+    def get_totals(self, years):
+        """
+        symbol -> GainTotals of the sells in the financial years
+        """
+        if len(years) == 1:
+            return self.get_year_totals(years[0])
+        totals = {}
+        for fy in years:
+            for symbol, year_totals in self.get_year_totals(fy).items():
+                if symbol not in totals:
+                    totals[symbol] = GainTotals()
+                totals[symbol].add(year_totals)
+        return totals
+
+
+class FinancialYearSummary(PortFolioSummary):
+    """
+    * realized summary of each stock for the ITR schedules of capital gains - one table per
+      financial year and, for a range of years, one of the whole range. Short term(stg), long term
+      (ltg) and taxable long term(xltg, grandfathered) gains are by the sell date
+    * needs the realized capital gains of the stocks(not the streaming mode)
+    """
+
+    def __init__(self, pf_obj, years):
+        super(FinancialYearSummary, self).__init__(pf_obj)
+        self.years = years
+        self.index = SellDateIndex(list(pf_obj.stock_hash.values()))
+        self.fy_field = 'fy'
+
+    def write_totals(self, writer, fy_name, totals_hash):
+        if not totals_hash:
+            return
+        header = None
+        table, totals = None, GainTotals()
+        for stock_obj in self.index.stock_list:
+            stock_totals = totals_hash.get(stock_obj.symbol)
+            if stock_totals is None:
+                continue
+            if table is None:
+                header = [self.fy_field, self.name_field] + stock_obj.stock_summary.realized_summary_header
+                table = writer.open_table('fy_realized', "FY %s Realized Summary" % (fy_name,), header)
+            st_obj = SummaryTableRow(totals=stock_totals)
+            table.append([fy_name, stock_obj.name.split()[0]] + [getattr(st_obj, field) for field in header[2:]])
+            totals.add(stock_totals)
+        final_row = self.get_totals_row(header, totals)
+        final_row[0] = fy_name
+        table.append(final_row)
+        table.close()
+
+    def print_summary(self, writer=None):
+        if writer is None:
+            writer = TextReportWriter()
+        for fy in self.years:
+            self.write_totals(writer, fy.name, self.index.get_year_totals(fy))
+        if len(self.years) > 1:
+            self.write_totals(writer, '%s:%s' % (self.years[0].name, self.years[-1].name), self.index.get_totals(self.years))
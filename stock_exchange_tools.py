@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 
+import os
+import sys
 import time
 import re
+import random
 import json
-import requests
+import mmap
+import datetime
+import struct
+import threading
+import tempfile
 import csv23
+from collections import namedtuple
+from instrumentation import METRICS, timer
 from decimal import Decimal, getcontext, ROUND_HALF_UP
 getcontext().rounding = ROUND_HALF_UP
 
@@ -46,17 +55,136 @@ class Precision(object):
         return cls.three((num * cls.DECIMAL_HUND)/den)
 
 
+class PriceIndex(object):
+    """
+    * compact index of symbol to price built from price CSV files, sorted by symbol and memory mapped
+    * file layout: header(magic, record count, key width, signature length), signature of the
+      source files(json), then fixed width records of the symbol(space padded) and the price
+      scaled by 10000 as int64. A lookup is a binary search over the records
+    * the index is rebuilt only when the signature(size and modification time) of the source
+      files changes, so the CSV files are not parsed at all otherwise
+    * only the prices looked up are converted to Decimal and kept in memory
+    """
+    MAGIC           = b'PRCIDX01'
+    HEADER_FORMAT   = '<8sIHI'
+    PRICE_FORMAT    = '<q'
+    PRICE_SCALE_EXP = 4
+
+    def __init__(self, index_filename, source_filenames, load_source):
+        """
+        load_source(filename) returns a dict of symbol to Decimal price of one source file
+        """
+        self.index_filename = index_filename
+        self.source_filenames = source_filenames
+        self.load_source = load_source
+        self.mm = None
+        self.price_hash = {}
+
+    def get_signature(self):
+        signature = []
+        for filename in self.source_filenames:
+            stat = os.stat(filename)
+            signature.append([os.path.basename(filename), stat.st_size, int(stat.st_mtime)])
+        return json.dumps(signature).encode()
+
+    def build(self, signature):
+        price_hash = {}
+        for filename in self.source_filenames:
+            price_hash.update(self.load_source(filename))
+        records = sorted((symbol.encode('utf-8'), price) for symbol, price in price_hash.items())
+        key_width = max([len(key) for key, _ in records] or [1])
+        header = struct.pack(self.HEADER_FORMAT, self.MAGIC, len(records), key_width, len(signature))
+        index_dir = os.path.dirname(os.path.abspath(self.index_filename))
+        fd, tmp_filename = tempfile.mkstemp(prefix='.price_index', dir=index_dir)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(header + signature)
+                for key, price in records:
+                    fp.write(key.ljust(key_width))
+                    fp.write(struct.pack(self.PRICE_FORMAT, int(price.scaleb(self.PRICE_SCALE_EXP))))
+            getattr(os, 'replace', os.rename)(tmp_filename, self.index_filename)
+        except Exception:
+            os.remove(tmp_filename)
+            raise
+
+    def read_header(self, mm):
+        header_size = struct.calcsize(self.HEADER_FORMAT)
+        magic, count, key_width, signature_len = struct.unpack(self.HEADER_FORMAT, mm[:header_size])
+        if magic != self.MAGIC:
+            return None
+        signature = mm[header_size:header_size + signature_len]
+        return count, key_width, header_size + signature_len, signature
+
+    def open(self):
+        """
+        map the index, building it first if it is missing or stale
+        """
+        signature = self.get_signature()
+        for attempt in range(2):
+            try:
+                with open(self.index_filename, 'rb') as fp:
+                    mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                header = self.read_header(mm)
+                if header is not None and header[3] == signature:
+                    self.count, self.key_width, self.records_offset, _ = header
+                    self.record_size = self.key_width + struct.calcsize(self.PRICE_FORMAT)
+                    self.mm = mm
+                    return
+                mm.close()
+            except (IOError, OSError, ValueError, struct.error):
+                pass
+            self.build(signature)
+        raise IOError("unable to open price index %s" % (self.index_filename,))
+
+    def lookup(self, symbol):
+        if self.mm is None:
+            self.open()
+        key = symbol.encode('utf-8').ljust(self.key_width)
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            offset = self.records_offset + mid * self.record_size
+            mid_key = self.mm[offset:offset + self.key_width]
+            if mid_key < key:
+                low = mid + 1
+            elif mid_key > key:
+                high = mid
+            else:
+                price_offset = offset + self.key_width
+                (price,) = struct.unpack(self.PRICE_FORMAT, self.mm[price_offset:price_offset + 8])
+                return Decimal(price).scaleb(-self.PRICE_SCALE_EXP)
+        return None
+
+    def get_price(self, symbol):
+        price = self.price_hash.get(symbol)
+        if price is None:
+            price = self.lookup(symbol)
+            if price is None:
+                raise KeyError(symbol)
+            self.price_hash[symbol] = price
+        return price
+
+
 class Jan31State(object):
     """
     * tax on LTCG announced in Budget 2018
     * Purchase price of existing Long Term holdings to be grandfathered using Jan 31 price of the stock
     * this class will load the Jan 31 price for NSE and BSE stocks
     * the attributes are at the class level, object creation not expected but will continue to work
+    * get_price looks up the prebuilt PriceIndex of both the files(JAN31_INDEX_FILENAME), the CSV
+      files are parsed only to rebuild it. load_31jan2018_price_hash still loads all the prices
+    * use_price_store makes get_price look up the last traded price of Jan 31 in an end of day price
+      store(eod_store.py) first. A store without the day falls back to the index, and a symbol in
+      neither takes the last price of the store before Jan 31
     """
     CSV_FILE_READ_MODE  = "rUb"
     JAN31_PRICE_HASH    = {}
     JAN31_NSE_FILENAME  = 'lib/NSE_20180131.csv'
     JAN31_BSE_FILENAME  = 'lib/BSE_20180131.csv'
+    JAN31_INDEX_FILENAME = 'lib/20180131.idx'
+    JAN31_PRICE_INDEX   = None
+    JAN31_DATE          = datetime.date(2018, 1, 31)
+    PRICE_STORE         = None
     SYMBOL_INDEX        = 0
     PRICE_INDEX         = 8
     IS_LOADED           = False
@@ -66,14 +194,18 @@ class Jan31State(object):
         return row[cls.SYMBOL_INDEX], row[cls.PRICE_INDEX]
 
     @classmethod
-    def set_jan31_price_hash(cls, filename):
+    def read_jan31_price_hash(cls, filename):
         with csv23.open_reader(filename) as fp:
             next(fp)
             stock_price_hash = {
                 symbol: Precision.four(Decimal(price))
                 for (symbol, price) in map(cls.get_symbol_price, fp)
             }
-        cls.JAN31_PRICE_HASH.update(stock_price_hash)
+        return stock_price_hash
+
+    @classmethod
+    def set_jan31_price_hash(cls, filename):
+        cls.JAN31_PRICE_HASH.update(cls.read_jan31_price_hash(filename))
 
     @classmethod
     def load_31jan2018_price_hash(cls):
@@ -82,89 +214,567 @@ class Jan31State(object):
             cls.set_jan31_price_hash(cls.JAN31_BSE_FILENAME)
             cls.IS_LOADED = True
 
+    @classmethod
+    def get_price_index(cls):
+        if cls.JAN31_PRICE_INDEX is None:
+            cls.JAN31_PRICE_INDEX = PriceIndex(
+                cls.JAN31_INDEX_FILENAME, [cls.JAN31_NSE_FILENAME, cls.JAN31_BSE_FILENAME], cls.read_jan31_price_hash
+            )
+        return cls.JAN31_PRICE_INDEX
+
+    @classmethod
+    def use_price_store(cls, store):
+        cls.PRICE_STORE = store
+
     @classmethod
     def get_price(cls, symbol):
-        cls.load_31jan2018_price_hash()
-        return cls.JAN31_PRICE_HASH[symbol]
+        if METRICS.enabled:
+            METRICS.incr('jan31_lookups')
+        store = cls.PRICE_STORE
+        if store is not None:
+            price = store.get_price(symbol, cls.JAN31_DATE, exact=True)
+            if price is not None:
+                return price
+        try:
+            if cls.IS_LOADED:
+                return cls.JAN31_PRICE_HASH[symbol]
+            return cls.get_price_index().get_price(symbol)
+        except KeyError:
+            price = store.get_price(symbol, cls.JAN31_DATE) if store is not None else None
+            if price is None:
+                raise
+            return price
 
     def __init__(self):
         self.load_31jan2018_price_hash()
 
 
-class StockExchange(object):
-    def __init__(self):
-        self.url = ''
-        self.headers = {}
+class PriceProvider(object):
+    """
+    * interface of a source of market prices for one exchange
+    * get_prices takes a list of symbols(without the exchange prefix) and returns a dict of symbol
+      to price string. The default implementation asks for one symbol at a time, providers that
+      can quote several symbols in one request override get_prices and set BATCHES
+    * the symbols without a price may be left out of the dict of a batch
+    * BATCHES - MarketPricePrefetcher asks for the pending symbols of the exchange in one get_prices
+      call instead of one fetch per symbol. NSE and BSE have no batch endpoint, only the stand-in
+      server(exchange_standin.StandinBatchProvider) has one
+    """
+    EXCHANGE = None
+    BATCHES = False
+
+    def get_price(self, symbol):
+        raise NotImplementedError
+
+    def get_prices(self, symbols):
+        return {symbol: self.get_price(symbol) for symbol in symbols}
+
+
+class Quote(namedtuple('Quote', ['price', 'age', 'stale'])):
+    """
+    * market price of a stock along with the age of the quote in seconds
+    * stale - the last known price used in place of a late or failed fetch
+    * a missing quote(no price is known) has the price None, the holdings are not valued
+    """
+    __slots__ = ()
+
+    @classmethod
+    def missing(cls):
+        return cls(None, None, True)
+
+
+class QuoteError(ValueError):
+    """
+    a quote page without a usable price, or no request made as the circuit of the exchange is open
+    """
+
+
+class CircuitBreaker(object):
+    """
+    * guards the requests to one exchange - after failure_threshold consecutive failures the circuit
+      opens and the quotes of the exchange fail at once, without a request
+    * once reset_timeout seconds have passed one request is let through(half open). Its success
+      closes the circuit, its failure opens it again
+    * shared by the prefetch threads, the state changes under a lock
+    """
+    FAILURE_THRESHOLD   = 5
+    RESET_TIMEOUT       = 30    # seconds
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial == False and timer() - self.opened_at >= self.reset_timeout:
+                self.trial = True
+                return True
+            return False
+
+    def record(self, success):
+        with self.lock:
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                    self.opened_at = timer()
+                    if METRICS.enabled:
+                        METRICS.incr('circuit_opens', exchange=self.name)
+            self.trial = False
+
+
+class StockExchange(PriceProvider):
+    """
+    * base class for the exchanges, scrapes the quote page of a symbol
+    * one pooled requests.Session is kept per exchange so that the connection is reused across
+      quotes. The session is shared by the prefetch threads, hence it is created under a lock
+    * base_url can point the exchange to another server(e.g. exchange_standin.py) serving the
+      same paths
+    * every request has a (connect, read) TIMEOUT. A failed request or a page without a price is
+      retried up to RETRIES times after a backoff of a random time up to BACKOFF x 2^attempt
+      seconds(full jitter, capped at MAX_BACKOFF), all behind the CircuitBreaker of the exchange
+    """
+    POOL_SIZE   = 8
+    BASE_URL    = ''
+    QUOTE_PATH  = ''
+    HEADERS     = {}
+    TIMEOUT     = (5, 15)   # seconds to connect, seconds between bytes read
+    RETRIES     = 2
+    BACKOFF     = 0.5       # seconds
+    MAX_BACKOFF = 4
+    # requests.RequestException derives from IOError, the page parsers raise the rest
+    RETRY_ERRORS = (IOError, OSError, ValueError, KeyError, IndexError, TypeError)
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url or self.BASE_URL
+        self.url = self.base_url + self.QUOTE_PATH
+        self.headers = dict(self.HEADERS)
+        if base_url is not None:
+            self.headers.pop('Host', None)
+        self.session = None
+        self.session_lock = threading.Lock()
+        self.breaker = CircuitBreaker(self.EXCHANGE)
+
+    def get_session(self):
+        with self.session_lock:
+            if self.session is None:
+                import requests     # the network stack is loaded on the first request
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.session = session
+        return self.session
 
     def scrape(self, symbol):
         url = self.url % symbol
-        rsp = requests.get(url, headers=self.headers)
+        if METRICS.enabled == False:
+            rsp = self.get_session().get(url, headers=self.headers, timeout=self.TIMEOUT)
+        else:
+            start = timer()
+            try:
+                rsp = self.get_session().get(url, headers=self.headers, timeout=self.TIMEOUT)
+            finally:
+                METRICS.incr('quote_requests', exchange=self.EXCHANGE)
+                METRICS.observe('quote_latency_seconds', timer() - start, exchange=self.EXCHANGE)
+        rsp.raise_for_status()
         return rsp
 
+    def get_backoff(self, attempt):
+        return random.uniform(0, min(self.MAX_BACKOFF, self.BACKOFF * (1 << attempt)))
+
+    def fetch(self, query, parse):
+        """
+        parse(content of the page of the query) with the retries, failing with the last error
+        """
+        attempt = 0
+        while True:
+            if self.breaker.allow() == False:
+                raise QuoteError("circuit open for %s, no request for %s" % (self.EXCHANGE, query))
+            try:
+                result = parse(self.scrape(query).content)
+            except self.RETRY_ERRORS:
+                self.breaker.record(False)
+                if attempt >= self.RETRIES:
+                    raise
+            else:
+                self.breaker.record(True)
+                return result
+            if METRICS.enabled:
+                METRICS.incr('quote_retries', exchange=self.EXCHANGE)
+            time.sleep(self.get_backoff(attempt))
+            attempt += 1
+
+    def parse_price(self, content):
+        raise NotImplementedError
+
+    def get_price(self, symbol):
+        return self.fetch(symbol, self.parse_price)
+
 
 class NSE(StockExchange):
-    def __init__(self):
-        super(NSE, self).__init__()
-        self.url = 'https://www.nseindia.com/live_market/dynaContent/live_watch/get_quote/GetQuote.jsp?symbol=%s&illiquid=0&smeFlag=0&itpFlag=0'
-        self.url = 'https://www1.nseindia.com/live_market/dynaContent/live_watch/get_quote/GetQuote.jsp?symbol=%s'
-        self.any_re = re.compile(r'\{<div\s+id="responseDiv"\s+style="display:none">\s+(\{.*?\{.*?\}.*?\})')
-        self.any_re = re.compile(r'<div\s+id="responseDiv"\s+style="display:none">\s+(\{.*?\{.*?\}.*?\})')
-        self.headers = {
-            'Host': 'www1.nseindia.com', 
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:79.0) Gecko/20100101 Firefox/79.0',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            #'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Pragma': 'no-cache',
-            'Cache-Control': 'no-cache',
-            #'Referer': self.url % 'INFY',
-            #'X-Requested-With': 'XMLHttpRequest'
-        }
-
-    def get_market_price(self, symbol):
-        rsp = self.scrape(symbol)
-        price_list = self.any_re.findall(rsp.content.decode())
-        assert len(price_list) == 1
+    EXCHANGE    = 'NSE'
+    #BASE_URL   = 'https://www.nseindia.com'
+    #QUOTE_PATH = '/live_market/dynaContent/live_watch/get_quote/GetQuote.jsp?symbol=%s&illiquid=0&smeFlag=0&itpFlag=0'
+    BASE_URL    = 'https://www1.nseindia.com'
+    QUOTE_PATH  = '/live_market/dynaContent/live_watch/get_quote/GetQuote.jsp?symbol=%s'
+    HEADERS     = {
+        'Host': 'www1.nseindia.com',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:79.0) Gecko/20100101 Firefox/79.0',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        #'Accept-Encoding': 'gzip, deflate, br',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Pragma': 'no-cache',
+        'Cache-Control': 'no-cache',
+        #'Referer': self.url % 'INFY',
+        #'X-Requested-With': 'XMLHttpRequest'
+    }
+
+    RESPONSE_PATTERN = r'<div\s+id="responseDiv"\s+style="display:none">\s+(\{.*?\{.*?\}.*?\})'
+
+    def __init__(self, base_url=None):
+        super(NSE, self).__init__(base_url)
+        self.any_re = None      # compiled on the first quote
+
+    def parse_price(self, content):
+        if self.any_re is None:
+            self.any_re = re.compile(self.RESPONSE_PATTERN)
+        price_list = self.any_re.findall(content.decode())
+        if len(price_list) != 1:
+            raise QuoteError("%d price blocks in the %s quote page" % (len(price_list), self.EXCHANGE))
         price_dict = json.loads(price_list[0])
         return price_dict['data'][0]['lastPrice']
 
 class BSE(StockExchange):
-    def __init__(self):
-        super(BSE, self).__init__()
-        self.url = "https://api.bseindia.com/BseIndiaAPI/api/StockReachGraph/w?scripcode=%s&flag=0&fromdate=&todate=&seriesid="
-        self.url = "https://api.bseindia.com/BseIndiaAPI/api/getScripHeaderData/w?Debtflag=&scripcode=%s&seriesid="
-        self.headers = {
-                'Host': 'api.bseindia.com',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:79.0) Gecko/20100101 Firefox/79.0',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                #'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Pragma': 'no-cache',
-                'Cache-Control': 'no-cache',
-                'TE': 'Trailers'
-        }
-
-    def get_market_price(self, symbol):
-        rsp = self.scrape(symbol)
-        json_rsp = json.loads(rsp.content)
+    EXCHANGE    = 'BSE'
+    BASE_URL    = 'https://api.bseindia.com'
+    #QUOTE_PATH = '/BseIndiaAPI/api/StockReachGraph/w?scripcode=%s&flag=0&fromdate=&todate=&seriesid='
+    QUOTE_PATH  = '/BseIndiaAPI/api/getScripHeaderData/w?Debtflag=&scripcode=%s&seriesid='
+    HEADERS     = {
+        'Host': 'api.bseindia.com',
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:79.0) Gecko/20100101 Firefox/79.0',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        #'Accept-Encoding': 'gzip, deflate, br',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+        'Pragma': 'no-cache',
+        'Cache-Control': 'no-cache',
+        'TE': 'Trailers'
+    }
+
+    def parse_price(self, content):
+        json_rsp = json.loads(content)
         price_str = json_rsp["CurrRate"]["LTP"]
-        assert price_str is not None and price_str != ""
+        if price_str is None or price_str.strip() == "":
+            raise QuoteError("no LTP in the %s quote page" % (self.EXCHANGE,))
         return price_str.strip()
 
-nse = NSE()
-bse = BSE()
+
+PRICE_PROVIDERS = {}
+DEFAULT_PROVIDERS = {'NSE': NSE, 'BSE': BSE}     # created on the first quote of the exchange
+PROVIDERS_LOCK = threading.Lock()
+
+def register_price_provider(provider, exchange=None):
+    """
+    make the provider the source of market prices for its exchange(or the given exchange)
+    """
+    PRICE_PROVIDERS[exchange or provider.EXCHANGE] = provider
+
+def get_price_provider(exchange):
+    provider = PRICE_PROVIDERS.get(exchange)
+    if provider is None:
+        with PROVIDERS_LOCK:
+            provider = PRICE_PROVIDERS.get(exchange)
+            if provider is None:
+                provider = PRICE_PROVIDERS[exchange] = DEFAULT_PROVIDERS[exchange]()
+    return provider
+
+def use_exchange_url(base_url):
+    """
+    point both the exchanges to the given server, used with exchange_standin.py
+    """
+    register_price_provider(NSE(base_url))
+    register_price_provider(BSE(base_url))
 
 def get_market_price(stock_ticker):
     market, symbol = stock_ticker.split(':')
-    obj = {'NSE': nse, 'BSE': bse}[market]
-    price_str = obj.get_market_price(symbol)
+    price_str = get_price_provider(market).get_prices([symbol])[symbol]
     return Precision.three(Decimal(price_str))
 
+def get_market_prices(stock_tickers):
+    """
+    market prices of several stock tickers(EXCH:SYMBOL), one get_prices call per exchange. The
+    tickers without a price in the answer of a batch are left out
+    """
+    exchange_symbols = {}
+    for stock_ticker in stock_tickers:
+        market, symbol = stock_ticker.split(':')
+        exchange_symbols.setdefault(market, []).append(symbol)
+    prices = {}
+    for market, symbols in exchange_symbols.items():
+        price_hash = get_price_provider(market).get_prices(symbols)
+        for symbol in symbols:
+            if symbol in price_hash:
+                prices['%s:%s' % (market, symbol)] = Precision.three(Decimal(price_hash[symbol]))
+    return prices
+
+def is_batch_market(market):
+    try:
+        return get_price_provider(market).BATCHES
+    except KeyError:    # unknown exchange, its fetch fails on its own
+        return False
+
+
+def get_market_quote(stock_ticker):
+    """
+    market price along with the age of the quote in seconds, a live quote is always fresh
+    """
+    return Quote(get_market_price(stock_ticker), 0, False)
+
+
+class QuoteCache(object):
+    """
+    * on-disk cache of market prices keyed by the stock ticker(EXCH:SYMBOL)
+    * each entry holds the price string and the epoch time at which it was fetched
+    * the cache is bounded to max_entries, the oldest quotes are evicted first
+    * the file is written atomically(temporary file + rename) so that an interrupted or a
+      concurrent run never sees a partially written cache
+    """
+    DEFAULT_FILENAME    = os.path.join(os.path.expanduser('~'), '.equity_quote_cache.json')
+    DEFAULT_TTL         = 300       # seconds
+    MAX_ENTRIES         = 5000
+    PRICE_INDEX         = 0
+    TIME_INDEX          = 1
+
+    def __init__(self, filename=DEFAULT_FILENAME, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.quotes = {}
+        self.is_dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename) as fp:
+                self.quotes = json.load(fp)
+        except (IOError, OSError, ValueError):
+            self.quotes = {}
+
+    def get(self, stock_ticker, check_ttl=True):
+        """
+        returns the Quote(price, age in seconds) of the cached quote or None if there is no usable quote
+        """
+        entry = self.quotes.get(stock_ticker)
+        if entry is None:
+            return None
+        age = max(0, int(time.time() - entry[self.TIME_INDEX]))
+        if check_ttl and age > self.ttl:
+            return None
+        return Quote(Precision.three(Decimal(entry[self.PRICE_INDEX])), age, False)
+
+    def put(self, stock_ticker, price):
+        self.quotes[stock_ticker] = [str(price), time.time()]
+        self.is_dirty = True
+
+    def evict(self):
+        excess = len(self.quotes) - self.max_entries
+        if excess <= 0:
+            return
+        by_age = sorted(self.quotes, key=lambda ticker: self.quotes[ticker][self.TIME_INDEX])
+        for stock_ticker in by_age[:excess]:
+            del self.quotes[stock_ticker]
+
+    def save(self):
+        if self.is_dirty == False:
+            return
+        self.evict()
+        cache_dir = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp_filename = tempfile.mkstemp(prefix='.quote_cache', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(self.quotes, fp)
+            getattr(os, 'replace', os.rename)(tmp_filename, self.filename)
+        except Exception:
+            os.remove(tmp_filename)
+            raise
+        self.is_dirty = False
+
+
+class BatchQuoteResult(object):
+    """
+    the result of one ticker in a get_market_prices task, with the interface of an AsyncResult
+    """
+
+    def __init__(self, batch_result, stock_ticker):
+        self.batch_result = batch_result
+        self.stock_ticker = stock_ticker
+
+    def get(self, timeout=None):
+        prices = self.batch_result.get(timeout)
+        if self.stock_ticker not in prices:
+            raise QuoteError("no price for %s in the batch quote" % (self.stock_ticker,))
+        return prices[self.stock_ticker]
+
+
+class MarketPricePrefetcher(object):
+    """
+    * fetches market prices of stocks in the background on a bounded thread pool
+    * a fetch is started as soon as a symbol is known to be held, so that the network requests
+      overlap with the realization of the transactions. get_quote only collects the result
+    * quotes younger than the ttl of the quote cache(if any) are served from it without a fetch,
+      in offline mode only the cache is used irrespective of the age of the quotes
+    * deadline(seconds from the creation of the prefetcher) bounds the wait for the fetches. A
+      quote not fetched by then, or whose fetch failed, falls back to the last known price in the
+      quote cache irrespective of its age. The quote is stale, flagged in the holding tables
+    * without any known price(e.g. offline without a cached quote) the quote is missing, it
+      is reported and the holdings of the stock are left out. get_quote never raises, so one bad
+      symbol never aborts the report
+    * the tickers of an exchange whose provider BATCHES are held pending and fetched in one
+      get_market_prices task per exchange when the first quote is collected
+    """
+    PENDING = 'pending'
+    MAX_WORKERS = StockExchange.POOL_SIZE
+
+    def __init__(self, max_workers=MAX_WORKERS, quote_cache=None, offline=False, deadline=None):
+        self.max_workers = max_workers
+        self.quote_cache = quote_cache
+        self.offline = offline
+        self.deadline_time = None if deadline is None else timer() + deadline
+        self.deadline_passed = False
+        self.pool = None
+        self.results = {}
+        self.fallbacks = []     # stock tickers valued at the last known price
+        self.missing = []       # stock tickers without any price
+        self.pending = {}       # exchange -> stock tickers to fetch in one batch
+
+    def get_cached_quote(self, stock_ticker):
+        if self.quote_cache is None:
+            return None
+        return self.quote_cache.get(stock_ticker, check_ttl=not self.offline)
+
+    def prefetch(self, stock_ticker):
+        if stock_ticker in self.results:
+            return
+        quote = self.get_cached_quote(stock_ticker)
+        if quote is not None or self.offline:
+            self.results[stock_ticker] = quote
+            return
+        market = stock_ticker.split(':')[0]
+        if is_batch_market(market):
+            self.pending.setdefault(market, []).append(stock_ticker)
+            self.results[stock_ticker] = self.PENDING
+            return
+        self.results[stock_ticker] = self.get_pool().apply_async(get_market_price, (stock_ticker,))
+
+    def get_pool(self):
+        if self.pool is None:
+            from multiprocessing.pool import ThreadPool
+            self.pool = ThreadPool(self.max_workers)
+        return self.pool
+
+    def fetch_pending(self):
+        for market, stock_tickers in self.pending.items():
+            batch_result = self.get_pool().apply_async(get_market_prices, (stock_tickers,))
+            for stock_ticker in stock_tickers:
+                self.results[stock_ticker] = BatchQuoteResult(batch_result, stock_ticker)
+        self.pending = {}
+
+    def get_fallback_quote(self, stock_ticker, error):
+        quote = None
+        if self.quote_cache is not None:
+            quote = self.quote_cache.get(stock_ticker, check_ttl=False)
+        if quote is None:
+            sys.stderr.write("no quote for %s, its holdings are not valued: %s\n" % (stock_ticker, error))
+            self.missing.append(stock_ticker)
+            return Quote.missing()
+        if METRICS.enabled:
+            METRICS.incr('quote_fallbacks')
+        sys.stderr.write("last known price of %s(%d seconds old) used: %s\n" % (stock_ticker, quote.age, error))
+        self.fallbacks.append(stock_ticker)
+        return quote._replace(stale=True)
+
+    def get_quote(self, stock_ticker):
+        self.prefetch(stock_ticker)
+        result = self.results[stock_ticker]
+        if result is self.PENDING:
+            self.fetch_pending()
+            result = self.results[stock_ticker]
+        if isinstance(result, tuple):
+            return result
+        if result is None:
+            quote = self.get_fallback_quote(stock_ticker, Exception("no cached quote in offline mode"))
+            self.results[stock_ticker] = quote
+            return quote
+        import multiprocessing
+        timeout = None
+        if self.deadline_time is not None:
+            timeout = max(0, self.deadline_time - timer())
+        try:
+            price = result.get(timeout)
+        except multiprocessing.TimeoutError:
+            self.deadline_passed = True
+            quote = self.get_fallback_quote(stock_ticker, Exception("no quote within the deadline"))
+        except Exception as e:
+            quote = self.get_fallback_quote(stock_ticker, e)
+        else:
+            if self.quote_cache is not None:
+                self.quote_cache.put(stock_ticker, price)
+            quote = Quote(price, 0, False)
+        self.results[stock_ticker] = quote
+        return quote
+
+    def get_price(self, stock_ticker):
+        return self.get_quote(stock_ticker)[0]
+
+    def close(self):
+        if self.pool is not None:
+            if self.deadline_passed:
+                self.pool.terminate()   # the fetches still running are not waited for
+            else:
+                self.pool.close()
+                self.pool.join()
+            self.pool = None
+        if self.quote_cache is not None:
+            self.quote_cache.save()
+
+
+class PrefetchedQuotes(object):
+    """
+    * prefetcher interface over quotes fetched beforehand, a dict of stock ticker to Quote
+    * used where the quotes of many portfolios are fetched once(e.g. batch_stats.py), no requests
+      are made from here
+    """
+
+    def __init__(self, quotes):
+        self.quotes = quotes
+
+    def prefetch(self, stock_ticker):
+        pass
+
+    def get_quote(self, stock_ticker):
+        return self.quotes[stock_ticker]
+
+    def get_price(self, stock_ticker):
+        return self.get_quote(stock_ticker)[0]
+
+    def close(self):
+        pass
+
+
 #print(get_market_price('NSE:GICRE'))
 #print(get_market_price('BSE:500285'))
@@ -0,0 +1,85 @@
+"""
+* test case over a generated transactions file(portfolio_generator.py) and its baseline report -
+  the whole file realized in one process with the decimal engine, as equity_stats.py does by
+  default. The other paths(engines, --jobs, --stream, checkpoints, --sort, the service) must give
+  the same report
+* the holdings are valued at the Jan 31, 2018 prices rounded as the fetched quotes, no requests
+"""
+
+import io
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+
+import portfolio_generator
+from benchmark import StubPrefetcher
+from stock_exchange_tools import Precision, Quote
+from equity_stats import Portfolio, load_portfolio
+from reports_summary import PortFolioSummary, get_report_writer
+
+
+class Jan31Quotes(StubPrefetcher):
+
+    def get_quote(self, stock_ticker):
+        price, age, stale = super(Jan31Quotes, self).get_quote(stock_ticker)
+        return Quote(Precision.three(price), age, stale)
+
+
+class LedgerTestCase(unittest.TestCase):
+    SYMBOLS         = 30
+    BUYS_PER_SYMBOL = 12
+    SEED            = 3
+    REPORT_FORMAT   = 'csv'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+        cls.ledger = cls.get_path('ledger.csv')
+        portfolio_generator.generate(cls.ledger, symbols=cls.SYMBOLS, buys_per_symbol=cls.BUYS_PER_SYMBOL, seed=cls.SEED)
+        cls.baseline = cls.get_report(cls.load(cls.ledger))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    @classmethod
+    def get_path(cls, name):
+        return os.path.join(cls.tmp_dir, name)
+
+    @classmethod
+    def read_rows(cls, file_name):
+        """
+        header and rows of a transactions file
+        """
+        with io.open(file_name, newline='') as fp:
+            rows = list(csv.reader(fp))
+        return rows[0], rows[1:]
+
+    @classmethod
+    def write_rows(cls, file_name, header, rows, mode='w'):
+        with io.open(file_name, mode, newline='') as fp:
+            writer = csv.writer(fp, lineterminator='\n')
+            if header is not None:
+                writer.writerow(header)
+            writer.writerows(rows)
+
+    @staticmethod
+    def load(file_name, stream=False):
+        pf = Portfolio(Jan31Quotes())
+        load_portfolio(pf, file_name, stream)
+        return pf
+
+    @classmethod
+    def get_report(cls, pf, gain_engine=None, jobs=1, stock_tables=True):
+        pf.process_stocks(gain_engine, jobs)
+        return cls.write_report(PortFolioSummary(pf), stock_tables)
+
+    @classmethod
+    def write_report(cls, summary, stock_tables=True):
+        fp = io.StringIO()
+        writer = get_report_writer(cls.REPORT_FORMAT, fp=fp)
+        summary.print_summary(writer, stock_tables)
+        writer.close()
+        return fp.getvalue()
@@ -0,0 +1,73 @@
+"""
+batch mode over many ledgers - the accounts of a directory or a manifest, and the held symbols
+found from the raw rows against the holdings of the realized portfolio
+"""
+
+import os
+import unittest
+
+from batch_stats import get_accounts, get_held_symbols
+
+from tests.ledger_case import LedgerTestCase
+
+
+class HeldSymbolsTest(LedgerTestCase):
+
+    def write_ledger(self, name, extra_rows):
+        header, rows = self.read_rows(self.ledger)
+        file_name = self.get_path(name)
+        self.write_rows(file_name, header, rows + [self.get_row(header, rows[0], **fields) for fields in extra_rows])
+        return file_name
+
+    @staticmethod
+    def get_row(header, row, **fields):
+        row = list(row)
+        for field, value in fields.items():
+            row[header.index(field)] = value
+        return row
+
+    def test_same_as_has_holdings(self):
+        file_name = self.write_ledger('cash.csv', [{'Symbol': 'NSE:CASHONLY', 'Mode': 'cash'}])
+        pf = self.load(file_name)
+        held = sorted(symbol for symbol, stock_obj in pf.stock_hash.items() if stock_obj.has_holdings())
+        self.assertIn('NSE:CASHONLY', held)
+        self.assertEqual(get_held_symbols(file_name), held)
+
+    def test_sold_off_and_square_off(self):
+        file_name = self.write_ledger('soldoff.csv', [
+            {'Symbol': 'NSE:SOLDOFF', 'Mode': 'del'},
+            {'Symbol': 'NSE:SOLDOFF', 'Mode': 'del', 'Type': 'Sell'},
+            {'Symbol': 'NSE:INTRADAY', 'Mode': 'sqr'},
+            {'Symbol': 'NSE:INTRADAY', 'Mode': 'sqr', 'Type': 'Sell'},
+        ])
+        held = get_held_symbols(file_name)
+        self.assertNotIn('NSE:SOLDOFF', held)
+        self.assertNotIn('NSE:INTRADAY', held)
+        self.assertEqual(held, get_held_symbols(self.ledger))
+
+
+class AccountsTest(LedgerTestCase):
+
+    def test_directory(self):
+        ledgers = self.get_path('ledgers')
+        os.mkdir(ledgers)
+        for name in ('b.csv', 'a.CSV', 'notes.txt'):
+            open(os.path.join(ledgers, name), 'w').close()
+        self.assertEqual(get_accounts(ledgers), [
+            ('a', os.path.join(ledgers, 'a.CSV')), ('b', os.path.join(ledgers, 'b.csv'))
+        ])
+
+    def test_manifest(self):
+        manifest = self.get_path('manifest.txt')
+        with open(manifest, 'w') as fp:
+            fp.write('# accounts\n\nself, one.csv\nsub/two.csv\n')
+        self.assertEqual(get_accounts(manifest), [
+            ('self', self.get_path('one.csv')), ('two', self.get_path('sub/two.csv'))
+        ])
+        with open(manifest, 'a') as fp:
+            fp.write('two, three.csv\n')
+        self.assertRaises(ValueError, get_accounts, manifest)
+
+
+if '__main__' == __name__:
+    unittest.main()
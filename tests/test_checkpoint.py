@@ -0,0 +1,93 @@
+"""
+checkpointed incremental re-runs - only the appended rows are read, the consumed prefix is hashed
+once per run and a last row without a newline is never checkpointed
+"""
+
+import os
+import unittest
+
+from transaction_utils import LedgerCheckpoint
+from equity_stats import Portfolio, realize_incremental
+from tests.ledger_case import LedgerTestCase, Jan31Quotes
+
+
+class CountingCheckpoint(LedgerCheckpoint):
+    """
+    counts the bytes of the transactions file hashed
+    """
+
+    def __init__(self, filename):
+        super(CountingCheckpoint, self).__init__(filename)
+        self.hashed = 0
+
+    def update_digest(self, digest, ledger_name, start, end):
+        self.hashed += end - start
+        return super(CountingCheckpoint, self).update_digest(digest, ledger_name, start, end)
+
+
+class CheckpointTest(LedgerTestCase):
+
+    def setUp(self):
+        self.header, self.rows = self.read_rows(self.ledger)
+        self.split = len(self.rows) // 2
+        self.file_name = self.get_path('appended.csv')
+        self.checkpoint = CountingCheckpoint(self.get_path('appended.ckpt'))
+        self.write_rows(self.file_name, self.header, self.rows[:self.split])
+
+    def tearDown(self):
+        for file_name in (self.file_name, self.checkpoint.filename):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+    def get_incremental_report(self, checkpoint=None):
+        pf = Portfolio(Jan31Quotes())
+        realize_incremental(pf, self.file_name, checkpoint or self.checkpoint)
+        return self.get_report(pf)
+
+    def test_resume_after_append(self):
+        self.assertEqual(self.get_incremental_report(), self.get_report(self.load(self.file_name, stream=True)))
+        offset = os.path.getsize(self.file_name)
+        self.assertEqual(self.checkpoint.load(self.file_name)[0], offset)
+        self.write_rows(self.file_name, None, self.rows[self.split:], 'a')
+        self.assertEqual(self.checkpoint.load(self.file_name)[0], offset)
+        self.assertEqual(self.get_incremental_report(), self.get_report(self.load(self.ledger, stream=True)))
+        self.assertEqual(self.checkpoint.load(self.file_name)[0], os.path.getsize(self.file_name))
+
+    def test_rerun_without_new_rows(self):
+        first = self.get_incremental_report()
+        self.assertEqual(self.get_incremental_report(), first)
+
+    def test_changed_prefix_rebuilds(self):
+        self.get_incremental_report()
+        edited_rows = [list(row) for row in self.rows]
+        edited_rows[0][self.header.index('Name')] += ' Ltd'
+        self.write_rows(self.file_name, self.header, edited_rows)
+        self.assertEqual(self.checkpoint.load(self.file_name), (0, None))
+        self.assertEqual(self.get_incremental_report(), self.get_report(self.load(self.file_name, stream=True)))
+
+    def test_prefix_hashed_once(self):
+        self.get_incremental_report()
+        self.write_rows(self.file_name, None, self.rows[self.split:], 'a')
+        checkpoint = CountingCheckpoint(self.checkpoint.filename)
+        self.get_incremental_report(checkpoint)
+        self.assertEqual(checkpoint.hashed, os.path.getsize(self.file_name))
+
+    def test_last_row_without_newline(self):
+        """
+        the row is realized but the checkpoint ends before it, the next run reads it again
+        """
+        offset = os.path.getsize(self.file_name)
+        self.write_rows(self.file_name, None, self.rows[self.split:self.split + 1], 'a')
+        with open(self.file_name, 'rb+') as fp:
+            fp.truncate(os.path.getsize(self.file_name) - 1)
+        self.assertEqual(self.get_incremental_report(), self.get_report(self.load(self.file_name, stream=True)))
+        self.assertEqual(self.checkpoint.load(self.file_name)[0], offset)
+        with open(self.file_name, 'ab') as fp:
+            fp.write(b'\n')
+        self.write_rows(self.file_name, None, self.rows[self.split + 1:], 'a')
+        self.assertEqual(self.get_incremental_report(), self.get_report(self.load(self.ledger, stream=True)))
+        self.assertEqual(self.checkpoint.load(self.file_name)[0], os.path.getsize(self.file_name))
+
+
+if '__main__' == __name__:
+    unittest.main()
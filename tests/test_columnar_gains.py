@@ -0,0 +1,78 @@
+"""
+fixed point NumPy engine - the gains of each lot pair against CapitalGain.calculate, the results
+kept in columns until a gain is used and the sell date check
+"""
+
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from transaction_utils import TransactionRecord
+from equity_stats import CapitalGain
+from columnar_gains import ColumnarGainEngine
+
+from tests.ledger_case import LedgerTestCase
+
+
+def get_pair(buy_row, sel_row):
+    buy_t, sel_t = [TransactionRecord.create_obj_from_row(row.split('|')) for row in (buy_row, sel_row)]
+    return CapitalGain(sel_t, buy_t)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class ColumnarGainEngineTest(LedgerTestCase):
+    PAIRS = [
+        # short term loss, negative zero percent is not possible here
+        ('NSE:ABC|Abc|Buy|Jan 02, 2019|10|100.5|-1005|1.25|1|0.5|-1007.75|del',
+         'NSE:ABC|Abc|Sell|Mar 05, 2019|10|99.75|997.5|1.25|1|0.5|994.75|del'),
+        # long term, grandfathered at the Jan 31, 2018 price
+        ('NSE:20MICRONS|20 Microns|Buy|Jun 12, 2016|7|40.15|-281.05|0|0.3|0|-281.35|del',
+         'NSE:20MICRONS|20 Microns|Sell|Aug 01, 2018|7|60.2|421.4|0|0.4|0|421|del'),
+        # long term, sold before Apr 01, 2018 hence not taxable
+        ('NSE:XYZ|Xyz|Buy|Jan 02, 2017|3|20|-60|0|0|0|-60|del',
+         'NSE:XYZ|Xyz|Sell|Mar 02, 2018|3|25.125|75.375|0|0|0|75.375|del'),
+    ]
+
+    def get_pairs(self):
+        return [get_pair(buy_row, sel_row) for buy_row, sel_row in self.PAIRS]
+
+    def test_same_gains(self):
+        cg_list, expected_list = self.get_pairs(), self.get_pairs()
+        ColumnarGainEngine().calculate(cg_list)
+        for cg_obj, expected in zip(cg_list, expected_list):
+            expected.calculate()
+            cg_obj.calculate()
+            for attr in CapitalGain.__slots__:
+                self.assertEqual(repr(getattr(cg_obj, attr)), repr(getattr(expected, attr)), attr)
+
+    def test_gains_set_on_use(self):
+        cg_list = self.get_pairs()
+        ColumnarGainEngine().calculate(cg_list)
+        cg_obj = cg_list[0]
+        self.assertFalse(cg_obj.is_calculated)
+        self.assertIsNotNone(cg_obj.gain_row)
+        cg_obj.calculate()
+        self.assertTrue(cg_obj.is_calculated)
+        self.assertIsNone(cg_obj.gain_row)
+        self.assertFalse(cg_list[1].is_calculated)
+
+    def test_sell_before_buy(self):
+        buy_row, sel_row = self.PAIRS[0]
+        cg_obj = get_pair(buy_row.replace('Jan 02, 2019', 'Apr 02, 2019'), sel_row)
+        self.assertRaises(AssertionError, ColumnarGainEngine().calculate, [cg_obj])
+
+    def test_same_report(self):
+        self.assertEqual(self.get_report(self.load(self.ledger), ColumnarGainEngine()), self.baseline)
+
+    def test_same_report_streaming(self):
+        self.assertEqual(
+            self.get_report(self.load(self.ledger, stream=True), ColumnarGainEngine()),
+            self.get_report(self.load(self.ledger, stream=True))
+        )
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+compact transactions and capital gains - records without a __dict__ sharing their strings and
+share counts, lots packed in the queues and unpacked to the same values
+"""
+
+import unittest
+from decimal import Decimal
+
+from transaction_utils import PackedTransaction, TransactionQueue, TransactionRecord
+from equity_stats import CapitalGain
+
+
+def get_row(symbol='NSE:ABC', shares='10', price='100.5', brokerage='1.1', mode='del'):
+    value = Decimal(shares) * Decimal(price)
+    return [symbol, 'Abc Ltd', 'Buy', 'Jan 02, 2019', shares, price, str(-value), brokerage, '0.7', '0.3',
+            str(-value - 2), mode]
+
+
+class CompactRecordsTest(unittest.TestCase):
+
+    def test_no_dict(self):
+        buy_t = TransactionRecord.create_obj_from_row(get_row())
+        self.assertFalse(hasattr(buy_t, '__dict__'))
+        self.assertFalse(hasattr(CapitalGain(buy_t, buy_t), '__dict__'))
+        self.assertFalse(hasattr(PackedTransaction.pack(buy_t), '__dict__'))
+
+    def test_shared_values(self):
+        first_t, second_t = [TransactionRecord.create_obj_from_row(get_row(price=price)) for price in ('100.5', '101')]
+        for field in ('symbol', 'name', 'trade', 'mode', 'date', 'shares'):
+            self.assertIs(getattr(first_t, field), getattr(second_t, field), field)
+
+    def test_pack(self):
+        for row in (get_row(), get_row(shares='3', price='0.05', brokerage='0'), get_row(mode='cash')):
+            buy_t = TransactionRecord.create_obj_from_row(row)
+            packed_t = PackedTransaction.pack(buy_t)
+            self.assertIsInstance(packed_t, PackedTransaction)
+            unpacked_t = packed_t.unpack()
+            self.assertEqual(unpacked_t, buy_t)
+            self.assertEqual([str(value) for value in unpacked_t], [str(value) for value in buy_t])
+            self.assertIs(unpacked_t.symbol, buy_t.symbol)
+
+    def test_not_packed(self):
+        """
+        negative zero and amounts beyond int64 stay records
+        """
+        for row in (get_row(brokerage='-0'), get_row(price='1E+18')):
+            buy_t = TransactionRecord.create_obj_from_row(row)
+            self.assertIs(PackedTransaction.pack(buy_t), buy_t)
+            self.assertIs(buy_t.unpack(), buy_t)
+
+    def test_queue_packs_the_long_tail(self):
+        queue = TransactionQueue()
+        lots = [TransactionRecord.create_obj_from_row(get_row(shares=str(shares))) for shares in range(1, 8)]
+        for buy_t in lots:
+            queue.put(buy_t, False)
+        kinds = [isinstance(item, PackedTransaction) for item in queue.items]
+        self.assertEqual(kinds, [False] * TransactionQueue.UNPACKED_LOTS + [True] * (7 - TransactionQueue.UNPACKED_LOTS))
+        self.assertEqual(list(queue), lots)
+        for buy_t in lots:
+            self.assertIsInstance(queue.items[0], TransactionRecord)
+            self.assertEqual(queue.get(), buy_t)
+        self.assertTrue(queue.is_empty())
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+end of day price store - ingest of daily files, lookups by symbol and date, and the Jan 31, 2018
+grandfathering prices read from it
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import datetime
+from decimal import Decimal
+
+from stock_exchange_tools import Jan31State
+from eod_store import EodPriceStore, EodPriceFiles
+
+
+class EodStoreTest(unittest.TestCase):
+    HEADER = 'SYMBOL,Name,ISIN,SERIES,OPEN,HIGH,LOW,CLOSE,LAST,TIMESTAMP'
+    DAYS = {
+        'NSE_20180130.csv': {'NSE:20MICRONS': '50.1', 'NSE:NEWCO': '12.25'},
+        'NSE_20180201.csv': {'NSE:20MICRONS': '55.5'},
+        'BSE_20180201.csv': {'BSE:500002': '1600'},
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+        self.store = EodPriceStore(os.path.join(self.tmp_dir, 'eod_prices.bin'))
+        self.ingested = self.store.ingest([self.write_day(name, prices) for name, prices in sorted(self.DAYS.items())])
+
+    def tearDown(self):
+        self.store.close()
+        Jan31State.use_price_store(None)
+        shutil.rmtree(self.tmp_dir)
+
+    def write_day(self, name, prices):
+        filename = os.path.join(self.tmp_dir, name)
+        with io.open(filename, 'w', newline='') as fp:
+            fp.write(u'\n'.join([self.HEADER] + [
+                u'%s,Name,INE000000000,EQ,0,0,0,0,%s,-' % (symbol, price) for symbol, price in sorted(prices.items())
+            ]) + u'\n')
+        return filename
+
+    def test_ingest(self):
+        self.assertEqual(self.ingested, 4)
+        self.store.open()
+        self.assertEqual((self.store.symbol_count, self.store.day_count), (3, 2))
+        self.assertEqual(self.store.trading_days(), [datetime.date(2018, 1, 30), datetime.date(2018, 2, 1)])
+
+    def test_lookup(self):
+        jan30, jan31, feb1 = datetime.date(2018, 1, 30), datetime.date(2018, 1, 31), datetime.date(2018, 2, 1)
+        self.assertEqual(self.store.get_price('NSE:20MICRONS'), Decimal('55.5'))
+        self.assertEqual(self.store.get_price('NSE:20MICRONS', jan30), Decimal('50.1'))
+        self.assertEqual(self.store.get_price('NSE:20MICRONS', jan31), Decimal('50.1'))
+        self.assertIsNone(self.store.get_price('NSE:20MICRONS', jan31, exact=True))
+        self.assertIsNone(self.store.get_price('NSE:NEWCO', datetime.date(2018, 1, 29)))
+        self.assertIsNone(self.store.get_price('NSE:UNKNOWN'))
+        self.assertEqual(self.store.lookup('NSE:NEWCO'), (jan30, 122500))
+        self.assertEqual(self.store.get_prices(feb1, ['NSE:20MICRONS', 'NSE:NEWCO', 'BSE:500002']), {
+            'NSE:20MICRONS': Decimal('55.5'), 'BSE:500002': Decimal('1600'),
+        })
+
+    def test_ingest_again_replaces_day(self):
+        self.store.close()
+        self.store.ingest([self.write_day('NSE_20180201.csv', {'NSE:20MICRONS': '56'})])
+        self.assertEqual(self.store.get_price('NSE:20MICRONS'), Decimal('56'))
+        self.assertEqual(self.store.get_price('NSE:20MICRONS', datetime.date(2018, 1, 30)), Decimal('50.1'))
+
+    def test_same_prices_as_files(self):
+        feb1 = datetime.date(2018, 2, 1)
+        symbols = ['NSE:20MICRONS', 'BSE:500002', 'NSE:NEWCO']
+        self.assertEqual(self.store.get_prices(feb1, symbols), EodPriceFiles(self.tmp_dir).get_prices(feb1, symbols))
+
+    def test_jan31_price_falls_back_to_index(self):
+        """
+        the store has no Jan 31, the lib/ index has the price
+        """
+        Jan31State.use_price_store(self.store)
+        self.assertEqual(Jan31State.get_price('NSE:20MICRONS'), Decimal('52.85'))
+        self.assertEqual(Jan31State.get_price('NSE:NEWCO'), Decimal('12.25'))
+        self.assertRaises(KeyError, Jan31State.get_price, 'NSE:UNKNOWN')
+
+    def test_jan31_price_from_store(self):
+        self.store.close()
+        self.store.ingest([self.write_day('NSE_20180131.csv', {'NSE:20MICRONS': '51'})])
+        Jan31State.use_price_store(self.store)
+        self.assertEqual(Jan31State.get_price('NSE:20MICRONS'), Decimal('51'))
+
+
+if '__main__' == __name__:
+    unittest.main()
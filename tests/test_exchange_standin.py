@@ -0,0 +1,46 @@
+"""
+batch quotes of the stand-in exchange server - one request for the symbols of an exchange, tickers
+that need URL encoding and the circuit breaker named after the exchange
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+
+from exchange_standin import StandinResponses, StandinServer, StandinBatchProvider
+
+
+class StandinBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+        responses_file = os.path.join(self.tmp_dir, 'responses.json')
+        with open(responses_file, 'w') as fp:
+            json.dump({'NSE:M&M': StandinResponses.render('NSE', 'M&M', '745.5')}, fp)
+        self.server = StandinServer(('127.0.0.1', 0), StandinResponses(responses_file))
+        self.server.start()
+        self.provider = StandinBatchProvider(self.server.base_url, 'NSE')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_breaker_named_after_exchange(self):
+        self.assertEqual(self.provider.breaker.name, 'NSE')
+
+    def test_one_request_for_all_symbols(self):
+        prices = self.provider.get_prices(['M&M', 'VBL', 'UNKNOWN'])
+        self.assertEqual(sorted(prices), ['M&M', 'VBL'])
+        self.assertEqual(Decimal(str(prices['M&M'])), Decimal('745.5'))
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_single_price(self):
+        self.assertEqual(Decimal(str(self.provider.get_price('M&M'))), Decimal('745.5'))
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+financial year report - the years and ranges parsed, the sells of a year found by their date
+and the realized totals of each stock per year and over a range of years
+"""
+
+import io
+import json
+import datetime
+import unittest
+
+from reports_summary import FinancialYear, FinancialYearSummary, GainTotals, SellDateIndex, get_report_writer
+
+from tests.ledger_case import LedgerTestCase
+
+
+class FinancialYearTest(unittest.TestCase):
+
+    def test_parse(self):
+        fy = FinancialYear.parse('2019-20')
+        self.assertEqual((fy.name, fy.start, fy.end), ('2019-20', datetime.date(2019, 4, 1), datetime.date(2020, 3, 31)))
+        self.assertEqual(FinancialYear.parse('1999').name, '1999-00')
+        for name in ('2019-21', '2019-20-21', 'fy'):
+            self.assertRaises(ValueError, FinancialYear.parse, name)
+
+    def test_parse_range(self):
+        self.assertEqual([fy.name for fy in FinancialYear.parse_range('2017-18:2019-20')], ['2017-18', '2018-19', '2019-20'])
+        self.assertEqual([fy.name for fy in FinancialYear.parse_range('2018')], ['2018-19'])
+        self.assertRaises(ValueError, FinancialYear.parse_range, '2019-20:2017-18')
+
+
+class FinancialYearSummaryTest(LedgerTestCase):
+
+    def setUp(self):
+        self.pf = self.load(self.ledger)
+        self.pf.realize_stocks()
+        self.realized = [
+            (stock_obj.symbol, cg_obj) for stock_obj in self.pf.stock_hash.values() for cg_obj in stock_obj.realized_list
+        ]
+
+    def get_expected(self, start, end):
+        totals = {}
+        for symbol, cg_obj in self.realized:
+            if start <= cg_obj.sel_t.date <= end:
+                cg_obj.calculate()
+                totals.setdefault(symbol, []).append(cg_obj)
+        return dict((symbol, GainTotals(cg_list)) for symbol, cg_list in totals.items())
+
+    def assert_totals(self, totals, expected):
+        self.assertEqual(sorted(totals), sorted(expected))
+        for symbol in expected:
+            for attr in GainTotals.SUM_ATTRS + ('shares',):
+                self.assertEqual(getattr(totals[symbol], attr), getattr(expected[symbol], attr), (symbol, attr))
+
+    def test_range_inclusive(self):
+        index = SellDateIndex(list(self.pf.stock_hash.values()))
+        day = sorted(cg_obj.sel_t.date for symbol, cg_obj in self.realized)[len(self.realized) // 2]
+        self.assertEqual(
+            sorted(id(cg_obj) for stock_obj, cg_obj in index.get_range(day, day)),
+            sorted(id(cg_obj) for symbol, cg_obj in self.realized if cg_obj.sel_t.date == day)
+        )
+
+    def test_year_totals(self):
+        years = FinancialYear.parse_range('2017-18:2019-20')
+        index = SellDateIndex(list(self.pf.stock_hash.values()))
+        for fy in years:
+            self.assert_totals(index.get_year_totals(fy), self.get_expected(fy.start, fy.end))
+        self.assert_totals(index.get_totals(years), self.get_expected(years[0].start, years[-1].end))
+
+    def test_report(self):
+        years = FinancialYear.parse_range('2018-19:2019-20')
+        fp = io.StringIO()
+        writer = get_report_writer('jsonl', fp=fp)
+        FinancialYearSummary(self.pf, years).print_summary(writer)
+        writer.close()
+        records = [json.loads(line) for line in fp.getvalue().splitlines()]
+        self.assertEqual(set(record['table'] for record in records), set(['fy_realized']))
+        for fy_name, start, end in [(fy.name, fy.start, fy.end) for fy in years] + [
+                ('2018-19:2019-20', years[0].start, years[-1].end)]:
+            expected = self.get_expected(start, end)
+            self.assertTrue(expected)
+            rows = [record for record in records if record['fy'] == fy_name]
+            self.assertEqual(len(rows), len(expected) + 1)
+            self.assertEqual(rows[-1]['name'], None)
+            self.assertEqual(rows[-1]['n_gain'], str(sum(
+                totals.sel_value - totals.buy_value - totals.net_charges for totals in expected.values())))
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+totals of capital gains accumulated in one pass - the sums of the capital gains, totals added to
+and taken out of totals, and the summary row columns derived from them
+"""
+
+import unittest
+from decimal import Decimal
+
+from transaction_utils import Precision, TransactionRecord
+from equity_stats import CapitalGain
+from reports_summary import COSMETIC_VALUE, STALE_MARK, GainTotals, SummaryTableRow
+
+
+def get_gain(buy_row, sel_row):
+    buy_t, sel_t = [TransactionRecord.create_obj_from_row(row.split('|')) for row in (buy_row, sel_row)]
+    cg_obj = CapitalGain(sel_t, buy_t)
+    cg_obj.calculate()
+    return cg_obj
+
+
+class GainTotalsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cg_list = [
+            get_gain('NSE:ABC|Abc|Buy|Jan 02, 2019|10|100.5|-1005|1.25|1|0.5|-1007.75|del',
+                     'NSE:ABC|Abc|Sell|Mar 05, 2019|10|99.75|997.5|1.25|1|0.5|994.75|del'),
+            get_gain('NSE:20MICRONS|20 Microns|Buy|Jan 02, 2017|4|20|-80|0|0.1|0|-80.1|del',
+                     'NSE:20MICRONS|20 Microns|Sell|Jun 05, 2018|4|30.5|122|0|0.2|0|121.8|del'),
+        ]
+        self.cg_list[1].quote_age = 60
+
+    def test_sums(self):
+        totals = GainTotals(self.cg_list)
+        for attr in GainTotals.SUM_ATTRS:
+            self.assertEqual(getattr(totals, attr), sum(getattr(cg_obj, attr) for cg_obj in self.cg_list), attr)
+        self.assertEqual(totals.shares, 14)
+        self.assertEqual(totals.quote_age, 60)
+        self.assertFalse(totals.quote_stale)
+        self.assertEqual(totals.jan31_price, self.cg_list[0].jan31_price)
+
+    def test_totals_of_totals(self):
+        portfolio_totals = GainTotals([GainTotals(self.cg_list[:1]), GainTotals(self.cg_list[1:])])
+        totals = GainTotals(self.cg_list)
+        for attr in GainTotals.SUM_ATTRS + ('shares', 'quote_age'):
+            self.assertEqual(getattr(portfolio_totals, attr), getattr(totals, attr), attr)
+        portfolio_totals.subtract(GainTotals(self.cg_list[1:]))
+        first_totals = GainTotals(self.cg_list[:1])
+        for attr in GainTotals.SUM_ATTRS + ('shares',):
+            self.assertEqual(getattr(portfolio_totals, attr), getattr(first_totals, attr), attr)
+
+    def test_stale(self):
+        self.cg_list[0].quote_stale = True
+        self.assertEqual(SummaryTableRow(self.cg_list).stale, STALE_MARK)
+        self.assertEqual(SummaryTableRow(self.cg_list[1:]).stale, '')
+
+    def test_summary_row(self):
+        row = SummaryTableRow(self.cg_list)
+        b_value = sum(cg_obj.buy_value for cg_obj in self.cg_list)
+        s_value = sum(cg_obj.sel_value for cg_obj in self.cg_list)
+        n_charges = sum(cg_obj.net_charges for cg_obj in self.cg_list)
+        self.assertEqual((row.name, row.b_date, row.s_date), (COSMETIC_VALUE,) * 3)
+        self.assertEqual((row.shares, row.b_value, row.s_value), (14, b_value, s_value))
+        self.assertEqual(row.b_price, Precision.three(b_value / 14))
+        self.assertEqual(row.s_price, Precision.three(s_value / 14))
+        self.assertEqual(row.n_gain, sum(cg_obj.net_gain for cg_obj in self.cg_list))
+        self.assertEqual(row.n_gain, s_value - b_value - n_charges)
+        self.assertEqual(row.percent, Precision.percent(row.n_gain, b_value))
+        self.assertEqual((row.stg, row.ltg), (self.cg_list[0].short_gain, self.cg_list[1].long_gain))
+        self.assertEqual(row.xltg, self.cg_list[1].tax_long_gain)
+        self.assertEqual(SummaryTableRow(totals=row.totals).b_cost, row.b_cost)
+
+    def test_empty(self):
+        totals = GainTotals()
+        self.assertEqual([getattr(totals, attr) for attr in GainTotals.SUM_ATTRS], [0] * len(GainTotals.SUM_ATTRS))
+        self.assertEqual(SummaryTableRow(totals=totals).j_price, Decimal('0'))
+
+
+if '__main__' == __name__:
+    unittest.main()
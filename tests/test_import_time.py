@@ -0,0 +1,19 @@
+"""
+startup of equity_stats - the network stack, texttable, dateutil and NumPy are not imported with
+it, they are loaded only when they are used. The import time itself is in the benchmark.py output
+"""
+
+import unittest
+
+import benchmark
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def test_lazy_modules_not_imported(self):
+        seconds, loaded = benchmark.measure_import_time(runs=1)
+        self.assertEqual(loaded, [])
+
+
+if '__main__' == __name__:
+    unittest.main()
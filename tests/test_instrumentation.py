@@ -0,0 +1,97 @@
+"""
+opt-in metrics of the hot paths - nothing recorded while disabled, counters, stages and histograms
+with labels, the snapshots of the workers merged, the JSON and Prometheus dumps and profile_call
+"""
+
+import os
+import json
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from instrumentation import Histogram, Metrics, profile_call
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.enable()
+
+    def record(self, metrics):
+        metrics.incr('quote_requests', exchange='NSE')
+        metrics.incr('quote_requests', 2, exchange='NSE')
+        metrics.incr('rows_parsed')
+        metrics.observe('quote_seconds', 0.02, exchange='NSE')
+        metrics.observe('quote_seconds', 20, exchange='NSE')
+        with metrics.stage('realize'):
+            pass
+
+    def test_disabled(self):
+        metrics = Metrics()
+        self.record(metrics)
+        self.assertEqual((metrics.counters, metrics.stages, metrics.histograms), ({}, {}, {}))
+
+    def test_recorded(self):
+        self.record(self.metrics)
+        self.assertEqual(self.metrics.counters, {'quote_requests': {(('exchange', 'NSE'),): 3}, 'rows_parsed': {(): 1}})
+        self.assertEqual(self.metrics.stages['realize'][1], 1)
+        histogram = self.metrics.histograms['quote_seconds'][(('exchange', 'NSE'),)]
+        self.assertEqual((histogram.count, histogram.total), (2, 20.02))
+        self.assertEqual(histogram.cumulative_counts()[-2:], [1, 2])      # 20 seconds only in +Inf
+
+    def test_merge(self):
+        self.record(self.metrics)
+        worker = Metrics()
+        worker.enable()
+        self.record(worker)
+        worker.incr('lot_splits')
+        self.metrics.merge(worker.snapshot())
+        self.assertEqual(self.metrics.counters['quote_requests'], {(('exchange', 'NSE'),): 6})
+        self.assertEqual(self.metrics.counters['lot_splits'], {(): 1})
+        self.assertEqual(self.metrics.stages['realize'][1], 2)
+        self.assertEqual(self.metrics.histograms['quote_seconds'][(('exchange', 'NSE'),)].count, 4)
+
+    def test_dumps(self):
+        self.record(self.metrics)
+        summary = json.loads(json.dumps(self.metrics.to_dict()))
+        self.assertEqual(summary['counters']['quote_requests'], {'exchange=NSE': 3})
+        self.assertEqual(summary['histograms']['quote_seconds']['exchange=NSE']['count'], 2)
+        lines = self.metrics.to_prometheus().splitlines()
+        self.assertIn('# TYPE equity_stats_quote_requests_total counter', lines)
+        self.assertIn('equity_stats_quote_requests_total{exchange="NSE"} 3', lines)
+        self.assertIn('equity_stats_rows_parsed_total 1', lines)
+        self.assertIn('equity_stats_stage_calls{stage="realize"} 1', lines)
+        self.assertIn('equity_stats_quote_seconds_bucket{exchange="NSE",le="+Inf"} 2', lines)
+
+    def test_histogram_buckets(self):
+        histogram = Histogram((1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.to_dict()['buckets'], [('1', 2), ('2', 3), ('+Inf', 4)])
+
+
+class ProfileCallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cpu(self):
+        filename = os.path.join(self.tmp_dir, 'cpu.prof')
+        self.assertEqual(profile_call('cpu', filename, sorted, [3, 1, 2]), [1, 2, 3])
+        self.assertGreater(pstats.Stats(filename).total_calls, 0)
+
+    def test_memory(self):
+        filename = os.path.join(self.tmp_dir, 'memory.txt')
+        self.assertEqual(profile_call('memory', filename, list, range(1000)), list(range(1000)))
+        with open(filename) as fp:
+            self.assertTrue(fp.readline().startswith('memory current '))
+
+
+if '__main__' == __name__:
+    unittest.main()
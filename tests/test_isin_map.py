@@ -0,0 +1,104 @@
+"""
+ISIN map of the NSE and BSE listings - built from bhavcopy style files, saved and loaded, one
+quote per company and the lots of both the listings held under the preferred one
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from transaction_utils import TransactionRecord
+from isin_map import IsinMap, ListedQuotes, get_preference
+from equity_stats import Portfolio
+
+from tests.ledger_case import Jan31Quotes
+
+
+class RecordingQuotes(Jan31Quotes):
+
+    def __init__(self):
+        self.prefetched = []
+
+    def prefetch(self, stock_ticker):
+        self.prefetched.append(stock_ticker)
+
+
+class IsinMapTest(unittest.TestCase):
+    FILES = {
+        'NSE_20180131.csv': 'SYMBOL,SERIES,ISIN\nM&M,EQ,INE101A01026\nVBL,EQ,INE200M01013\n',
+        'EQ_ISINCODE_310118.csv': 'SC_CODE,SC_NAME,ISIN_CODE\n500520,M&M,INE101A01026\n500002,ABB,INE117A01022\n',
+        'BSE_20180131.csv': 'SYMBOL,CLOSE\n500520,745\n',
+        'other.csv': 'TICKER,ISIN\nNSE:ABB,INE117A01022\n500325,INE002A01018\n',
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+        self.isin_map = IsinMap()
+        self.counts = {}
+        for name, content in sorted(self.FILES.items()):
+            filename = os.path.join(self.tmp_dir, name)
+            with open(filename, 'w') as fp:
+                fp.write(content)
+            self.counts[name] = self.isin_map.read_file(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build(self):
+        self.assertEqual(self.counts, {
+            'NSE_20180131.csv': 2, 'EQ_ISINCODE_310118.csv': 2, 'BSE_20180131.csv': 0, 'other.csv': 1
+        })
+        self.assertEqual(self.isin_map.get_isin('BSE:500520'), 'INE101A01026')
+        self.assertEqual(sorted(self.isin_map.get_listings('NSE:M&M')), ['BSE:500520', 'NSE:M&M'])
+        self.assertEqual(sorted(self.isin_map.get_listings('NSE:ABB')), ['BSE:500002', 'NSE:ABB'])
+        self.assertEqual(self.isin_map.get_listings('NSE:UNMAPPED'), ['NSE:UNMAPPED'])
+        self.assertIsNone(self.isin_map.get_isin('BSE:500325'))
+
+    def test_first_isin_kept(self):
+        self.assertFalse(self.isin_map.add('NSE:M&M', 'INE000000000'))
+        self.assertEqual(self.isin_map.get_isin('NSE:M&M'), 'INE101A01026')
+
+    def test_save_and_load(self):
+        filename = os.path.join(self.tmp_dir, 'isin_map.csv')
+        self.isin_map.save(filename)
+        loaded = IsinMap.load(filename)
+        self.assertEqual(loaded.isin_hash, self.isin_map.isin_hash)
+        with open(filename) as fp:
+            self.assertEqual(fp.readline(), 'ISIN,TICKER\n')
+
+    def test_preferred(self):
+        self.assertEqual(self.isin_map.get_preferred('BSE:500520'), 'NSE:M&M')
+        self.assertEqual(self.isin_map.get_preferred('NSE:M&M', get_preference('BSE')), 'BSE:500520')
+        self.assertEqual(self.isin_map.get_preferred('NSE:VBL', get_preference('BSE')), 'NSE:VBL')
+        self.assertEqual(get_preference('BSE'), ('BSE', 'NSE'))
+
+    def test_one_quote_per_company(self):
+        quotes = RecordingQuotes()
+        listed_quotes = ListedQuotes(quotes, self.isin_map)
+        for ticker in ('NSE:M&M', 'BSE:500520', 'BSE:500002'):
+            listed_quotes.prefetch(ticker)
+        self.assertEqual(quotes.prefetched, ['NSE:M&M', 'NSE:M&M', 'NSE:ABB'])
+
+    def test_consolidated_lots(self):
+        """
+        shares bought on BSE and sold on NSE are realized together under the NSE listing
+        """
+        rows = [
+            'BSE:500520|M&M|Buy|Jan 02, 2019|10|700|-7000|0|0|0|-7000|del',
+            'NSE:M&M|M&M|Buy|Jan 03, 2019|5|710|-3550|0|0|0|-3550|del',
+            'NSE:M&M|M&M|Sell|Jan 04, 2019|12|720|8640|0|0|0|8640|del',
+        ]
+        pf = Portfolio(Jan31Quotes(), self.isin_map)
+        for row in rows:
+            pf.process_transaction(TransactionRecord.create_obj_from_row(row.split('|')))
+        self.assertEqual(sorted(pf.stock_hash), ['NSE:M&M'])
+        stock_obj = pf.stock_hash['NSE:M&M']
+        stock_obj.realize_whole()
+        self.assertEqual([(cg_obj.buy_t.symbol, cg_obj.sel_t.shares) for cg_obj in stock_obj.realized_list],
+                         [('NSE:M&M', 10), ('NSE:M&M', 2)])
+        self.assertEqual([buy_t.shares for buy_t in stock_obj.dbuyq], [3])
+
+
+if '__main__' == __name__:
+    unittest.main()
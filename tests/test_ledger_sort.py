@@ -0,0 +1,87 @@
+"""
+stable external merge sort of a transactions file by date
+"""
+
+import os
+import random
+import unittest
+from itertools import groupby
+
+from ledger_sort import LedgerSorter, get_sorted_ledger
+
+from tests.ledger_case import LedgerTestCase
+
+
+class LedgerSortTest(LedgerTestCase):
+    RUN_ROWS = 50   # several spill files
+
+    def setUp(self):
+        """
+        the days of the ledger in a random order, the rows of a day stay in their order
+        """
+        self.header, self.rows = self.read_rows(self.ledger)
+        date_i = self.header.index('Date')
+        days = [list(day_rows) for date, day_rows in groupby(self.rows, key=lambda row: row[date_i])]
+        random.Random(self.SEED).shuffle(days)
+        self.file_name = self.get_path('shuffled.csv')
+        self.write_rows(self.file_name, self.header, [row for day_rows in days for row in day_rows])
+
+    def tearDown(self):
+        os.remove(self.file_name)
+
+    def write_day(self, trades):
+        """
+        a chronological file of a buy, then the given trades of one day
+        """
+        rows = [['NSE:ABC', 'Abc', 'Buy', 'Jan 02, 2018', '10', '100', '-1000', '0', '0', '0', '-1000', 'del']]
+        for trade in trades:
+            rows.append(['NSE:ABC', 'Abc', trade, 'Jan 03, 2018', '5', '110', '550', '0', '0', '0', '550', 'del'])
+        self.write_rows(self.file_name, self.header, rows)
+        return rows
+
+    def test_generated_ledger_is_sorted(self):
+        self.assertTrue(LedgerSorter(self.ledger).is_sorted())
+        self.assertEqual(get_sorted_ledger(self.ledger), (self.ledger, False))
+
+    def test_same_day_sell_before_buy_is_sorted(self):
+        rows = self.write_day(['Sell', 'Buy', 'Sell'])
+        sorter = LedgerSorter(self.file_name)
+        self.assertTrue(sorter.is_sorted())
+        self.assertEqual(sorter.sort(), len(rows))
+        self.assertEqual(self.read_rows(self.file_name)[1], rows)
+
+    def test_earlier_day_is_out_of_order(self):
+        rows = self.write_day(['Sell'])
+        self.write_rows(self.file_name, None, [rows[0]], mode='a')
+        self.assertEqual(LedgerSorter(self.file_name).find_disorder(), 3)
+
+    def test_stable_sort_restores_ledger(self):
+        sorted_name, is_copy = get_sorted_ledger(self.file_name, self.RUN_ROWS)
+        try:
+            self.assertTrue(is_copy)
+            self.assertEqual(self.read_rows(sorted_name), (self.header, self.rows))
+        finally:
+            os.remove(sorted_name)
+
+    def test_sort_in_place(self):
+        sorter = LedgerSorter(self.file_name, self.RUN_ROWS)
+        self.assertIsNotNone(sorter.find_disorder())
+        self.assertEqual(sorter.sort(), len(self.rows))
+        self.assertGreater(sorter.spill_count, 1)
+        self.assertEqual(self.read_rows(self.file_name), (self.header, self.rows))
+        self.assertEqual(get_sorted_ledger(self.file_name), (self.file_name, False))
+
+    def test_multi_pass_merge(self):
+        """
+        more spill files than the merge width are merged in several passes
+        """
+        sorter = LedgerSorter(self.file_name, self.RUN_ROWS, merge_width=2)
+        sorter.sort()
+        run_count = -(-len(self.rows) // self.RUN_ROWS) - 1
+        self.assertGreater(sorter.spill_count, run_count)
+        self.assertEqual(self.read_rows(self.file_name), (self.header, self.rows))
+        self.assertEqual(self.get_report(self.load(self.file_name)), self.baseline)
+
+
+if '__main__' == __name__:
+    unittest.main()
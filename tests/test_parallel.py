@@ -0,0 +1,93 @@
+"""
+stocks sharded across worker processes - the tables a shard sends back, the quotes looked up in
+the main process only for the held stocks and the tables set on the stock summaries
+"""
+
+import unittest
+
+from equity_stats import Portfolio, load_portfolio, process_stock_shard
+from instrumentation import METRICS
+from reports_summary import GainTotals, SummaryTableRow
+
+from tests.ledger_case import LedgerTestCase, Jan31Quotes
+
+
+class CountingQuotes(Jan31Quotes):
+
+    def __init__(self):
+        self.quoted = []
+        self.closed = False
+
+    def get_quote(self, stock_ticker):
+        self.quoted.append(stock_ticker)
+        return super(CountingQuotes, self).get_quote(stock_ticker)
+
+    def close(self):
+        self.closed = True
+
+
+class ParallelTest(LedgerTestCase):
+
+    @staticmethod
+    def comparable(tables):
+        """
+        the summary rows(SummaryTableRow) as the sums of their totals
+        """
+        return [
+            [getattr(table.totals, attr) for attr in GainTotals.SUM_ATTRS] if isinstance(table, SummaryTableRow) else table
+            for table in tables
+        ]
+
+    def get_tables(self, pf):
+        return dict(
+            (symbol, self.comparable(stock_obj.stock_summary.get_tables())) for symbol, stock_obj in pf.stock_hash.items()
+        )
+
+    def get_serial_tables(self):
+        pf = self.load(self.ledger)
+        pf.process_stocks()
+        for stock_obj in pf.stock_hash.values():
+            stock_obj.stock_summary.build_tables()
+        return self.get_tables(pf)
+
+    def test_shard_tables(self):
+        pf = self.load(self.ledger)
+        stock_list = list(pf.stock_hash.values())[:4]
+        quotes = dict((stock_obj.symbol, pf.prefetcher.get_quote(stock_obj.symbol)) for stock_obj in stock_list)
+        results, metrics = process_stock_shard((stock_list, quotes, None, False))
+        serial_tables = self.get_serial_tables()
+        self.assertEqual([symbol for symbol, tables in results], [stock_obj.symbol for stock_obj in stock_list])
+        for symbol, tables in results:
+            self.assertEqual(self.comparable(tables), serial_tables[symbol])
+
+    def test_held_stocks_quoted_once(self):
+        quotes = CountingQuotes()
+        pf = Portfolio(quotes)
+        load_portfolio(pf, self.ledger)
+        held = sorted(symbol for symbol, stock_obj in pf.stock_hash.items() if stock_obj.has_holdings())
+        pf.process_stocks(jobs=2)
+        self.assertEqual(sorted(quotes.quoted), held)
+        self.assertTrue(quotes.closed)
+
+    def test_tables_set(self):
+        serial_tables = self.get_serial_tables()
+        for jobs in (2, 3):
+            pf = self.load(self.ledger)
+            pf.process_stocks(jobs=jobs)
+            self.assertTrue(all(stock_obj.stock_summary.is_built for stock_obj in pf.stock_hash.values()))
+            self.assertEqual(self.get_tables(pf), serial_tables)
+
+    def test_metrics_merged(self):
+        METRICS.reset(True)
+        try:
+            pf = self.load(self.ledger)
+            pf.process_stocks(jobs=2)
+            shard_count = min(len(pf.stock_hash), 2 * pf.SHARDS_PER_JOB)
+            self.assertEqual(METRICS.stages['realize'][1], shard_count)
+            self.assertEqual(METRICS.stages['summary'][1], len(pf.stock_hash))
+        finally:
+            METRICS.reset(False)
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,49 @@
+"""
+quotes prefetched by the portfolio once the transactions are read - only for the stocks held
+after realization, all of them before the first quote is asked for
+"""
+
+import unittest
+
+from equity_stats import Portfolio, load_portfolio
+
+from tests.ledger_case import LedgerTestCase, Jan31Quotes
+
+
+class RecordingQuotes(Jan31Quotes):
+
+    def __init__(self):
+        self.prefetched = []
+        self.calls = []
+
+    def prefetch(self, stock_ticker):
+        self.prefetched.append(stock_ticker)
+        self.calls.append('prefetch')
+
+    def get_quote(self, stock_ticker):
+        self.calls.append('get_quote')
+        return super(RecordingQuotes, self).get_quote(stock_ticker)
+
+
+class PrefetchTest(LedgerTestCase):
+
+    def test_held_stocks_only(self):
+        header, rows = self.read_rows(self.ledger)
+        buy = list(rows[0])
+        buy[header.index('Symbol')] = 'NSE:SOLDOFF'
+        sell = list(buy)
+        sell[header.index('Type')] = 'Sell'
+        file_name = self.get_path('soldoff.csv')
+        self.write_rows(file_name, header, rows + [buy, sell])
+        quotes = RecordingQuotes()
+        pf = Portfolio(quotes)
+        load_portfolio(pf, file_name)
+        held = sorted(symbol for symbol, stock_obj in pf.stock_hash.items() if stock_obj.has_holdings())
+        pf.process_stocks()
+        self.assertIn('NSE:SOLDOFF', pf.stock_hash)
+        self.assertEqual(sorted(quotes.prefetched), held)
+        self.assertEqual(quotes.calls, ['prefetch'] * len(held) + ['get_quote'] * len(held))
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+synthetic transactions files and the benchmark harness - the generated rows are reproducible,
+chronological, never sell more than held, and the benchmark times every phase over them
+"""
+
+import io
+import os
+import csv
+import json
+import shutil
+import datetime
+import tempfile
+import unittest
+
+import benchmark
+import portfolio_generator
+from portfolio_generator import PortfolioGenerator
+
+
+class PortfolioGeneratorTest(unittest.TestCase):
+
+    @staticmethod
+    def get_rows(**kwargs):
+        fp = io.StringIO()
+        count = PortfolioGenerator(**kwargs).write(fp)
+        rows = list(csv.reader(io.StringIO(fp.getvalue())))
+        return count, rows[0], rows[1:]
+
+    def test_reproducible(self):
+        count, header, rows = self.get_rows(symbols=5, buys_per_symbol=10, seed=7)
+        self.assertEqual(header, PortfolioGenerator.HEADER)
+        self.assertEqual(count, len(rows))
+        self.assertEqual(self.get_rows(symbols=5, buys_per_symbol=10, seed=7)[2], rows)
+        self.assertNotEqual(self.get_rows(symbols=5, buys_per_symbol=10, seed=8)[2], rows)
+
+    def test_rows(self):
+        count, header, rows = self.get_rows(symbols=8, buys_per_symbol=25, seed=3, pre_2018_ratio=0.25)
+        symbol_i, trade_i, date_i, shares_i, mode_i = [header.index(field) for field in ('Symbol', 'Type', 'Date', 'Shares', 'Mode')]
+        dates = [datetime.datetime.strptime(row[date_i], PortfolioGenerator.DATE_FORMAT).date() for row in rows]
+        self.assertEqual(dates, sorted(dates))
+        buys = [date for date, row in zip(dates, rows) if row[trade_i] == 'Buy' and row[mode_i] == 'del']
+        self.assertEqual(len(buys), 8 * 25)
+        self.assertEqual(len([date for date in buys if date < PortfolioGenerator.JAN31_2018]), 50)
+        held = {}
+        for row in rows:
+            if row[mode_i] != 'del':
+                continue
+            sign = 1 if row[trade_i] == 'Buy' else -1
+            held[row[symbol_i]] = held.get(row[symbol_i], 0) + sign * int(row[shares_i])
+            self.assertGreaterEqual(held[row[symbol_i]], 0)
+        self.assertEqual(len(held), 8)
+
+    def test_rows_to_buys(self):
+        self.assertEqual(portfolio_generator.rows_to_buys(1000, 0, 0, 0), 1000)
+        self.assertEqual(portfolio_generator.rows_to_buys(1000, 0.5, 0.25, 0), 500)
+        self.assertEqual(portfolio_generator.rows_to_buys(0), 1)
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_phases_timed(self):
+        ledger = benchmark.get_ledger(300, 10, self.tmp_dir, 1)
+        self.assertEqual(benchmark.get_ledger(300, 10, self.tmp_dir, 1), ledger)
+        bench = benchmark.Benchmark(ledger, 'csv')
+        rows = bench.run()
+        with open(ledger) as fp:
+            self.assertEqual(rows, len(fp.readlines()) - 1)
+        self.assertEqual(sorted(bench.timings), sorted(benchmark.Benchmark.PHASES))
+        self.assertTrue(all(seconds >= 0 for seconds in bench.timings.values()))
+
+    def test_results_appended(self):
+        results = os.path.join(self.tmp_dir, 'results.jsonl')
+        argv = ['--sizes', '200', '--format', 'jsonl', '--data-dir', self.tmp_dir, '--results', results]
+        for run in range(2):
+            benchmark.main(argv)
+        with open(results) as fp:
+            runs = [json.loads(line) for line in fp]
+        self.assertEqual(len(runs), 2)
+        self.assertEqual((runs[0]['size'], runs[0]['format'], runs[0]['engine']), (200, 'jsonl', 'decimal'))
+        self.assertEqual(sorted(runs[0]['timings']), sorted(benchmark.Benchmark.PHASES))
+        self.assertGreater(runs[0]['import'], 0)
+
+
+if '__main__' == __name__:
+    unittest.main()
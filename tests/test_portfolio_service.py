@@ -0,0 +1,160 @@
+"""
+resident portfolio service - the rows added by /refresh and POST /transactions, a bad row or an
+oversold stock adding nothing more, and the queries of the HTTP API against the whole file report
+"""
+
+import io
+import os
+import csv
+import threading
+import unittest
+
+try:
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import urlopen, Request, HTTPError
+
+from stock_exchange_tools import Jan31State, QuoteCache
+from reports_summary import get_report_writer
+from portfolio_service import PortfolioService, PortfolioServer
+
+from tests.ledger_case import LedgerTestCase
+
+
+class PortfolioServiceTest(LedgerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(PortfolioServiceTest, cls).setUpClass()
+        cls.header, cls.rows = cls.read_rows(cls.ledger)
+        cls.portfolio_baseline = cls.get_report(cls.load(cls.ledger), stock_tables=False)
+        cls.quote_cache = QuoteCache(cls.get_path('quotes.json'))
+        for symbol in set(row[0] for row in cls.rows):
+            cls.quote_cache.put(symbol, Jan31State.get_price(symbol))
+        for entry in cls.quote_cache.quotes.values():
+            entry[QuoteCache.TIME_INDEX] += 3600     # ages of 0 as the fetched quotes of the baseline
+
+    def setUp(self):
+        self.split = len(self.rows) // 2
+        self.file_name = self.get_path('service.csv')
+        self.write_rows(self.file_name, self.header, self.rows[:self.split])
+        self.service = PortfolioService(self.file_name, self.quote_cache, offline=True)
+        self.assertEqual(self.service.refresh(), self.split)
+
+    def get_portfolio(self):
+        fp = io.StringIO()
+        writer = get_report_writer(self.REPORT_FORMAT, fp=fp)
+        self.service.write_portfolio(writer, True, True)
+        return fp.getvalue()
+
+    def test_refresh(self):
+        self.write_rows(self.file_name, None, self.rows[self.split:], 'a')
+        self.assertEqual(self.service.refresh(), len(self.rows) - self.split)
+        self.assertEqual(self.service.offset, os.path.getsize(self.file_name))
+        self.assertEqual(self.service.refresh(), 0)
+        self.assertEqual(self.get_portfolio(), self.portfolio_baseline)
+
+    def test_stock_tables(self):
+        self.service.add_transactions(self.rows[self.split:])
+        symbol = self.rows[0][0]
+        stock_name = self.service.pf.stock_hash[symbol].name
+        fp = io.StringIO()
+        writer = get_report_writer(self.REPORT_FORMAT, fp=fp)
+        self.service.write_stock(writer, symbol, True, True)
+        baseline_rows = [row for row in csv.reader(io.StringIO(self.baseline)) if row[1] == stock_name]
+        self.assertEqual(list(csv.reader(io.StringIO(fp.getvalue())))[1:], baseline_rows)
+
+    def test_refresh_bad_row_adds_nothing(self):
+        rest = self.rows[self.split:]
+        self.write_rows(self.file_name, None, rest[:2] + [['BAD', 'row']] + rest[2:], 'a')
+        offset = self.service.offset
+        before = self.get_portfolio()
+        self.assertRaises(ValueError, self.service.refresh)
+        self.assertEqual(self.service.offset, offset)
+        self.assertEqual(self.get_portfolio(), before)
+        self.write_rows(self.file_name, self.header, self.rows)
+        self.assertEqual(self.service.refresh(), len(rest))
+        self.assertEqual(self.get_portfolio(), self.portfolio_baseline)
+
+    def test_refresh_resumes_after_failed_row(self):
+        """
+        a sell of more shares than held stops the refresh, the rows before it are not read again
+        """
+        rest = self.rows[self.split:]
+        oversell = list(rest[0])
+        oversell[2:5] = ['Sell', oversell[3], '1000000']
+        self.write_rows(self.file_name, None, rest[:1] + [oversell], 'a')
+        self.assertRaises(ValueError, self.service.refresh)
+        self.write_rows(self.file_name, self.header, self.rows)
+        self.assertEqual(self.service.refresh(), len(rest) - 1)
+        self.assertEqual(self.get_portfolio(), self.portfolio_baseline)
+
+    def test_add_transactions_bad_row_adds_nothing(self):
+        before = self.get_portfolio()
+        with self.assertRaises(ValueError) as context:
+            self.service.add_transactions(self.rows[self.split:][:3] + [['BAD', 'row']])
+        self.assertTrue(str(context.exception).startswith('row 4: '))
+        self.assertEqual(self.get_portfolio(), before)
+
+    def test_add_transactions_oversell(self):
+        """
+        the rows before an oversold stock are added, the error tells how many
+        """
+        rest = self.rows[self.split:]
+        oversell = list(rest[1])
+        oversell[2:5] = ['Sell', oversell[3], '1000000']
+        with self.assertRaises(ValueError) as context:
+            self.service.add_transactions([rest[0], oversell])
+        self.assertIn('row 2: ValueError: sell of 1000000 ', str(context.exception))
+        self.assertIn('(the 1 rows before it were added)', str(context.exception))
+        self.assertEqual(self.service.add_transactions(rest[1:]), len(rest) - 1)
+        self.assertEqual(self.get_portfolio(), self.portfolio_baseline)
+
+
+class PortfolioServerTest(PortfolioServiceTest):
+    """
+    the same service over HTTP
+    """
+
+    def setUp(self):
+        super(PortfolioServerTest, self).setUp()
+        self.server = PortfolioServer(('127.0.0.1', 0), self.service)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_url = 'http://%s:%d' % self.server.server_address[:2]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, path, body=None):
+        request = Request(self.base_url + path, body)
+        return urlopen(request, timeout=10).read().decode('utf-8')
+
+    def test_http_queries(self):
+        rest = self.rows[self.split:]
+        fp = io.StringIO()
+        csv.writer(fp, lineterminator='\n').writerows(rest)
+        self.assertIn('"added": %d' % (len(rest),), self.request('/transactions', fp.getvalue().encode('utf-8')))
+        self.assertEqual(self.request('/portfolio?format=csv'), self.portfolio_baseline)
+
+    def test_http_errors(self):
+        with self.assertRaises(HTTPError) as context:
+            self.request('/transactions', b'BAD,row\n')
+        self.assertEqual(context.exception.code, 400)
+        with self.assertRaises(HTTPError) as context:
+            self.request('/holding?symbol=NSE:NOSUCH')
+        self.assertEqual(context.exception.code, 404)
+
+        def write_portfolio(writer, realized, holding):
+            raise ValueError('no quotes')
+        self.service.write_portfolio = write_portfolio
+        with self.assertRaises(HTTPError) as context:
+            self.request('/portfolio')
+        self.assertEqual(context.exception.code, 500)
+
+
+if '__main__' == __name__:
+    unittest.main()
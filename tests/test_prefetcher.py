@@ -0,0 +1,135 @@
+"""
+quotes of MarketPricePrefetcher - fetched, stale(the last known price after a failed or late
+fetch) and missing quotes, and the symbols of a batching provider asked for in one request,
+from price providers of test exchanges
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+
+from stock_exchange_tools import PriceProvider, QuoteError, QuoteCache, MarketPricePrefetcher, register_price_provider
+
+
+class FixedPriceProvider(PriceProvider):
+    """
+    price of every symbol but the failing ones, after a delay
+    """
+
+    def __init__(self, price='10.5', failing=(), delay=0):
+        self.price = price
+        self.failing = failing
+        self.delay = delay
+
+    def get_price(self, symbol):
+        time.sleep(self.delay)
+        if symbol in self.failing:
+            raise QuoteError("no price for %s" % (symbol,))
+        return self.price
+
+
+class BatchPriceProvider(FixedPriceProvider):
+    """
+    all the symbols asked for in one request, the failing ones left out of the answer
+    """
+    BATCHES = True
+
+    def __init__(self, price='10.5', failing=()):
+        super(BatchPriceProvider, self).__init__(price, failing)
+        self.requests = []
+
+    def get_prices(self, symbols):
+        self.requests.append(list(symbols))
+        return {symbol: self.price for symbol in symbols if symbol not in self.failing}
+
+
+class FailingBatchProvider(BatchPriceProvider):
+    """
+    every batch request fails
+    """
+
+    def get_prices(self, symbols):
+        self.requests.append(list(symbols))
+        raise QuoteError("batch request failed")
+
+
+class PrefetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+        self.quote_cache = QuoteCache(os.path.join(self.tmp_dir, 'quotes.json'), ttl=0)
+        self.put_old_quote('TSTA:CACHED', '9.25')
+        register_price_provider(FixedPriceProvider(failing=('CACHED', 'UNKNOWN')), 'TSTA')
+        register_price_provider(FixedPriceProvider(delay=2), 'TSTB')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def put_old_quote(self, stock_ticker, price):
+        self.quote_cache.put(stock_ticker, price)
+        self.quote_cache.quotes[stock_ticker][QuoteCache.TIME_INDEX] -= 60
+
+    def get_quotes(self, stock_tickers, **kwargs):
+        prefetcher = MarketPricePrefetcher(quote_cache=self.quote_cache, **kwargs)
+        for stock_ticker in stock_tickers:
+            prefetcher.prefetch(stock_ticker)
+        quotes = [prefetcher.get_quote(stock_ticker) for stock_ticker in stock_tickers]
+        prefetcher.close()
+        return prefetcher, quotes
+
+    def test_fetched(self):
+        prefetcher, (quote,) = self.get_quotes(['TSTA:LIVE'])
+        self.assertEqual(quote, (Decimal('10.500'), 0, False))
+        self.assertEqual(self.quote_cache.get('TSTA:LIVE', check_ttl=False).price, Decimal('10.500'))
+
+    def test_failed_fetch(self):
+        prefetcher, (stale, missing) = self.get_quotes(['TSTA:CACHED', 'TSTA:UNKNOWN'])
+        self.assertEqual(stale.price, Decimal('9.250'))
+        self.assertTrue(stale.stale)
+        self.assertIsNone(missing.price)
+        self.assertEqual((prefetcher.fallbacks, prefetcher.missing), (['TSTA:CACHED'], ['TSTA:UNKNOWN']))
+
+    def test_deadline(self):
+        self.put_old_quote('TSTB:SLOW', '7')
+        start = time.time()
+        prefetcher, (stale, missing) = self.get_quotes(['TSTB:SLOW', 'TSTB:SLOWER'], deadline=0.2)
+        self.assertLess(time.time() - start, 1.5)
+        self.assertEqual((stale.price, stale.stale), (Decimal('7.000'), True))
+        self.assertIsNone(missing.price)
+
+    def test_offline(self):
+        prefetcher, (cached, missing) = self.get_quotes(['TSTA:CACHED', 'TSTA:LIVE'], offline=True)
+        self.assertEqual((cached.price, cached.stale), (Decimal('9.250'), False))
+        self.assertIsNone(missing.price)
+
+    def test_batch(self):
+        provider = BatchPriceProvider(failing=('UNKNOWN',))
+        register_price_provider(provider, 'TSTC')
+        stock_tickers = ['TSTC:A', 'TSTC:B', 'TSTC:UNKNOWN', 'TSTA:LIVE']
+        prefetcher, quotes = self.get_quotes(stock_tickers)
+        self.assertEqual(provider.requests, [['A', 'B', 'UNKNOWN']])
+        self.assertEqual([quote.price for quote in quotes], [Decimal('10.500'), Decimal('10.500'), None, Decimal('10.500')])
+        self.assertEqual(prefetcher.missing, ['TSTC:UNKNOWN'])
+
+    def test_failed_batch(self):
+        """
+        a failed batch request falls back for each of its tickers, the fresh cached ones are not asked for
+        """
+        provider = FailingBatchProvider()
+        register_price_provider(provider, 'TSTD')
+        self.put_old_quote('TSTD:OLD', '8')
+        self.quote_cache.ttl = 30
+        self.quote_cache.put('TSTD:FRESH', '6')
+        prefetcher, (old, fresh, new) = self.get_quotes(['TSTD:OLD', 'TSTD:FRESH', 'TSTD:NEW'])
+        self.assertEqual(provider.requests, [['OLD', 'NEW']])
+        self.assertEqual((old.price, old.stale), (Decimal('8.000'), True))
+        self.assertEqual((fresh.price, fresh.stale), (Decimal('6.000'), False))
+        self.assertIsNone(new.price)
+        self.assertEqual((prefetcher.fallbacks, prefetcher.missing), (['TSTD:OLD'], ['TSTD:NEW']))
+
+
+if '__main__' == __name__:
+    unittest.main()
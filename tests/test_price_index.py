@@ -0,0 +1,91 @@
+"""
+memory mapped price index - lookups of the symbols of the source files, the index rebuilt only
+when the source files change, and the Jan 31, 2018 index against the CSV prices
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+
+from stock_exchange_tools import PriceIndex, Jan31State
+
+
+class PriceIndexTest(unittest.TestCase):
+    PRICES = {
+        'a.csv': {'NSE:20MICRONS': '52.85', 'NSE:M&M': '745.5'},
+        'b.csv': {'BSE:500002': '1600.0001', 'NSE:M&M': '750'},
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+        self.sources = []
+        for name, prices in sorted(self.PRICES.items()):
+            self.write_source(name, prices)
+        self.loaded = []
+        self.index_filename = os.path.join(self.tmp_dir, 'prices.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_source(self, name, prices):
+        filename = os.path.join(self.tmp_dir, name)
+        with open(filename, 'w') as fp:
+            for symbol, price in sorted(prices.items()):
+                fp.write('%s,%s\n' % (symbol, price))
+        if filename not in self.sources:
+            self.sources.append(filename)
+        return filename
+
+    def load_source(self, filename):
+        self.loaded.append(os.path.basename(filename))
+        with open(filename) as fp:
+            return dict((symbol, Decimal(price)) for symbol, price in (line.strip().split(',') for line in fp))
+
+    def get_index(self):
+        return PriceIndex(self.index_filename, self.sources, self.load_source)
+
+    def test_lookup(self):
+        index = self.get_index()
+        self.assertEqual(index.get_price('NSE:20MICRONS'), Decimal('52.85'))
+        self.assertEqual(index.get_price('BSE:500002'), Decimal('1600.0001'))
+        self.assertEqual(index.get_price('NSE:M&M'), Decimal('750'))      # the later file wins
+        self.assertIsNone(index.lookup('NSE:20MICRON'))
+        self.assertIsNone(index.lookup('NSE:ZZZ'))
+        self.assertRaises(KeyError, index.get_price, 'BSE:0')
+
+    def test_built_once(self):
+        self.get_index().open()
+        self.assertEqual(self.loaded, ['a.csv', 'b.csv'])
+        index = self.get_index()
+        self.assertEqual(index.get_price('NSE:M&M'), Decimal('750'))
+        self.assertEqual(self.loaded, ['a.csv', 'b.csv'])
+
+    def test_rebuilt_on_change(self):
+        self.get_index().open()
+        filename = self.write_source('b.csv', {'BSE:500002': '1700', 'BSE:500003': '1.5'})
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        index = self.get_index()
+        self.assertEqual(index.get_price('BSE:500003'), Decimal('1.5'))
+        self.assertEqual(index.get_price('NSE:M&M'), Decimal('745.5'))
+        self.assertEqual(self.loaded, ['a.csv', 'b.csv'] * 2)
+
+    def test_rebuilt_when_corrupt(self):
+        with open(self.index_filename, 'wb') as fp:
+            fp.write(b'not an index')
+        self.assertEqual(self.get_index().get_price('NSE:20MICRONS'), Decimal('52.85'))
+
+    def test_jan31_index(self):
+        csv_prices = {}
+        for filename in (Jan31State.JAN31_NSE_FILENAME, Jan31State.JAN31_BSE_FILENAME):
+            csv_prices.update(Jan31State.read_jan31_price_hash(filename))
+        symbols = sorted(csv_prices)
+        index = Jan31State.get_price_index()
+        for symbol in symbols[::max(1, len(symbols) // 200)]:
+            self.assertEqual(index.lookup(symbol), csv_prices[symbol], symbol)
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+streaming realization of the sells as they are read - intraday(sqr) sells recorded before their
+buys, and sells with no buy left to match
+"""
+
+import unittest
+
+from transaction_utils import TransactionRecord
+from reports_summary import GainTotals
+from equity_stats import Portfolio, realize_stream
+
+from tests.ledger_case import Jan31Quotes
+
+
+def get_transactions(rows):
+    return [TransactionRecord.create_obj_from_row(row.split('|')) for row in rows]
+
+
+class RealizeStreamTest(unittest.TestCase):
+    ROWS = [
+        'NSE:ABC|Abc|Buy|Jan 02, 2019|10|100|-1000|1|1|1|-1003|del',
+        'NSE:ABC|Abc|Sell|Jan 03, 2019|6|105|630|1|1|1|627|sqr',
+        'NSE:ABC|Abc|Sell|Jan 03, 2019|4|110|440|1|1|1|437|del',
+        'NSE:ABC|Abc|Buy|Jan 03, 2019|6|104|-624|1|1|1|-627|sqr',
+        'NSE:XYZ|Xyz|Buy|Jan 03, 2019|5|20|-100|0|0|0|-100|del',
+        'NSE:ABC|Abc|Sell|Jan 04, 2019|2|120|240|1|1|1|237|del',
+    ]
+
+    @staticmethod
+    def get_sums(totals):
+        return [getattr(totals, attr) for attr in GainTotals.SUM_ATTRS] + [totals.shares]
+
+    def realize_whole(self, rows):
+        pf = Portfolio(Jan31Quotes())
+        for transaction in get_transactions(rows):
+            pf.process_transaction(transaction)
+        for stock_obj in pf.stock_hash.values():
+            stock_obj.realize_whole()
+        return pf
+
+    def test_sqr_sell_before_buy(self):
+        pf = Portfolio(Jan31Quotes())
+        realize_stream(pf, get_transactions(self.ROWS))
+        stock_obj = pf.stock_hash['NSE:ABC']
+        self.assertTrue(stock_obj.sbuyq.is_empty())
+        self.assertEqual([buy_t.shares for buy_t in stock_obj.dbuyq], [4])
+        whole_obj = self.realize_whole(self.ROWS).stock_hash['NSE:ABC']
+        for cg_obj in whole_obj.realized_list:
+            cg_obj.calculate()
+        self.assertEqual(
+            self.get_sums(stock_obj.stock_summary.realized_totals), self.get_sums(GainTotals(whole_obj.realized_list))
+        )
+
+    def test_sells_realized_in_order(self):
+        """
+        the sells of other stocks and of later days are not held back
+        """
+        pf = Portfolio(Jan31Quotes())
+        realized = [(stock_obj.symbol, cg_obj.sel_t.date.day, cg_obj.sel_t.shares)
+                    for stock_obj, cg_obj in pf.realize_stream(get_transactions(self.ROWS))]
+        self.assertEqual(realized, [('NSE:ABC', 3, 6), ('NSE:ABC', 3, 4), ('NSE:ABC', 4, 2)])
+
+    def test_sell_without_buy(self):
+        rows = self.ROWS[:3] + self.ROWS[4:]
+        pf = Portfolio(Jan31Quotes())
+        with self.assertRaises(ValueError) as context:
+            realize_stream(pf, get_transactions(rows))
+        self.assertIn('6 sqr shares of NSE:ABC on 2019-01-03', str(context.exception))
+        self.assertRaises(ValueError, self.realize_whole, rows)
+
+
+if '__main__' == __name__:
+    unittest.main()
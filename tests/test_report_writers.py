@@ -0,0 +1,113 @@
+"""
+machine readable report writers - the rows of the CSV and JSON lines reports, the values as
+written and the report files
+"""
+
+import io
+import os
+import csv
+import json
+import datetime
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import reports_summary
+from reports_summary import COSMETIC_VALUE, REPORT_WRITERS, CsvReportWriter, JsonLinesReportWriter, get_report_writer
+
+
+HEADER = ['name', 'b_date', 'shares', 'b_value', 'percent']
+ROWS = [
+    ['Abc', datetime.date(2019, 1, 2), 10, Decimal('-1005.000'), Decimal('-0.000')],
+    [COSMETIC_VALUE, COSMETIC_VALUE, 10, Decimal('1E+3'), Decimal('12.5')],
+]
+
+
+def write_table(writer, kind='realized_details', stock='Abc'):
+    table = writer.open_table(kind, 'Realized', HEADER, stock)
+    for row in ROWS:
+        table.append(row)
+    table.close()
+
+
+class ReportWritersTest(unittest.TestCase):
+
+    def test_formats(self):
+        self.assertEqual(sorted(REPORT_WRITERS), ['csv', 'jsonl', 'text'])
+        self.assertIsInstance(get_report_writer('jsonl', fp=io.StringIO()), JsonLinesReportWriter)
+
+    def test_jsonl_rows(self):
+        fp = io.StringIO()
+        writer = get_report_writer('jsonl', fp=fp)
+        write_table(writer)
+        writer.close()
+        records = [json.loads(line) for line in fp.getvalue().splitlines()]
+        self.assertEqual(records, [
+            {'table': 'realized_details', 'stock': 'Abc', 'name': 'Abc', 'b_date': '2019-01-02', 'shares': 10,
+             'b_value': '-1005.000', 'percent': '-0.000'},
+            {'table': 'realized_details', 'stock': 'Abc', 'name': None, 'b_date': None, 'shares': 10,
+             'b_value': '1E+3', 'percent': '12.5'},
+        ])
+
+    def test_csv_rows(self):
+        fp = io.StringIO()
+        writer = get_report_writer('csv', fp=fp)
+        write_table(writer, 'portfolio_realized', None)
+        writer.close()
+        rows = list(csv.DictReader(io.StringIO(fp.getvalue())))
+        self.assertEqual([row['name'] for row in rows], ['Abc', ''])
+        self.assertEqual([row['b_value'] for row in rows], ['-1005.000', '1E+3'])
+        self.assertEqual((rows[0]['table'], rows[0]['stock'], rows[0]['b_date']), ('portfolio_realized', '', '2019-01-02'))
+        self.assertEqual(set(value for field, value in rows[0].items() if field not in HEADER + ['table']), set(['']))
+
+    def test_rows_as_appended(self):
+        """
+        the rows are written as they are appended, not when the table is closed
+        """
+        fp = io.StringIO()
+        writer = get_report_writer('jsonl', fp=fp)
+        table = writer.open_table('holding_details', 'Holding', HEADER, 'Abc')
+        table.append(ROWS[0])
+        self.assertEqual(len(fp.getvalue().splitlines()), 1)
+
+
+class CsvReportWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+        self.filename = os.path.join(self.tmp_dir, 'report.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_file_without_newline_translation(self):
+        with mock.patch.object(reports_summary.io, 'open', wraps=io.open) as io_open:
+            writer = CsvReportWriter(self.filename)
+        writer.close()
+        self.assertEqual(io_open.call_args[1], {'newline': ''})
+
+    def test_quoted_newline(self):
+        writer = CsvReportWriter(self.filename)
+        table = writer.open_table('holding_summary', 'Holding', ['name', 'shares'], 'Two\r\nLines')
+        table.append([COSMETIC_VALUE, 10])
+        table.close()
+        writer.close()
+        with open(self.filename, 'rb') as fp:
+            content = fp.read()
+        self.assertEqual(content.count(b'\r\n'), 1)
+        with io.open(self.filename, newline='') as fp:
+            header, row = list(csv.reader(fp))
+        self.assertEqual(header, list(CsvReportWriter.REPORT_COLUMNS))
+        record = dict(zip(header, row))
+        self.assertEqual((record['table'], record['stock']), ('holding_summary', 'Two\r\nLines'))
+        self.assertEqual((record['name'], record['shares']), ('', '10'))
+
+
+if '__main__' == __name__:
+    unittest.main()
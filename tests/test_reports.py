@@ -0,0 +1,72 @@
+"""
+text report tables - the q_age and stale columns only for the quotes that have them and no row
+wrapped by texttable
+"""
+
+import io
+import unittest
+
+from stock_exchange_tools import Quote
+from reports_summary import COSMETIC_VALUE, PortFolioSummary, TextReportTable, TextReportWriter
+
+from tests.ledger_case import LedgerTestCase, Jan31Quotes
+
+
+class AgedQuotes(Jan31Quotes):
+
+    def get_quote(self, stock_ticker):
+        quote = super(AgedQuotes, self).get_quote(stock_ticker)
+        return Quote(quote.price, 123456, True)
+
+
+class TextReportTest(LedgerTestCase):
+
+    def get_text_report(self, prefetcher):
+        pf = self.load(self.ledger)
+        pf.prefetcher = prefetcher
+        pf.process_stocks()
+        fp = io.StringIO()
+        PortFolioSummary(pf).print_summary(TextReportWriter(fp=fp))
+        return fp.getvalue()
+
+    def assert_holdings_not_wrapped(self, text):
+        """
+        a wrapped row takes two lines, the rows of a table are separated by lines of its border
+        """
+        lines = text.splitlines()
+        title, holding_rows = None, 0
+        for line, next_line in zip(lines, lines[1:]):
+            if next_line.startswith('='):
+                title = line
+            elif title is not None and 'Holding' in title and line.startswith('|'):
+                holding_rows += 1
+                self.assertFalse(next_line.startswith('|'), "%s: %s" % (title, line))
+        self.assertGreater(holding_rows, 0)
+
+    def test_live_quotes(self):
+        text = self.get_text_report(Jan31Quotes())
+        self.assertNotIn('q_age', text)
+        self.assertNotIn('stale', text)
+        self.assert_holdings_not_wrapped(text)
+
+    def test_optional_columns(self):
+        header = ['name', 'b_date', 'shares', 'q_age', 'stale']
+        fp = io.StringIO()
+        table = TextReportTable(fp, 'Holding', header)
+        table.append(['Abc', '2018-01-02', 10, 0, ''])
+        table.append(['Total', COSMETIC_VALUE, 10, COSMETIC_VALUE, COSMETIC_VALUE])
+        self.assertEqual(table.get_columns(), [0, 1, 2])
+        table.append(['Xyz', '2018-01-03', 5, 60, '*'])
+        self.assertEqual(table.get_columns(), [0, 1, 2, 3, 4])
+        table.close()
+        self.assertIn('| q_age | stale |', fp.getvalue())
+
+    def test_aged_quotes(self):
+        text = self.get_text_report(AgedQuotes())
+        self.assertIn('| q_age  | stale |', text)
+        self.assertIn('| 123456 |     * |', text)
+        self.assert_holdings_not_wrapped(text)
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+holdings revalued at new prices without realizing again - the revalued report is that of a
+portfolio valued at those prices from the start, including the stocks whose quote was missing
+"""
+
+import unittest
+from decimal import Decimal
+
+from stock_exchange_tools import Precision, Quote
+from reports_summary import PortFolioSummary
+
+from tests.ledger_case import LedgerTestCase, Jan31Quotes
+
+
+class PricedQuotes(Jan31Quotes):
+    """
+    the given prices, the Jan 31, 2018 ones for the other stocks and no quote for the missing ones
+    """
+
+    def __init__(self, prices=None, missing=()):
+        self.prices = prices or {}
+        self.missing = missing
+
+    def get_quote(self, stock_ticker):
+        if stock_ticker in self.missing:
+            return Quote.missing()
+        if stock_ticker in self.prices:
+            return Quote(Precision.three(Decimal(self.prices[stock_ticker])), 0, False)
+        return super(PricedQuotes, self).get_quote(stock_ticker)
+
+
+class RevalueTest(LedgerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(RevalueTest, cls).setUpClass()
+        pf = cls.load(cls.ledger)
+        cls.held = sorted(symbol for symbol, stock_obj in pf.stock_hash.items() if stock_obj.has_holdings())
+        cls.prices = {cls.held[0]: '123.45', cls.held[1]: '6789.1'}
+
+    def get_summary(self, quotes):
+        pf = self.load(self.ledger)
+        pf.prefetcher = quotes
+        pf.process_stocks()
+        summary = PortFolioSummary(pf)
+        summary.build_totals()
+        return pf, summary
+
+    def test_revalued_report(self):
+        pf, summary = self.get_summary(Jan31Quotes())
+        report = self.write_report(summary)
+        summary.revalue(self.prices)
+        for symbol, price in self.prices.items():
+            sel_prices = set(cg_obj.sel_t.price for cg_obj in pf.stock_hash[symbol].holding_list)
+            self.assertEqual(sel_prices, set([Decimal(price)]))
+        expected = self.write_report(self.get_summary(PricedQuotes(self.prices))[1])
+        self.assertNotEqual(expected, report)
+        self.assertEqual(self.write_report(summary), expected)
+
+    def test_revalue_missing_quote(self):
+        symbol = self.held[0]
+        pf, summary = self.get_summary(PricedQuotes(missing=(symbol,)))
+        stock_obj = pf.stock_hash[symbol]
+        self.assertFalse(stock_obj.stock_summary.holding_status)
+        self.assertFalse(stock_obj.dbuyq.is_empty())
+        lot_count = stock_obj.dbuyq.size()
+        summary.revalue({symbol: self.prices[symbol]})
+        self.assertTrue(stock_obj.stock_summary.holding_status)
+        self.assertEqual(len(stock_obj.holding_list), lot_count)
+        self.assertTrue(stock_obj.dbuyq.is_empty())
+        expected = self.write_report(self.get_summary(PricedQuotes({symbol: self.prices[symbol]}))[1])
+        self.assertEqual(self.write_report(summary), expected)
+
+    def test_unheld_stocks_skipped(self):
+        pf, summary = self.get_summary(Jan31Quotes())
+        report = self.write_report(summary)
+        sold_off = [symbol for symbol, stock_obj in pf.stock_hash.items() if stock_obj.stock_summary.holding_status == False]
+        summary.revalue(dict((symbol, '1') for symbol in sold_off + ['NSE:UNKNOWN']))
+        self.assertEqual(self.write_report(summary), report)
+
+    def test_parallel_holdings_not_revalued(self):
+        pf = self.load(self.ledger)
+        pf.process_stocks(jobs=2)
+        sold = [symbol for symbol in self.held if pf.stock_hash[symbol].sellq.is_empty() == False]
+        self.assertTrue(sold)
+        self.assertRaises(ValueError, PortFolioSummary(pf).revalue, {sold[0]: '1'})
+
+
+if '__main__' == __name__:
+    unittest.main()
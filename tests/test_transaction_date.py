@@ -0,0 +1,45 @@
+"""
+fast parse of the transaction dates - the "MMM dd, YYYY" dates give the same dates as dateutil,
+the other formats are left to dateutil, and the dates of the records are shared
+"""
+
+import datetime
+import unittest
+
+try:
+    from dateutil.parser import parse as date_parse
+except ImportError:
+    date_parse = None
+
+from transaction_utils import TransactionDate, TransactionRecord
+
+
+@unittest.skipIf(date_parse is None, 'dateutil is not installed')
+class TransactionDateTest(unittest.TestCase):
+
+    def test_same_as_dateutil(self):
+        day = datetime.date(2011, 12, 25)
+        while day < datetime.date(2020, 3, 10):
+            for date_str in (day.strftime('%b %d, %Y'), day.strftime('%B %d, %Y')):
+                self.assertEqual(TransactionDate.parse_fixed_format(date_str), date_parse(date_str).date(), date_str)
+            day += datetime.timedelta(days=11)
+
+    def test_other_formats(self):
+        for date_str in ('2019-01-05', '05 Jan 2019', 'Jan 5 2019', 'JAN 05, 2019'):
+            self.assertEqual(TransactionDate.parse_fixed_format(date_str), datetime.date(2019, 1, 5), date_str)
+        self.assertRaises(ValueError, TransactionDate.parse_fixed_format, 'Jan 32, 2019')
+
+    def test_memoized(self):
+        date = TransactionDate.parse('Mar 04, 2019')
+        self.assertIs(TransactionDate.parse('Mar 04, 2019'), date)
+        self.assertEqual(date, datetime.date(2019, 3, 4))
+
+    def test_record_date(self):
+        row = ['NSE:ABC', 'Abc', 'Buy', 'Jan 02, 2019', '10', '100.5', '-1005', '1.1', '0.7', '0.3', '-1007.1', 'del']
+        buy_t = TransactionRecord.create_obj_from_row(row)
+        self.assertIs(buy_t.date, TransactionDate.parse('Jan 02, 2019'))
+        self.assertEqual(buy_t.date, date_parse(row[3]).date())
+
+
+if '__main__' == __name__:
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+lot queue - partial consumption of the front lot in place with the same amounts as the lots
+recreated by scale_down, and the order of the lots put at either end
+"""
+
+import unittest
+from decimal import Decimal
+
+from transaction_utils import TransactionQueue, TransactionRecord
+
+
+def get_buy(shares, date='Jan 02, 2019', price='100.5'):
+    value = Decimal(shares) * Decimal(price)
+    row = ['NSE:ABC', 'Abc', 'Buy', date, str(shares), price, str(-value), '1.1', '0.7', '0.3', str(-value - 2), 'del']
+    return TransactionRecord.create_obj_from_row(row)
+
+
+class TransactionQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buy_t = get_buy(10)
+        self.queue = TransactionQueue()
+        self.queue.put(self.buy_t, False)
+        self.queue.put(get_buy(5, 'Jan 03, 2019'), False)
+
+    def test_partial_consumption(self):
+        consumed_t = self.queue.consume(3)
+        self.assertEqual(consumed_t.shares, 3)
+        self.assertEqual(consumed_t.get_amounts(), self.buy_t.scale_amounts(3))
+        self.assertEqual(self.queue.size(), 2)
+        self.assertEqual(self.queue.front_shares(), 7)
+        front_t = self.queue.front()
+        self.assertEqual(front_t.get_amounts(), self.buy_t.scale_amounts(7))
+        self.assertEqual(front_t.receivable, front_t.value - front_t.brokerage - front_t.stt - front_t.charges)
+        self.assertEqual([buy_t.shares for buy_t in self.queue], [7, 5])
+
+    def test_same_as_scale_down(self):
+        """
+        the parts are those of a lot recreated with scale_down after each sell
+        """
+        remain_t = self.buy_t
+        for shares in (3, 3, 4):
+            consumed_t = self.queue.consume(shares)
+            self.assertEqual(consumed_t, remain_t.scale_down(shares))
+            if remain_t.shares > shares:
+                remain_t = remain_t.scale_down(remain_t.shares - shares)
+                self.assertEqual(self.queue.front(), remain_t)
+        self.assertEqual(self.queue.front().date, get_buy(5, 'Jan 03, 2019').date)
+        self.assertEqual(self.queue.size(), 1)
+
+    def test_whole_lot(self):
+        self.assertIs(self.queue.consume(10), self.buy_t)
+        self.assertEqual(self.queue.front_shares(), 5)
+
+    def test_put_front_keeps_partial_lot(self):
+        self.queue.consume(4)
+        extra_t = get_buy(2, 'Jan 01, 2019')
+        self.queue.put(extra_t, True)
+        self.assertEqual([buy_t.shares for buy_t in self.queue], [2, 6, 5])
+        self.assertIs(self.queue.get(), extra_t)
+        self.assertEqual(self.queue.front().get_amounts(), self.buy_t.scale_amounts(6))
+
+    def test_get_until_empty(self):
+        self.queue.consume(4)
+        self.assertEqual([self.queue.get().shares for index in range(2)], [6, 5])
+        self.assertTrue(self.queue.is_empty())
+        self.assertEqual(list(self.queue), [])
+
+
+if '__main__' == __name__:
+    unittest.main()
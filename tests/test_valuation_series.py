@@ -0,0 +1,67 @@
+"""
+valuation series over end of day files - the symbols read from the files and the daily values of
+the open lots, including the cash mode ones, and an intraday sell recorded before its buy
+"""
+
+import os
+import io
+import shutil
+import tempfile
+import unittest
+import datetime
+from decimal import Decimal
+
+from eod_store import EodPriceFiles
+from valuation_series import ValuationSeries, get_symbols, read_transactions
+
+
+class ValuationSeriesTest(unittest.TestCase):
+    LEDGER = [
+        'Symbol,Name,Type,Date,Shares,Price,Amount,Brokerage,STT,Charges,Receivable,Mode',
+        'NSE:ABC,Abc,Buy,"Jan 02, 2018",10,100,-1000,0,0,0,-1000,cash',
+        'NSE:XYZ,Xyz,Buy,"Jan 02, 2018",5,200,-1000,0,0,0,-1000,del',
+        'NSE:SQR,Sqr,Sell,"Jan 03, 2018",4,55,220,0,0,0,220,sqr',
+        'NSE:SQR,Sqr,Buy,"Jan 03, 2018",4,50,-200,0,0,0,-200,sqr',
+    ]
+    EOD_HEADER = 'SYMBOL,Name,ISIN,SERIES,OPEN,HIGH,LOW,CLOSE,LAST,TIMESTAMP'
+    EOD_DAYS = {
+        '20180102': {'NSE:ABC': '110', 'NSE:XYZ': '210', 'NSE:SQR': '50'},
+        '20180103': {'NSE:ABC': '120', 'NSE:SQR': '55'},
+    }
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix='equity_stats_test')
+        self.ledger = os.path.join(self.tmp_dir, 'ledger.csv')
+        self.write_lines(self.ledger, self.LEDGER)
+        for day, prices in self.EOD_DAYS.items():
+            self.write_lines(os.path.join(self.tmp_dir, 'NSE_%s.csv' % (day,)), [self.EOD_HEADER] + [
+                '%s,Name,INE000000000,EQ,0,0,0,0,%s,%s' % (symbol, price, day) for symbol, price in sorted(prices.items())
+            ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def write_lines(file_name, lines):
+        with io.open(file_name, 'w', newline='') as fp:
+            fp.write(u'\n'.join(lines) + u'\n')
+
+    def test_symbols_of_cash_and_delivery_buys(self):
+        self.assertEqual(get_symbols(self.ledger), set(['NSE:ABC', 'NSE:XYZ']))
+
+    def test_cash_mode_lots_are_valued(self):
+        fields = ValuationSeries.FIELDS
+        series = ValuationSeries(read_transactions(self.ledger), EodPriceFiles(self.tmp_dir), get_symbols(self.ledger))
+        rows = [dict(zip(fields, row)) for row in series.rows()]
+        self.assertEqual([row['date'] for row in rows], [datetime.date(2018, 1, 2), datetime.date(2018, 1, 3)])
+        first, second = rows
+        self.assertEqual((first['lots'], first['shares'], first['unpriced']), (2, Decimal(15), 0))
+        self.assertEqual(first['market_value'], Decimal('2150'))
+        self.assertEqual(first['unrealized_gain'], Decimal('150'))
+        # XYZ keeps its last known price, the sqr pair is realized and holds no lots
+        self.assertEqual(second['market_value'], Decimal('2250'))
+        self.assertEqual(second['realized_gain'], Decimal('20'))
+
+
+if '__main__' == __name__:
+    unittest.main()
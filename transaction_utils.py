@@ -6,21 +6,36 @@
 * Feel free to use and distribute for any good purpose with good intentions
 """
 
+import io
+import os
+import csv
+import pickle
+import struct
+import hashlib
 import datetime
-from collections import namedtuple
-from dateutil.parser import parse as date_parse
-from decimal import Decimal
+import tempfile
+from collections import namedtuple, deque
+from decimal import Decimal, ROUND_HALF_UP
 from stock_exchange_tools import Precision
-
+from instrumentation import METRICS
 
 class TransactionQueue(object):
     """
     queue implementation to hold transactions in a portfolio
+    * backed by a deque so that adding or removing at either end is O(1)
+    * the transaction at the front can be consumed partially in place. Only the remaining
+      shares and scaled down amounts are tracked for it, the record itself is not recreated
+      until it is taken out of the queue
+    * the transactions beyond the first UNPACKED_LOTS are kept packed(PackedTransaction) and
+      unpacked as they come to the front or are iterated. The long queues hold the bulk of the
+      lots of a large ledger, the short ones are consumed soon and are not worth the packing
     """
     _ZERO = 0
+    UNPACKED_LOTS = 4
 
     def __init__(self):
-        self.items = []
+        self.items = deque()
+        self.front_amounts = None   # amounts left in the front transaction after partial consumption
 
     def is_empty(self):
         return len(self.items) == self._ZERO
@@ -28,23 +43,76 @@ class TransactionQueue(object):
     def size(self):
         return len(self.items)
 
+    def front(self):
+        if self.front_amounts is None:
+            return self.items[self._ZERO]
+        return self.items[self._ZERO].create_obj_from_amounts(self.front_amounts)
+
+    def front_shares(self):
+        if self.front_amounts is None:
+            return self.items[self._ZERO].shares
+        return self.front_amounts[self._ZERO]
+
     def put(self, item, front):
         if front == True:
-            self.items.insert(self._ZERO, item)
+            if self.items:
+                self.items[self._ZERO] = PackedTransaction.pack(self.front())
+                self.front_amounts = None
+            self.items.appendleft(item)
+        elif len(self.items) >= self.UNPACKED_LOTS:
+            self.items.append(PackedTransaction.pack(item))
         else:
             self.items.append(item)
 
+    def pop_front(self):
+        self.items.popleft()
+        self.front_amounts = None
+        if self.items:
+            self.items[self._ZERO] = self.items[self._ZERO].unpack()
+
     def get(self):
-        return self.items.pop(self._ZERO)
+        item = self.front()
+        self.pop_front()
+        return item
+
+    def consume(self, shares):
+        """
+        take out the given number of shares from the front transaction and return them as a
+        scaled down transaction. The remaining shares stay at the front of the queue, the front
+        transaction is removed once all its shares are consumed
+        """
+        item = self.items[self._ZERO]
+        amounts = self.front_amounts
+        if amounts is None:
+            if shares == item.shares:
+                self.pop_front()
+                return item
+            amounts = item.get_amounts()
+        if METRICS.enabled:
+            METRICS.incr('lot_splits')
+        consumed_t = item.create_obj_from_amounts(item.scale_amounts(shares, amounts))
+        remain_amounts = item.scale_amounts(amounts[self._ZERO] - shares, amounts)
+        if remain_amounts[self._ZERO] == self._ZERO:
+            self.pop_front()
+        else:
+            self.front_amounts = remain_amounts
+        return consumed_t
 
     def __iter__(self):
-        return self.items.__iter__()
+        items = iter(self.items)
+        if self.items:
+            next(items)
+            yield self.front()
+        for item in items:
+            yield item.unpack()
 
 
 class TransactionConstants(object):
     """
     class defines all constants involved in a transaction
+    no instance attributes here, so that the records and the capital gains can do without a __dict__
     """
+    __slots__ = ()
 
     # trade types
     BUY = 'Buy'
@@ -100,9 +168,39 @@ class TransactionConstants(object):
     CHARGES_F_LIST  = [BROKERAGE_F, STT_F, CHARGES_F]
     DATE_F_LIST     = [DATE_F]
     INTEGER_F_LIST  = [SHARES_F]
+    STRING_F_LIST   = [SYMBOL_F, NAME_F, TRADE_F, MODE_F]   # repeated across the rows, shared
     PRECI3_F_LIST   = AMOUNT_F_LIST + CHARGES_F_LIST #[PRICE_F, VALUE_F, BROKERAGE_F, STT_F, CHARGES_F, RECEIVABLE_F]
 
 
+class TransactionDate(object):
+    """
+    * parser for the "MMM dd, YYYY" date format of the transactions file
+    * a ledger has far fewer distinct dates than rows, so parsed dates are memoized by the date string
+    * any other format falls back to the generic dateutil parser, imported on its first use
+    """
+    MONTHS      = {
+        'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+        'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+    }
+    DATE_HASH   = {}
+
+    @classmethod
+    def parse_fixed_format(cls, date_str):
+        try:
+            month, day, year = date_str.replace(',', ' ').split()
+            return datetime.date(int(year), cls.MONTHS[month[:3].title()], int(day))
+        except (ValueError, KeyError):
+            from dateutil.parser import parse as date_parse     # loaded only for the other formats
+            return date_parse(date_str).date()
+
+    @classmethod
+    def parse(cls, date_str):
+        date = cls.DATE_HASH.get(date_str)
+        if date is None:
+            date = cls.DATE_HASH[date_str] = cls.parse_fixed_format(date_str)
+        return date
+
+
 TransactionMeta = namedtuple('TransactionMeta', TransactionConstants.TRANSACTION_FIELDS)
 
 class TransactionRecord(TransactionMeta, TransactionConstants):
@@ -113,20 +211,28 @@ class TransactionRecord(TransactionMeta, TransactionConstants):
         2.  scale down a partially realized buy transaction based on number of shares realized
         3.  creating an equivalent sell transaction for an unrealized buy transaction based on today's date
             and current market price. This makes handling realized and holding transactions uniform.
+    compact by design - no __dict__, the repeated strings and the share counts(few distinct
+    values) are shared objects, so a lot costs its tuple and its amounts
     """
+    __slots__ = ()
 
     _record_field_index = {field: index for (index, field) in enumerate(TransactionMeta._fields)}
+    _date_index_list    = list(map(_record_field_index.get, TransactionConstants.DATE_F_LIST))
+    _integer_index_list = list(map(_record_field_index.get, TransactionConstants.INTEGER_F_LIST))
+    _string_index_list  = list(map(_record_field_index.get, TransactionConstants.STRING_F_LIST))
+    _string_hash        = {}
+    _integer_hash       = {}
+    _preci3_index_list  = list(map(_record_field_index.get, TransactionConstants.PRECI3_F_LIST))
 
     def __new__(cls, row, transform=True):
         """
         overriding __new__ as TransactionMeta derives from tuple class
-        immutable object so call new again after transforming values of certain fields
+        immutable object so transform values of certain fields before creating the object
         do a validation before returning the object
         """
-        obj = super(TransactionRecord, cls).__new__(cls, *row)
         if transform:
-            newrow = obj.transform_namedtuple()
-            obj = super(TransactionRecord, cls).__new__(cls, *newrow)
+            row = cls.transform_row(row)
+        obj = super(TransactionRecord, cls).__new__(cls, *row)
         obj.validate()
         return obj
 
@@ -137,6 +243,8 @@ class TransactionRecord(TransactionMeta, TransactionConstants):
         with a need to create objects. Those instance methods can call this method. Note that
         this method actually makes a call to __new__
         """
+        if METRICS.enabled and transform:
+            METRICS.incr('rows_parsed')
         obj = cls(row, transform)
         return obj
 
@@ -144,41 +252,88 @@ class TransactionRecord(TransactionMeta, TransactionConstants):
         val = super(self.__class__, self).__repr__()
         return val.replace(super(self.__class__, self).__class__.__name__, self.__class__.__name__)
 
-    def transform_namedtuple(self):
+    def __reduce__(self):
+        """
+        pickle support(checkpoints), __new__ takes the whole row unlike the namedtuple
+        """
+        return (self.__class__, (tuple(self), False))
+
+    @classmethod
+    def transform_row(cls, row):
         """
         transform string values to required types - date, decimal numbers with required precision
-        the basic object exists in __new__ to call this and hence this is made an instance method
-        this method is called from __new__, technically considered as part of object creation
-        hence, do not call create_obj_from_row from here as that would be calling __new__ again
+        this method is called from __new__ on the raw row, technically considered as part of object
+        creation hence, do not call create_obj_from_row from here as that would be calling __new__ again
+        quantize is called directly instead of through Precision as this runs for every field of every row
         """
-        newrow = list(self)
-        rf_index = self._record_field_index
-        for index in (rf_index[field] for field in self.DATE_F_LIST):
-            newrow[index] = date_parse(self[index]).date()
-        for index in (rf_index[field] for field in self.INTEGER_F_LIST):
-            newrow[index] = Precision.integer(Decimal(self[index]))
-        for index in (rf_index[field] for field in self.PRECI3_F_LIST):
-            newrow[index] = Precision.three(Decimal(self[index]))
+        newrow = list(row)
+        string_hash = cls._string_hash
+        for index in cls._string_index_list:
+            newrow[index] = string_hash.setdefault(row[index], row[index])
+        for index in cls._date_index_list:
+            newrow[index] = TransactionDate.parse(row[index])
+        integer_exp, rounding, integer_hash = Precision.DECIMAL_TEN, ROUND_HALF_UP, cls._integer_hash
+        for index in cls._integer_index_list:
+            value = integer_hash.get(row[index])
+            if value is None:
+                value = integer_hash[row[index]] = Decimal(row[index]).quantize(integer_exp, rounding=rounding)
+            newrow[index] = value
+        round_3 = Precision.ROUND_3
+        for index in cls._preci3_index_list:
+            newrow[index] = Decimal(row[index]).quantize(round_3, rounding=rounding)
         return newrow
 
-    def scale_down(self, rem_shares):
+    def unpack(self):
         """
-        scale down a partially realized buy transaction(self) based on number of shares remaining after
-        realization. shares, value and charges scaled down using the ratio rem_shares/original_shares.
+        the record as queued when it could not be packed(see PackedTransaction)
+        """
+        return self
+
+    def transform_namedtuple(self):
+        """
+        transformed values of an object created from a raw row with transform=False
+        """
+        return self.transform_row(self)
+
+    def get_amounts(self):
+        """
+        shares followed by the amounts that scale with the shares - value and charges
+        """
+        return (self.shares, self.value, self.brokerage, self.stt, self.charges)
+
+    def scale_amounts(self, rem_shares, amounts=None):
+        """
+        scale down the amounts(see get_amounts) based on number of shares remaining after realization.
+        value and charges scaled down using the ratio rem_shares/original_shares
+        """
+        if amounts is None:
+            amounts = self.get_amounts()
+        diff_ratio = rem_shares/amounts[0]
+        return (rem_shares,) + tuple(Precision.three(diff_ratio * amount) for amount in amounts[1:])
+
+    def create_obj_from_amounts(self, amounts):
+        """
+        create a copy of this transaction with shares, value and charges replaced by the given amounts
         receivable can also be scaled down but recalculation preferred for precision
         """
         rf_index = self._record_field_index
-        value_index, recv_index, shares_index = [rf_index[x] for x in (self.VALUE_F, self.RECEIVABLE_F, self.SHARES_F)]
-        charges_index_list = [rf_index[x] for x in self.CHARGES_F_LIST]
-        diff_ratio = rem_shares/self.shares
+        value_index, recv_index = rf_index[self.VALUE_F], rf_index[self.RECEIVABLE_F]
         newt = list(self)
-        newt[shares_index] = rem_shares
-        for index in [value_index] + charges_index_list:
-            newt[index] = Precision.three(diff_ratio * newt[index])
-        charges = sum([newt[index] for index in charges_index_list])
+        for field, amount in zip((self.SHARES_F, self.VALUE_F) + tuple(self.CHARGES_F_LIST), amounts):
+            newt[rf_index[field]] = amount
+        charges = sum(amounts[2:])
         newt[recv_index] = Precision.three(newt[value_index] - charges) # receivable can also be scaled down, this is preferred for precision
         return self.create_obj_from_row(newt, transform=False)
 
+    def scale_down(self, rem_shares):
+        """
+        scale down a partially realized buy transaction(self) based on number of shares remaining after
+        realization. shares, value and charges scaled down using the ratio rem_shares/original_shares.
+        """
+        if METRICS.enabled:
+            METRICS.incr('lot_splits')
+        return self.create_obj_from_amounts(self.scale_amounts(rem_shares))
+
     def get_ref_sel_transaction(self, ref_date, market_price):
         """
         create an equivalent sell transaction for an unrealized buy transaction based on
@@ -214,3 +369,197 @@ class TransactionRecord(TransactionMeta, TransactionConstants):
         assert self.stt >= 0
         assert self.charges >= 0
 
+
+
+class PackedTransaction(tuple):
+    """
+    * compact form of a TransactionRecord in the queues - the strings and the date are the shared
+      objects of the record, the shares and the amounts are integers(amounts x 1000) packed in one
+      bytes object. About a fifth of the memory of the record with its Decimal objects
+    * unpack recreates the record with the same Decimal values, the amounts of the records have 3
+      decimal places(transform_row, create_obj_from_amounts)
+    * a record that can not be packed exactly(a negative zero or a huge amount) is queued as it is,
+      TransactionRecord.unpack returns the record itself
+    * the front transaction of a queue is always unpacked, the realization works on it alone
+    """
+    __slots__ = ()
+    AMOUNTS = struct.Struct('<7q')    # shares, price, value, brokerage, stt, charges, receivable
+    AMOUNT_SCALE_EXP = 3
+
+    @classmethod
+    def pack(cls, transaction):
+        amounts = transaction[5:11]
+        scaled = [int(amount.scaleb(cls.AMOUNT_SCALE_EXP)) for amount in amounts]
+        shares = int(transaction.shares)
+        if shares != transaction.shares:
+            return transaction
+        if 0 in scaled and any(scaled_amount == 0 and amount.is_signed() for scaled_amount, amount in zip(scaled, amounts)):
+            return transaction      # a negative zero would unpack as zero
+        try:
+            packed = cls.AMOUNTS.pack(shares, *scaled)
+        except struct.error:
+            return transaction
+        return cls((transaction.symbol, transaction.name, transaction.trade, transaction.date, transaction.mode, packed))
+
+    def unpack(self):
+        symbol, name, trade, date, mode, packed = self
+        scaled = self.AMOUNTS.unpack(packed)
+        scale_exp = -self.AMOUNT_SCALE_EXP
+        row = [symbol, name, trade, date, Decimal(scaled[0])]
+        row += [Decimal(value).scaleb(scale_exp) for value in scaled[1:]]
+        row.append(mode)
+        return TransactionRecord._make(row)    # no validation, the values are of a validated record
+
+
+class LedgerReader(object):
+    """
+    * reads the rows of the transactions file starting at a byte offset so that only the rows
+      appended since the last checkpoint are parsed. The header is skipped when reading from the start
+    * once the rows are exhausted, offset is set to the end of the consumed rows. It is set to None
+      if the file does not end with a newline(a row may still be getting written) as the next run
+      can not resume from there
+    * iter_offsets also gives the end offset of each row, for the readers that apply the rows one
+      at a time and must resume right after the last row applied
+    """
+    ENCODING = 'utf-8'
+
+    def __init__(self, filename, offset=0):
+        self.filename = filename
+        self.start_offset = offset
+        self.offset = offset
+
+    def __iter__(self):
+        with io.open(self.filename, 'rb') as raw_fp:
+            raw_fp.seek(self.start_offset)
+            text_fp = io.TextIOWrapper(raw_fp, encoding=self.ENCODING, newline='')
+            reader = csv.reader(text_fp)
+            if self.start_offset == 0:
+                next(reader, None)  # skip the header
+            for row in reader:
+                yield row
+            end_offset = raw_fp.tell()
+            if end_offset > 0:
+                raw_fp.seek(end_offset - 1)
+                if raw_fp.read(1) != b'\n':
+                    end_offset = None
+            self.offset = end_offset
+
+    def iter_offsets(self):
+        """
+        generator of (row, byte offset of the end of the row), the offset is None for a row not
+        ending with a newline. csv.reader pulls only the lines of the row it returns(a quoted field
+        may span lines), so the bytes of the lines pulled so far end at the row
+        """
+        line_end = [self.start_offset]
+
+        def read_lines(raw_fp):
+            for line in raw_fp:
+                line_end[0] = line_end[0] + len(line) if line.endswith(b'\n') else None
+                yield line.decode(self.ENCODING)
+
+        with io.open(self.filename, 'rb') as raw_fp:
+            raw_fp.seek(self.start_offset)
+            reader = csv.reader(read_lines(raw_fp))
+            if self.start_offset == 0:
+                next(reader, None)  # skip the header
+            for row in reader:
+                yield row, line_end[0]
+            self.offset = line_end[0]
+
+    def iter_complete(self, tail):
+        """
+        generator of the rows ending with a newline, offset is left at the end of the last of them.
+        A last row without a newline is appended to tail, to be applied without being checkpointed
+        """
+        offset = self.start_offset
+        for row, end_offset in self.iter_offsets():
+            if end_offset is None:
+                tail.append(row)
+                continue
+            offset = end_offset
+            yield row
+        self.offset = offset
+
+
+class LedgerCheckpoint(object):
+    """
+    * checkpoint of the state after realizing an append-only transactions file
+    * holds the byte offset up to which the file was consumed and the sha1 digest of those bytes.
+      The state is usable only if the file still starts with the same bytes, any change in the
+      consumed prefix means a full rebuild
+    * the digest of the prefix checked by load is extended by the appended bytes for the save that
+      follows it, the prefix is read and hashed once per run
+    * written atomically(temporary file + rename) with pickle
+    """
+    VERSION     = 1
+    BLOCK_SIZE  = 1 << 20
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.prefix = None      # (ledger name, offset, sha1 object) of the prefix checked by load
+
+    @classmethod
+    def update_digest(cls, digest, ledger_name, start, end):
+        """
+        add the bytes of the file from start to end to the digest, False if the file is shorter
+        """
+        with io.open(ledger_name, 'rb') as fp:
+            fp.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                block = fp.read(min(cls.BLOCK_SIZE, remaining))
+                if not block:
+                    return False
+                digest.update(block)
+                remaining -= len(block)
+        return True
+
+    def prefix_digest(self, ledger_name, offset, prefix=None):
+        """
+        sha1 digest of the first offset bytes of the file, None if the file is shorter. A prefix
+        (ledger name, offset, sha1 object) already hashed is extended rather than read again
+        """
+        digest, start = hashlib.sha1(), 0
+        if prefix is not None and prefix[0] == ledger_name and prefix[1] <= offset:
+            digest, start = prefix[2].copy(), prefix[1]
+        if self.update_digest(digest, ledger_name, start, offset) == False:
+            return None     # file shorter than the checkpoint
+        return digest
+
+    def load(self, ledger_name):
+        """
+        returns (offset, state) to resume from or (0, None) when a full rebuild is needed
+        """
+        self.prefix = None
+        try:
+            with open(self.filename, 'rb') as fp:
+                checkpoint = pickle.load(fp)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return 0, None
+        if checkpoint.get('version') != self.VERSION:
+            return 0, None
+        offset = checkpoint['offset']
+        digest = self.prefix_digest(ledger_name, offset)
+        if digest is None or digest.hexdigest() != checkpoint['digest']:
+            return 0, None
+        self.prefix = (ledger_name, offset, digest)
+        return offset, checkpoint['state']
+
+    def save(self, ledger_name, offset, state):
+        digest = self.prefix_digest(ledger_name, offset, self.prefix)
+        self.prefix = None
+        checkpoint = {
+            'version': self.VERSION,
+            'offset': offset,
+            'digest': digest and digest.hexdigest(),
+            'state': state,
+        }
+        checkpoint_dir = os.path.dirname(os.path.abspath(self.filename))
+        fd, tmp_filename = tempfile.mkstemp(prefix='.checkpoint', dir=checkpoint_dir)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(checkpoint, fp, pickle.HIGHEST_PROTOCOL)
+            getattr(os, 'replace', os.rename)(tmp_filename, self.filename)
+        except Exception:
+            os.remove(tmp_filename)
+            raise
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""
+* Historical valuation of a portfolio on every trading day over a date range - the open lots as of
+  each date, their cost and market value, the unrealized short and long term gains and the
+  cumulative realized gains
+* the prices are the last traded prices(LAST) of the end of day files of a directory, named like the ones
+  in lib/(NSE_YYYYMMDD.csv, BSE_YYYYMMDD.csv) and read with the Jan31State columns. The trading
+  days are the dates of the files. A symbol missing on a day keeps its last known price
+* --eod-store reads the prices from an end of day price store(eod_store.py) instead of the files
+* incremental day over day - the transactions are replayed up to each date with every sell
+  realized as it is added, and only the stocks whose lots changed are valued lot by lot again.
+  Each stock keeps the shares and the cost(buy value and buy charges) of its short and long term
+  lots, so a new price revalues a stock without going over its lots. The lots are regrouped
+  only on the days one of them turns long term
+* the unrealized gains are the net gains of CapitalGain(no sell charges), the grandfathered
+  taxable gains are not part of the series
+
+Usage:
+    python valuation_series.py sample_portfolio.csv --eod-dir eod/ --start 2018-01-01 --output series.csv
+    python valuation_series.py sample_portfolio.csv --eod-store lib/eod_prices.bin --end 2019-03-31
+"""
+
+import sys
+import csv
+import datetime
+import argparse
+
+import csv23
+
+from transaction_utils import TransactionConstants, TransactionRecord
+from stock_exchange_tools import PrefetchedQuotes, Precision
+from equity_stats import Portfolio, Stock
+from eod_store import EodPriceFiles, EodPriceStore
+
+
+class StockPosition(TransactionConstants):
+    """
+    open delivery lots of a stock grouped by term as of a date - shares and cost of the short term
+    and of the long term lots, the date the next lot turns long term and the stock's contribution
+    to the portfolio totals at its last price
+    """
+    ZERO = Precision.DECIMAL_ZERO
+
+    def __init__(self, stock_obj, date):
+        self.lots = 0
+        self.short_shares = self.short_cost = self.long_shares = self.long_cost = self.ZERO
+        self.aging_date = None
+        for buy_t in stock_obj.dbuyq:
+            cost = Precision.three(buy_t.shares * buy_t.price) + Precision.three(buy_t.brokerage + buy_t.stt + buy_t.charges)
+            long_date = buy_t.date + datetime.timedelta(days=self.TERM_DAYS_DIFF + 1)
+            self.lots += 1
+            if long_date <= date:
+                self.long_shares += buy_t.shares
+                self.long_cost += cost
+            else:
+                self.short_shares += buy_t.shares
+                self.short_cost += cost
+                if self.aging_date is None or long_date < self.aging_date:
+                    self.aging_date = long_date
+        self.totals = None
+
+    def value(self, price):
+        """
+        (lots, shares, cost, market value, unrealized short term gain, unrealized long term gain)
+        """
+        short_gain = Precision.three(self.short_shares * price) - self.short_cost
+        long_gain = Precision.three(self.long_shares * price) - self.long_cost
+        shares = self.short_shares + self.long_shares
+        return (self.lots, shares, self.short_cost + self.long_cost, Precision.three(shares * price), short_gain, long_gain)
+
+
+class ValuationSeries(TransactionConstants):
+    """
+    replays a chronological list of transactions over the trading days of a price source, one
+    row of FIELDS per trading day
+    """
+    FIELDS = (
+        'date', 'lots', 'shares', 'cost', 'market_value', 'unrealized_stg', 'unrealized_ltg', 'unrealized_gain',
+        'realized_stg', 'realized_ltg', 'realized_gain', 'unpriced'
+    )
+    HOLDING_FIELDS = FIELDS[1:7]
+
+    def __init__(self, transactions, price_source, symbols):
+        self.transactions = iter(transactions)
+        self.pending = next(self.transactions, None)
+        self.price_source = price_source
+        self.symbols = symbols
+        self.pf = Portfolio(PrefetchedQuotes({}))
+        self.prices = {}
+        self.positions = {}
+        self.holding = [Precision.DECIMAL_ZERO] * len(self.HOLDING_FIELDS)
+        self.realized_stg = self.realized_ltg = Precision.DECIMAL_ZERO
+
+    def take_until(self, date, changed):
+        """
+        generator of the transactions up to the date, the stocks of the buys and the sells are added to changed
+        """
+        while self.pending is not None and self.pending.date <= date:
+            transaction = self.pending
+            self.pending = next(self.transactions, None)
+            if transaction.symbol[0] != '#' and transaction.trade in (self.BUY, self.SEL):
+                changed.add(transaction.symbol)
+            yield transaction
+
+    def replay(self, date):
+        """
+        add the transactions up to the date, realizing the sells as the streaming mode does(Portfolio.realize_stream)
+        Returns the stocks whose lots changed
+        """
+        changed = set()
+        for stock_obj, cg_obj in self.pf.realize_stream(self.take_until(date, changed)):
+            cg_obj.calculate()
+            self.realized_stg += cg_obj.short_gain
+            self.realized_ltg += cg_obj.long_gain
+        return changed
+
+    def update_holding(self, old_totals, new_totals):
+        if old_totals is not None:
+            self.holding = [x - y for x, y in zip(self.holding, old_totals)]
+        if new_totals is not None:
+            self.holding = [x + y for x, y in zip(self.holding, new_totals)]
+
+    def value_day(self, date):
+        changed = self.replay(date)
+        for symbol, position in self.positions.items():
+            if position.aging_date is not None and position.aging_date <= date:
+                changed.add(symbol)
+        day_prices = self.price_source.get_prices(date, self.symbols)
+        for symbol in changed:
+            old_position = self.positions.pop(symbol, None)
+            old_totals = old_position.totals if old_position else None
+            stock_obj = self.pf.stock_hash[symbol]
+            if stock_obj.dbuyq.is_empty():
+                self.update_holding(old_totals, None)
+                continue
+            position = self.positions[symbol] = StockPosition(stock_obj, date)
+            position.totals = old_totals     # revalued below
+        for symbol, position in self.positions.items():
+            price = day_prices.get(symbol, self.prices.get(symbol))
+            if price is None:
+                continue
+            if symbol in changed or price != self.prices.get(symbol):
+                totals = position.value(price)
+                self.update_holding(position.totals, totals)
+                position.totals = totals
+        self.prices.update(day_prices)
+        unpriced = sum(1 for position in self.positions.values() if position.totals is None)
+        unrealized_stg, unrealized_ltg = self.holding[4:6]
+        return [date] + list(self.holding) + [
+            unrealized_stg + unrealized_ltg, self.realized_stg, self.realized_ltg,
+            self.realized_stg + self.realized_ltg, unpriced
+        ]
+
+    def rows(self, start=None, end=None):
+        """
+        generator of one row per trading day from start(the first transaction by default) to end
+        """
+        if start is None and self.pending is not None:
+            start = self.pending.date
+        for date in self.price_source.trading_days(start, end):
+            yield self.value_day(date)
+
+
+def read_transactions(file_name):
+    with csv23.open_reader(file_name) as transactions_file:
+        next(transactions_file)     # skip the header
+        for transaction in map(TransactionRecord.create_obj_from_row, transactions_file):
+            yield transaction
+
+
+def get_symbols(file_name):
+    """
+    symbols of the buys that add to the delivery lots of a ledger, the only ones read from the end of
+    day files. As in Stock.has_holdings that is every buy but a square off one(e.g. a cash mode buy)
+    """
+    return set(
+        transaction.symbol for transaction in read_transactions(file_name)
+        if transaction.trade == Stock.BUY and transaction.mode != Stock.SQR
+    )
+
+
+def parse_date(date_str):
+    return datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='portfolio valuation on every trading day of a date range')
+    parser.add_argument('file_name', help='transactions CSV file in chronological order')
+    parser.add_argument('--eod-dir', default='lib',
+                        help='directory of the end of day files NSE_YYYYMMDD.csv, BSE_YYYYMMDD.csv (default: %(default)s)')
+    parser.add_argument('--eod-store', metavar='FILE', help='end of day price store(eod_store.py) instead of --eod-dir')
+    parser.add_argument('--start', type=parse_date, help='first date YYYY-MM-DD (default: date of the first transaction)')
+    parser.add_argument('--end', type=parse_date, help='last date YYYY-MM-DD (default: the last trading day)')
+    parser.add_argument('--output', metavar='FILE', help='write the series to FILE instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    price_source = EodPriceStore(args.eod_store) if args.eod_store else EodPriceFiles(args.eod_dir)
+    series = ValuationSeries(read_transactions(args.file_name), price_source, get_symbols(args.file_name))
+    fp = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        writer = csv.writer(fp, lineterminator='\n')
+        writer.writerow(ValuationSeries.FIELDS)
+        for row in series.rows(args.start, args.end):
+            writer.writerow(row)
+    finally:
+        if args.output:
+            fp.close()
+
+
+if '__main__' == __name__:
+    main()